@@ -1,21 +1,51 @@
 """
-Create stratified samples at configurable percentages of the full dataset.
+Create nested samples of the full dataset at configurable percentages.
+
+Rows are kept by a deterministic hash of a key — the claim row itself, or its
+billing provider with ``--by provider`` — so the same rows are picked on every run
+and every smaller sample is contained in the larger ones (1% ⊂ 10% ⊂ 50%). The CSV
+is parsed once for all requested percentages (or not at all, with ``--source``
+pointing at its ingested Parquet copy), and samples are written as Parquet.
+
+``--by stratified`` samples within strata of HCPCS code × billing-provider size
+decile instead. Every code gets at least ``--min-per-code`` rows (and, with
+``--precision``, enough rows to estimate its mean payment to that relative error),
+so rare codes survive small samples. Rows carry ``SAMPLE_WEIGHT``, the number of
+full-dataset rows each represents, for reweighting sums.
 
 Usage:
     uv run create_sample.py                    # Default 1% sample
     uv run create_sample.py --pct 1 10         # Create 1% and 10% samples
     uv run create_sample.py --pct 0.1 1 10     # Create 0.1%, 1%, and 10%
+    uv run create_sample.py --by provider      # Keep all rows of the sampled billing providers
+    uv run create_sample.py --format csv       # Write CSV instead of Parquet (row samples only)
+    uv run create_sample.py --by stratified --pct 0.1 --precision 0.1
 """
 
 import argparse
-import duckdb
 import logging
+import os
 import time
 from pathlib import Path
 
+from utils.db import connect
+from utils.estimates import Z_95
+from utils.ingest import fact_relation
+from utils.keys import KEY_COLUMNS
+from utils.schema import read_csv_sql, MONTH_FORMAT, WEIGHT_COLUMN
+
 DATA_DIR = Path(__file__).resolve().parent.parent / "data"
 FULL_CSV = DATA_DIR / "medicaid-provider-spending.csv"
 
+# Columns whose hash decides whether a row is sampled
+KEYS = {
+    "row": ["BILLING_PROVIDER_NPI_NUM", "SERVICING_PROVIDER_NPI_NUM", "HCPCS_CODE", "CLAIM_FROM_MONTH"],
+    "provider": ["BILLING_PROVIDER_NPI_NUM"],
+}
+BUCKETS = 1_000_000   # hash buckets; percentages are resolved to 1/BUCKETS
+SIZE_DECILES = 10     # billing providers split by total paid, for stratification
+MIN_PER_CODE = 30     # rows per HCPCS code in stratified samples (s37 needs n >= 30)
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s  %(levelname)-8s  %(message)s",
@@ -24,44 +54,232 @@ logging.basicConfig(
 log = logging.getLogger("sampler")
 
 
-def create_sample(con, full_csv: Path, pct: float, output_path: Path):
-    """Create a Bernoulli sample at the given percentage."""
-    log.info("Creating %.1f%% sample → %s", pct, output_path.name)
+def sample_path(pct: float, fmt: str = "parquet", data_dir=None, stratified: bool = False) -> Path:
+    """File a ``pct``% sample is written to (``sample.parquet`` for 1%)."""
+    if pct == 1.0:
+        name = "sample"
+    else:
+        label = f"{pct:.1f}".replace(".", "_") if pct != int(pct) else str(int(pct))
+        name = f"sample_{label}pct"
+    if stratified:
+        name += "_stratified"
+    return Path(data_dir or DATA_DIR) / f"{name}.{fmt}"
+
+
+def hash_sql(by: str = "row", seed: int = 0) -> str:
+    """SQL expression hashing each row's ``by`` key to a UBIGINT.
+
+    MD5 keeps the hash stable across DuckDB versions; a different ``seed`` draws an
+    independent family of samples.
+    """
+    key = " || '|' || ".join(f"CAST({c} AS VARCHAR)" for c in KEYS[by])
+    return f"md5_number_lower('{seed}|' || {key})"
+
+
+def bucket_sql(by: str = "row", seed: int = 0) -> str:
+    """SQL expression assigning each row a hash bucket in ``[0, BUCKETS)`` from its ``by`` key."""
+    return f"{hash_sql(by, seed)} % {BUCKETS}"
+
+
+def source_sql(path: Path) -> str:
+    """Relation reading the claims at ``path``: a CSV, or a dataset already ingested by ``utils.ingest``."""
+    if Path(path).is_dir():
+        return f"(SELECT * EXCLUDE (year, month, {', '.join(KEY_COLUMNS)}) FROM {fact_relation(path)})"
+    return read_csv_sql(path)
+
+
+def threshold(pct: float) -> int:
+    """Rows in buckets below this number make up the ``pct``% sample."""
+    return round(pct / 100 * BUCKETS)
+
+
+def create_samples(con, full_csv: Path, pcts, by: str = "row", seed: int = 0,
+                   fmt: str = "parquet", data_dir=None) -> dict:
+    """Write nested ``pcts``% samples of ``full_csv`` in one pass; returns row counts by percentage."""
+    pcts = sorted(set(pcts))
+    data_dir = Path(data_dir or DATA_DIR)
+    staged = data_dir / f"sample-{by}-{seed}.staged.parquet"
+    log.info("Hashing %s by %s (seed %d) for %s%% samples",
+             full_csv.name, by, seed, ", ".join(f"{p:g}" for p in pcts))
+    t0 = time.time()
+    counts = {}
+    try:
+        # Read the source once, keeping the rows of the largest sample with their bucket
+        con.execute(f"""
+            COPY (
+                SELECT * FROM (SELECT *, {bucket_sql(by, seed)} AS _bucket FROM {source_sql(full_csv)})
+                WHERE _bucket < {threshold(pcts[-1])}
+            ) TO '{staged}' (FORMAT PARQUET)
+        """)
+        log.info("  ✓ Read once in %.1fs", time.time() - t0)
+        for pct in pcts:
+            output = sample_path(pct, fmt, data_dir)
+            tmp = output.with_name(output.name + ".partial")
+            if fmt == "csv":
+                columns = f"* EXCLUDE (_bucket) REPLACE (strftime(CLAIM_FROM_MONTH, '{MONTH_FORMAT}') AS CLAIM_FROM_MONTH)"
+                options = "HEADER, DELIMITER ','"
+            else:
+                columns = "* EXCLUDE (_bucket)"
+                options = (f"FORMAT PARQUET, COMPRESSION ZSTD, KV_METADATA {{sample_pct: '{pct:g}', "
+                           f"sample_by: '{by}', sample_seed: '{seed}'}}")
+            t1 = time.time()
+            con.execute(f"""
+                COPY (
+                    SELECT {columns} FROM read_parquet('{staged}')
+                    WHERE _bucket < {threshold(pct)}
+                ) TO '{tmp}' ({options})
+            """)
+            os.replace(tmp, output)
+            counts[pct] = con.execute(
+                f"SELECT COUNT(*) FROM read_parquet('{staged}') WHERE _bucket < {threshold(pct)}").fetchone()[0]
+            size_mb = output.stat().st_size / (1024 * 1024)
+            log.info("  ✓ %g%% → %s: %s rows, %.0f MB, %.1fs",
+                     pct, output.name, f"{counts[pct]:,}", size_mb, time.time() - t1)
+    finally:
+        staged.unlink(missing_ok=True)
+    return counts
+
+
+def code_allocation_sql(pct: float, min_per_code: int = MIN_PER_CODE, precision: float = None) -> str:
+    """SQL expression for the rows to sample from a code, over ``_codes`` (rows, mean_paid, sd_paid).
+
+    The larger of ``pct``% of the code, ``min_per_code`` rows and, with ``precision``,
+    the rows needed to estimate the code's mean payment within that relative error
+    at 95% confidence (n₀ = (z·CV/e)², finite-population corrected), capped at the code's rows.
+
+    The precision target is for the code as a whole: the rows are then spread over
+    its size deciles in proportion, so a single decile's mean is estimated with
+    roughly √10 times the error.
+    """
+    needed = [f"CEIL({pct / 100} * rows)", str(min_per_code)]
+    if precision:
+        n0 = f"POW({Z_95} * COALESCE(sd_paid / NULLIF(mean_paid, 0), 0) / {precision}, 2)"
+        needed.append(f"CEIL({n0} / (1 + {n0} / rows))")
+    return f"LEAST(rows, GREATEST({', '.join(needed)}))"
+
+
+def create_stratified_samples(con, full_csv: Path, pcts, seed: int = 0, min_per_code: int = MIN_PER_CODE,
+                              precision: float = None, data_dir=None) -> dict:
+    """Write nested stratified ``pcts``% samples with ``SAMPLE_WEIGHT``; returns row counts by percentage.
+
+    Strata are HCPCS code × billing-provider size decile. A code's rows
+    (``code_allocation_sql``) are spread over its strata in proportion to their size,
+    and each stratum keeps its rows with the lowest hashes, so a larger percentage
+    keeps a superset. ``SAMPLE_WEIGHT`` = stratum rows / sampled stratum rows.
+    """
+    pcts = sorted(set(pcts))
+    data_dir = Path(data_dir or DATA_DIR)
+    staged = data_dir / f"sample-stratified-{seed}.staged.parquet"
+    log.info("Stratifying %s by HCPCS code × provider size decile (seed %d) for %s%% samples",
+             full_csv.name, seed, ", ".join(f"{p:g}" for p in pcts))
     t0 = time.time()
-    con.execute(f"""
-        COPY (
-            SELECT * FROM '{full_csv}'
-            USING SAMPLE {pct} PERCENT (bernoulli)
-        ) TO '{output_path}' (HEADER, DELIMITER ',');
-    """)
-    count = con.execute(f"SELECT COUNT(*) FROM '{output_path}'").fetchone()[0]
-    elapsed = time.time() - t0
-    size_mb = output_path.stat().st_size / (1024 * 1024)
-    log.info("  ✓ %s rows, %.0f MB, %.1fs", f"{count:,}", size_mb, elapsed)
-    return count
+    counts = {}
+    try:
+        con.execute(f"COPY (SELECT * FROM {source_sql(full_csv)}) TO '{staged}' (FORMAT PARQUET)")
+        src = f"read_parquet('{staged}')"
+        log.info("  ✓ Read once in %.1fs", time.time() - t0)
+        con.execute(f"""
+            CREATE OR REPLACE TEMP TABLE _sizes AS
+            SELECT BILLING_PROVIDER_NPI_NUM,
+                   NTILE({SIZE_DECILES}) OVER (ORDER BY SUM(TOTAL_PAID), BILLING_PROVIDER_NPI_NUM) AS size_decile
+            FROM {src} GROUP BY BILLING_PROVIDER_NPI_NUM
+        """)
+        con.execute(f"""
+            CREATE OR REPLACE TEMP TABLE _ranked AS
+            SELECT c.*, z.size_decile,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY c.HCPCS_CODE, z.size_decile
+                       ORDER BY {hash_sql("row", seed)}, {", ".join(f"c.{k}" for k in KEYS["row"])}
+                   ) AS _rank
+            FROM {src} c JOIN _sizes z USING (BILLING_PROVIDER_NPI_NUM)
+        """)
+        con.execute("""
+            CREATE OR REPLACE TEMP TABLE _strata AS
+            SELECT HCPCS_CODE, size_decile, COUNT(*) AS rows FROM _ranked GROUP BY ALL
+        """)
+        con.execute("""
+            CREATE OR REPLACE TEMP TABLE _codes AS
+            SELECT HCPCS_CODE, COUNT(*) AS rows, AVG(TOTAL_PAID) AS mean_paid, STDDEV(TOTAL_PAID) AS sd_paid
+            FROM _ranked GROUP BY HCPCS_CODE
+        """)
+        n_codes, n_rows = con.execute("SELECT COUNT(*), SUM(rows) FROM _codes").fetchone()
+        for pct in pcts:
+            output = sample_path(pct, data_dir=data_dir, stratified=True)
+            tmp = output.with_name(output.name + ".partial")
+            t1 = time.time()
+            con.execute(f"""
+                CREATE OR REPLACE TEMP TABLE _alloc AS
+                SELECT s.HCPCS_CODE, s.size_decile, s.rows, c.rows AS code_rows,
+                       LEAST(s.rows, CEIL(c.take * s.rows / c.rows)) AS take
+                FROM _strata s
+                JOIN (SELECT *, {code_allocation_sql(pct, min_per_code, precision)} AS take FROM _codes) c
+                  USING (HCPCS_CODE)
+            """)
+            meta = (f"sample_pct: '{pct:g}', sample_by: 'stratified', sample_seed: '{seed}', "
+                    f"sample_min_per_code: '{min_per_code}', sample_precision: '{precision or ''}'")
+            con.execute(f"""
+                COPY (
+                    SELECT r.* EXCLUDE (size_decile, _rank), a.rows / a.take AS {WEIGHT_COLUMN}
+                    FROM _ranked r JOIN _alloc a USING (HCPCS_CODE, size_decile)
+                    WHERE r._rank <= a.take
+                ) TO '{tmp}' (FORMAT PARQUET, COMPRESSION ZSTD, KV_METADATA {{{meta}}})
+            """)
+            os.replace(tmp, output)
+            counts[pct], covered = con.execute(f"""
+                SELECT SUM(take)::BIGINT,
+                       COUNT(DISTINCT HCPCS_CODE) FILTER (WHERE code_take >= LEAST({min_per_code}, code_rows))
+                FROM (SELECT *, SUM(take) OVER (PARTITION BY HCPCS_CODE) AS code_take FROM _alloc)
+            """).fetchone()
+            # A plain pct% sample would expect this many codes to reach min_per_code rows
+            bernoulli = con.execute(f"SELECT COUNT(*) FROM _codes WHERE rows * {pct / 100} >= {min_per_code}").fetchone()[0]
+            size_mb = output.stat().st_size / (1024 * 1024)
+            log.info("  ✓ %g%% → %s: %s rows (%.2f%%), %.0f MB, %.1fs", pct, output.name,
+                     f"{counts[pct]:,}", 100 * counts[pct] / max(n_rows, 1), size_mb, time.time() - t1)
+            log.info("    %d/%d codes have ≥ %d rows (%d in an unstratified %g%% sample)",
+                     covered, n_codes, min_per_code, bernoulli, pct)
+        for table in ("_sizes", "_ranked", "_strata", "_codes", "_alloc"):
+            con.execute(f"DROP TABLE IF EXISTS {table}")
+    finally:
+        staged.unlink(missing_ok=True)
+    return counts
 
 
 def main():
     parser = argparse.ArgumentParser(description="Create data samples at specified percentages")
     parser.add_argument("--pct", nargs="+", type=float, default=[1.0],
                         help="Sample percentages to create (default: 1)")
+    parser.add_argument("--by", choices=sorted(KEYS) + ["stratified"], default="row",
+                        help="Sample individual rows, whole billing providers, or within "
+                             "HCPCS code × provider size strata (default: row)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Hash seed; samples with the same seed are nested (default: 0)")
+    parser.add_argument("--format", choices=["parquet", "csv"], default="parquet",
+                        help="Output format (default: parquet)")
+    parser.add_argument("--source", type=Path, default=FULL_CSV,
+                        help="Full CSV, or its ingested Parquet dataset under data/cache to skip "
+                             "re-parsing it (default: data/medicaid-provider-spending.csv)")
+    parser.add_argument("--min-per-code", type=int, default=MIN_PER_CODE, metavar="N",
+                        help=f"Stratified: rows to keep per HCPCS code (default: {MIN_PER_CODE})")
+    parser.add_argument("--precision", type=float, default=None, metavar="REL",
+                        help="Stratified: also keep enough rows per code to estimate its mean "
+                             "payment within this relative error at 95%% confidence (e.g. 0.1)")
     args = parser.parse_args()
+    if args.by == "stratified" and args.format != "parquet":
+        parser.error("stratified samples carry SAMPLE_WEIGHT and are written as Parquet")
+    if args.by == "provider" and args.format != "parquet":
+        parser.error("provider samples record their design in Parquet metadata; a CSV copy would "
+                     "be analysed as a row sample (main.py --sample-pct assumes one)")
 
-    if not FULL_CSV.exists():
-        log.error("Full dataset not found: %s", FULL_CSV)
+    if not args.source.exists():
+        log.error("Full dataset not found: %s", args.source)
         return
 
     DATA_DIR.mkdir(parents=True, exist_ok=True)
-    con = duckdb.connect()
-
-    for pct in args.pct:
-        if pct == 1.0:
-            output = DATA_DIR / "sample.csv"
-        else:
-            label = f"{pct:.1f}".replace(".", "_") if pct != int(pct) else str(int(pct))
-            output = DATA_DIR / f"sample_{label}pct.csv"
-        create_sample(con, FULL_CSV, pct, output)
-
+    con = connect()
+    if args.by == "stratified":
+        create_stratified_samples(con, args.source, args.pct, args.seed, args.min_per_code, args.precision)
+    else:
+        create_samples(con, args.source, args.pct, args.by, args.seed, args.format)
     con.close()
     log.info("Done.")
 
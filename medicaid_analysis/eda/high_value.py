@@ -1,7 +1,6 @@
 """EDA — High-Value Claims (Section 12)."""
 
-import matplotlib.pyplot as plt
-from utils import log, banner, query, savefig, OUTPUT_DIR
+from utils import log, banner, query, savefig, subplots, OUTPUT_DIR
 
 
 def s12_high_value_claims(con, csv: str):
@@ -12,7 +11,7 @@ def s12_high_value_claims(con, csv: str):
         SELECT *,
             TOTAL_PAID / NULLIF(TOTAL_CLAIMS, 0) AS cost_per_claim,
             TOTAL_PAID / NULLIF(TOTAL_UNIQUE_BENEFICIARIES, 0) AS cost_per_bene
-        FROM '{csv}'
+        FROM {csv}
         ORDER BY TOTAL_PAID DESC
         LIMIT 100
     """)
@@ -23,11 +22,10 @@ def s12_high_value_claims(con, csv: str):
              f"{top_records.iloc[0]['TOTAL_PAID']:,.2f}",
              f"{top_records.iloc[0]['TOTAL_CLAIMS']:,}")
 
-    fig, ax = plt.subplots(figsize=(12, 6))
+    fig, ax = subplots(figsize=(12, 6))
     counts = top_records["HCPCS_CODE"].value_counts().head(15)
     ax.barh(counts.index[::-1], counts.values[::-1], color="#9334e6", edgecolor="white")
     ax.set_title("HCPCS Codes in Top 100 Highest-Paid Records", fontsize=14, fontweight="bold")
     ax.set_xlabel("Count in Top 100")
-    fig.tight_layout()
-    savefig(fig, "12_high_value_hcpcs.png")
+    savefig(fig, "12_high_value_hcpcs.png", tight_layout=True)
     return top_records
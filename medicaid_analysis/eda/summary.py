@@ -3,7 +3,17 @@
 import time
 import json
 import pandas as pd
-from utils import log, banner, query, OUTPUT_DIR
+from utils import (
+    log, banner, query, sample_design, estimate_totals, estimate_distinct, estimate_quantiles,
+    approx_mode, quantile_sketch, sketch_quantiles, PAID_SKETCH, RELATIVE_ERROR, approx_distinct,
+    distinct_sketch, hll_count, Z_95, MONTH_FORMAT, OUTPUT_DIR,
+)
+
+TOTALS = {"row_count": "1", "total_paid": "TOTAL_PAID", "total_claims": "TOTAL_CLAIMS",
+          "total_bene": "TOTAL_UNIQUE_BENEFICIARIES"}
+DISTINCT = {"billing_npis": "BILLING_PROVIDER_NPI_NUM", "servicing_npis": "SERVICING_PROVIDER_NPI_NUM",
+            "hcpcs_codes": "HCPCS_CODE"}
+PERCENTILES = {"p25_paid": 0.25, "median_paid": 0.5, "p75_paid": 0.75, "p95_paid": 0.95, "p99_paid": 0.99}
 
 
 def s01_eda(con, csv: str) -> dict:
@@ -11,41 +21,55 @@ def s01_eda(con, csv: str) -> dict:
     banner(1, "Exploratory Data Analysis")
     t0 = time.time()
 
-    row_count = con.execute(f"SELECT COUNT(*) FROM '{csv}'").fetchone()[0]
+    row_count = con.execute(f"SELECT COUNT(*) FROM {csv}").fetchone()[0]
     log.info("Rows: %s (%.1fs scan)", f"{row_count:,}", time.time() - t0)
 
     date_range = con.execute(
-        f"SELECT MIN(CLAIM_FROM_MONTH) AS mn, MAX(CLAIM_FROM_MONTH) AS mx FROM '{csv}'"
+        f"SELECT MIN(CLAIM_FROM_MONTH) AS mn, MAX(CLAIM_FROM_MONTH) AS mx FROM {csv}"
     ).fetchone()
+    date_range = [d.strftime(MONTH_FORMAT) for d in date_range]
     log.info("Date range: %s → %s", date_range[0], date_range[1])
 
-    uniques = query(con, f"""
-        SELECT
-            COUNT(DISTINCT BILLING_PROVIDER_NPI_NUM)   AS billing_npis,
-            COUNT(DISTINCT SERVICING_PROVIDER_NPI_NUM) AS servicing_npis,
-            COUNT(DISTINCT HCPCS_CODE)                 AS hcpcs_codes
-        FROM '{csv}'
-    """)
+    if approx_distinct(con):
+        est = hll_count(con, distinct_sketch(con, csv), ["column_name"]).set_index("column_name")["n_distinct"]
+        uniques = pd.DataFrame([{name: est.get(column, 0) for name, column in DISTINCT.items()}])
+    else:
+        uniques = query(con, f"""
+            SELECT
+                COUNT(DISTINCT BILLING_PROVIDER_NPI_NUM)   AS billing_npis,
+                COUNT(DISTINCT SERVICING_PROVIDER_NPI_NUM) AS servicing_npis,
+                COUNT(DISTINCT HCPCS_CODE)                 AS hcpcs_codes
+            FROM {csv}
+        """)
     for col in uniques.columns:
         log.info("  %s: %s", col, f"{uniques.iloc[0][col]:,}")
 
+    # Percentiles sort every row; approximate mode reads them from the paid sketch
+    approx = approx_mode(con)
+    pct = {name: "NULL::DOUBLE" if approx else f"PERCENTILE_CONT({p}) WITHIN GROUP (ORDER BY TOTAL_PAID)"
+           for name, p in PERCENTILES.items()}
     nums = query(con, f"""
         SELECT
             SUM(TOTAL_PAID)                            AS total_paid,
             AVG(TOTAL_PAID)                            AS avg_paid,
-            MEDIAN(TOTAL_PAID)                         AS median_paid,
+            {pct['median_paid']} AS median_paid,
             MAX(TOTAL_PAID)                            AS max_paid,
             MIN(TOTAL_PAID)                            AS min_paid,
             STDDEV(TOTAL_PAID)                         AS std_paid,
             SUM(TOTAL_CLAIMS)                          AS total_claims,
             AVG(TOTAL_CLAIMS)                          AS avg_claims,
             SUM(TOTAL_UNIQUE_BENEFICIARIES)            AS total_bene,
-            PERCENTILE_CONT(0.25) WITHIN GROUP (ORDER BY TOTAL_PAID) AS p25_paid,
-            PERCENTILE_CONT(0.75) WITHIN GROUP (ORDER BY TOTAL_PAID) AS p75_paid,
-            PERCENTILE_CONT(0.95) WITHIN GROUP (ORDER BY TOTAL_PAID) AS p95_paid,
-            PERCENTILE_CONT(0.99) WITHIN GROUP (ORDER BY TOTAL_PAID) AS p99_paid
-        FROM '{csv}'
+            {pct['p25_paid']} AS p25_paid,
+            {pct['p75_paid']} AS p75_paid,
+            {pct['p95_paid']} AS p95_paid,
+            {pct['p99_paid']} AS p99_paid
+        FROM {csv}
     """)
+    if approx:
+        sketched = sketch_quantiles(con, quantile_sketch(con, csv, PAID_SKETCH), PERCENTILES)
+        for name in PERCENTILES:
+            nums[name] = float(sketched.iloc[0][name])
+        log.info("  Percentiles from a quantile sketch (within %g%% of the data value)", RELATIVE_ERROR * 100)
     log.info("  Total paid:  $%s", f"{nums.iloc[0]['total_paid']:,.2f}")
     log.info("  Mean paid:   $%s", f"{nums.iloc[0]['avg_paid']:,.2f}")
     log.info("  Median paid: $%s", f"{nums.iloc[0]['median_paid']:,.2f}")
@@ -62,8 +86,43 @@ def s01_eda(con, csv: str) -> dict:
         **{k: int(v) for k, v in uniques.iloc[0].items()},
     }
     nums.to_csv(OUTPUT_DIR / "01_numeric_summary.csv", index=False)
+    report = summary
+    design = sample_design(con)
+    if design is not None:
+        estimates = population_estimates(con, csv, design, summary)
+        estimates.to_csv(OUTPUT_DIR / "01_population_estimates.csv", index=False)
+        report = {**summary, "sample": design._asdict(), "population_estimates": {
+            row.metric: {"estimate": row.estimate, "ci_low": row.ci_low, "ci_high": row.ci_high}
+            for row in estimates.itertuples()
+        }}
     with open(OUTPUT_DIR / "01_eda_summary.json", "w") as f:
-        json.dump(summary, f, indent=2)
+        json.dump(report, f, indent=2)
     pd.DataFrame([summary]).T.to_csv(OUTPUT_DIR / "01_summary_statistics.csv")
     return summary
 
+
+def population_estimates(con, csv: str, design, summary: dict) -> pd.DataFrame:
+    """Full-dataset estimates of the summary's totals, distinct counts, mean and percentiles."""
+    log.info("  Population estimates from a %s sample (95%% CI):", design.describe())
+    totals = estimate_totals(con, csv, design, TOTALS).iloc[0]
+    rows = [(name, summary[name], totals[name], totals[f"{name}_low"], totals[f"{name}_high"],
+             "Horvitz-Thompson") for name in TOTALS]
+
+    # Mean paid as the ratio of two totals, with a linearized interval
+    mean = float(totals["total_paid"] / totals["row_count"])
+    spread = estimate_totals(con, csv, design, {"resid": f"TOTAL_PAID - {mean!r}"}).iloc[0]
+    half = Z_95 * spread["resid_se"] / totals["row_count"]
+    rows.append(("avg_paid", summary["avg_paid"], mean, mean - half, mean + half, "ratio"))
+
+    for name, column in DISTINCT.items():
+        d = estimate_distinct(con, csv, design, column).iloc[0]
+        rows.append((name, summary[name], d["estimate"], d["low"], d["high"], d["method"]))
+    quantiles = estimate_quantiles(con, csv, design, "TOTAL_PAID", list(PERCENTILES.values()))
+    for name, q in zip(PERCENTILES, quantiles.itertuples()):
+        rows.append((name, summary[name], q.estimate, q.low, q.high, "Woodruff"))
+
+    estimates = pd.DataFrame(rows, columns=["metric", "sample_value", "estimate", "ci_low", "ci_high", "method"])
+    for row in estimates.itertuples():
+        log.info("    %-15s %s  [%s – %s]", row.metric, f"{row.estimate:,.0f}",
+                 f"{row.ci_low:,.0f}", f"{row.ci_high:,.0f}")
+    return estimates
@@ -1,8 +1,10 @@
 """EDA — Top Procedures & Top Providers (Sections 3 & 4)."""
 
-import matplotlib.pyplot as plt
 import matplotlib.ticker as mticker
-from utils import log, banner, query, savefig, usd, num_fmt, OUTPUT_DIR
+from utils import (
+    log, banner, query, provider_summary, uses, PROVIDER_SUMMARY, distinct_sql, savefig, subplots, usd,
+    num_fmt, OUTPUT_DIR,
+)
 
 
 def s03_top_procedures(con, csv: str):
@@ -15,9 +17,9 @@ def s03_top_procedures(con, csv: str):
             SUM(TOTAL_PAID)                         AS total_paid,
             SUM(TOTAL_CLAIMS)                       AS total_claims,
             SUM(TOTAL_UNIQUE_BENEFICIARIES)         AS total_bene,
-            COUNT(DISTINCT BILLING_PROVIDER_NPI_NUM) AS provider_count,
+            {distinct_sql(con, "BILLING_PROVIDER_NPI_NUM")} AS provider_count,
             AVG(TOTAL_PAID / NULLIF(TOTAL_CLAIMS, 0)) AS avg_cost_per_claim
-        FROM '{csv}'
+        FROM {csv}
         WHERE TOTAL_CLAIMS > 0
         GROUP BY HCPCS_CODE
         ORDER BY total_paid DESC
@@ -26,7 +28,7 @@ def s03_top_procedures(con, csv: str):
     top.to_csv(OUTPUT_DIR / "03_top_procedures.csv", index=False)
     log.info("  #1 procedure: %s  ($%s)", top.iloc[0]["HCPCS_CODE"], f"{top.iloc[0]['total_paid']:,.0f}")
 
-    fig, axes = plt.subplots(1, 2, figsize=(18, 9))
+    fig, axes = subplots(1, 2, figsize=(18, 9))
     ax = axes[0]
     d = top.head(20).iloc[::-1]
     ax.barh(d["HCPCS_CODE"], d["total_paid"], color="#1a73e8", edgecolor="white")
@@ -39,11 +41,11 @@ def s03_top_procedures(con, csv: str):
     ax.set_title("Top 20 Procedures by Claim Volume", fontsize=14, fontweight="bold")
     ax.set_xlabel("Total Claims"); ax.xaxis.set_major_formatter(mticker.FuncFormatter(num_fmt))
 
-    fig.tight_layout()
-    savefig(fig, "03_top_procedures.png")
+    savefig(fig, "03_top_procedures.png", tight_layout=True)
     return top
 
 
+@uses(PROVIDER_SUMMARY)
 def s04_top_providers(con, csv: str):
     """Top billing providers ranked by spending and claim volume."""
     banner(4, "Top Billing Providers")
@@ -51,14 +53,13 @@ def s04_top_providers(con, csv: str):
     top = query(con, f"""
         SELECT
             BILLING_PROVIDER_NPI_NUM,
-            SUM(TOTAL_PAID)                         AS total_paid,
-            SUM(TOTAL_CLAIMS)                       AS total_claims,
-            SUM(TOTAL_UNIQUE_BENEFICIARIES)         AS total_bene,
-            COUNT(DISTINCT HCPCS_CODE)              AS procedure_count,
-            MIN(CLAIM_FROM_MONTH)                   AS first_month,
-            MAX(CLAIM_FROM_MONTH)                   AS last_month
-        FROM '{csv}'
-        GROUP BY BILLING_PROVIDER_NPI_NUM
+            total_paid,
+            total_claims,
+            total_bene,
+            n_codes                                 AS procedure_count,
+            first_month,
+            last_month
+        FROM {provider_summary(con, csv)}
         ORDER BY total_paid DESC
         LIMIT 100
     """)
@@ -66,13 +67,12 @@ def s04_top_providers(con, csv: str):
     log.info("  #1 provider: NPI %s  ($%s)", top.iloc[0]["BILLING_PROVIDER_NPI_NUM"],
              f"{top.iloc[0]['total_paid']:,.0f}")
 
-    fig, ax = plt.subplots(figsize=(12, 10))
+    fig, ax = subplots(figsize=(12, 10))
     d = top.head(25).iloc[::-1]
     d["label"] = d["BILLING_PROVIDER_NPI_NUM"].astype(str)
     ax.barh(d["label"], d["total_paid"], color="#9334e6", edgecolor="white")
     ax.set_title("Top 25 Billing Providers by Total Paid", fontsize=14, fontweight="bold")
     ax.set_xlabel("Total Paid (USD)"); usd(ax, axis="x")
     ax.set_ylabel("Billing Provider NPI")
-    fig.tight_layout()
-    savefig(fig, "04_top_providers.png")
+    savefig(fig, "04_top_providers.png", tight_layout=True)
     return top
@@ -1,13 +1,15 @@
 """EDA — Monthly & Yearly Spending Trends (Section 2)."""
 
-import pandas as pd
-import matplotlib.pyplot as plt
 import matplotlib.ticker as mticker
 import matplotlib.dates as mdates
-import seaborn as sns
-from utils import log, banner, query, savefig, usd, usd_fmt, num_fmt, OUTPUT_DIR
+from utils import (
+    log, banner, query, monthly_summary, uses, MONTHLY_SUMMARY, savefig, subplots, usd,
+    usd_fmt, num_fmt, sample_design, estimate_totals, estimate_distinct, approx_distinct,
+    distinct_sketch, hll_count, OUTPUT_DIR,
+)
 
 
+@uses(MONTHLY_SUMMARY)
 def s02_monthly_trends(con, csv: str):
     """Monthly and yearly spending trend analysis with multiple metrics."""
     banner(2, "Monthly & Yearly Spending Trends")
@@ -15,37 +17,45 @@ def s02_monthly_trends(con, csv: str):
     monthly = query(con, f"""
         SELECT
             CLAIM_FROM_MONTH,
-            SUM(TOTAL_PAID)                              AS total_paid,
-            SUM(TOTAL_CLAIMS)                            AS total_claims,
-            SUM(TOTAL_UNIQUE_BENEFICIARIES)              AS total_bene,
-            COUNT(DISTINCT BILLING_PROVIDER_NPI_NUM)     AS active_providers,
-            COUNT(DISTINCT HCPCS_CODE)                   AS active_codes,
-            AVG(TOTAL_PAID / NULLIF(TOTAL_CLAIMS, 0))    AS avg_cost_per_claim,
-            AVG(TOTAL_PAID / NULLIF(TOTAL_UNIQUE_BENEFICIARIES, 0)) AS avg_cost_per_bene
-        FROM '{csv}'
-        WHERE TOTAL_CLAIMS > 0 AND TOTAL_UNIQUE_BENEFICIARIES > 0
-        GROUP BY CLAIM_FROM_MONTH
+            total_paid_valid   AS total_paid,
+            total_claims_valid AS total_claims,
+            total_bene_valid   AS total_bene,
+            providers_valid    AS active_providers,
+            codes_valid        AS active_codes,
+            avg_cpc_valid      AS avg_cost_per_claim,
+            avg_cpb_valid      AS avg_cost_per_bene
+        FROM {monthly_summary(con, csv)}
+        WHERE total_paid_valid IS NOT NULL
         ORDER BY CLAIM_FROM_MONTH
     """)
-    monthly["CLAIM_FROM_MONTH"] = pd.to_datetime(monthly["CLAIM_FROM_MONTH"])
     monthly.to_csv(OUTPUT_DIR / "02_monthly_trends.csv", index=False)
     log.info("  Months in data: %d", len(monthly))
 
+    approx = approx_distinct(con)
     yearly = query(con, f"""
         SELECT
-            EXTRACT(YEAR FROM CAST(CLAIM_FROM_MONTH || '-01' AS DATE)) AS year,
+            EXTRACT(YEAR FROM CLAIM_FROM_MONTH) AS year,
             SUM(TOTAL_PAID)    AS total_paid,
-            SUM(TOTAL_CLAIMS)  AS total_claims,
-            COUNT(DISTINCT BILLING_PROVIDER_NPI_NUM) AS providers,
-            COUNT(DISTINCT HCPCS_CODE) AS codes
-        FROM '{csv}'
+            SUM(TOTAL_CLAIMS)  AS total_claims
+            {"" if approx else ", COUNT(DISTINCT BILLING_PROVIDER_NPI_NUM) AS providers"}
+            {"" if approx else ", COUNT(DISTINCT HCPCS_CODE) AS codes"}
+        FROM {csv}
         GROUP BY year ORDER BY year
     """)
+    if approx:
+        # Yearly counts from the monthly HyperLogLog sketches, without rescanning the claims
+        est = hll_count(con, distinct_sketch(con, csv),
+                        {"year": "EXTRACT(YEAR FROM CLAIM_FROM_MONTH)", "column_name": "column_name"})
+        est = est.pivot(index="year", columns="column_name", values="n_distinct")
+        yearly["providers"] = yearly["year"].map(est["BILLING_PROVIDER_NPI_NUM"]).astype("int64")
+        yearly["codes"] = yearly["year"].map(est["HCPCS_CODE"]).astype("int64")
     yearly.to_csv(OUTPUT_DIR / "02_yearly_summary.csv", index=False)
+    design = sample_design(con)
+    if design is not None:
+        yearly_estimates(con, csv, design).to_csv(OUTPUT_DIR / "02_yearly_estimates.csv", index=False)
 
     # ── Plot: 4-panel monthly dashboard ──
-    sns.set_theme(style="whitegrid", font_scale=1.05)
-    fig, axes = plt.subplots(2, 2, figsize=(18, 12))
+    fig, axes = subplots(2, 2, figsize=(18, 12))
     fig.suptitle("Medicaid Provider Spending — Monthly Dashboard", fontsize=17, fontweight="bold", y=1.01)
 
     ax = axes[0, 0]
@@ -72,11 +82,10 @@ def s02_monthly_trends(con, csv: str):
         a.xaxis.set_major_formatter(mdates.DateFormatter("%Y"))
         a.xaxis.set_major_locator(mdates.YearLocator())
 
-    fig.tight_layout()
-    savefig(fig, "01_monthly_dashboard.png")
+    savefig(fig, "02_monthly_dashboard.png", tight_layout=True)
 
     # ── Plot: yearly bar chart ──
-    fig, ax = plt.subplots(figsize=(10, 6))
+    fig, ax = subplots(figsize=(10, 6))
     bars = ax.bar(yearly["year"].astype(int).astype(str), yearly["total_paid"],
                   color="#1a73e8", edgecolor="white", linewidth=0.8)
     ax.set_title("Medicaid Spending by Year", fontsize=15, fontweight="bold")
@@ -85,7 +94,19 @@ def s02_monthly_trends(con, csv: str):
         h = bar.get_height()
         ax.text(bar.get_x() + bar.get_width()/2, h, usd_fmt(h),
                 ha="center", va="bottom", fontsize=10, fontweight="bold")
-    fig.tight_layout()
-    savefig(fig, "02_yearly_spending.png")
+    savefig(fig, "02_yearly_spending.png", tight_layout=True)
 
     return monthly, yearly
+
+
+def yearly_estimates(con, csv: str, design):
+    """Full-dataset yearly totals and distinct providers / codes with 95% intervals."""
+    year = {"year": "EXTRACT(YEAR FROM CLAIM_FROM_MONTH)"}
+    est = estimate_totals(con, csv, design, {"total_paid": "TOTAL_PAID", "total_claims": "TOTAL_CLAIMS"}, by=year)
+    est = est.drop(columns=["total_paid_se", "total_claims_se"])
+    for name, column in (("providers", "BILLING_PROVIDER_NPI_NUM"), ("codes", "HCPCS_CODE")):
+        distinct = estimate_distinct(con, csv, design, column, by=year)[["year", "estimate", "low", "high"]]
+        est = est.merge(distinct.rename(columns={"estimate": name, "low": f"{name}_low", "high": f"{name}_high"}),
+                        on="year")
+    log.info("  Yearly population estimates from a %s sample", design.describe())
+    return est
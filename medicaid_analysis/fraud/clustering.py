@@ -4,21 +4,26 @@ import numpy as np
 import matplotlib.pyplot as plt
 from sklearn.preprocessing import StandardScaler
 from sklearn.cluster import KMeans
-from utils import log, banner, query, savefig, save_csv, OUTPUT_DIR
+from utils import (
+    log, banner, query, provider_summary, uses, PROVIDER_SUMMARY, savefig, subplots, save_csv,
+    OUTPUT_DIR,
+)
 
 
+@uses(PROVIDER_SUMMARY)
 def s36_provider_clustering(con, csv: str):
     """Cluster providers by behavioral features to identify unusual profiles."""
     banner(36, "Provider Clustering (Unsupervised Profiling)")
 
     profiles = query(con, f"""
         SELECT BILLING_PROVIDER_NPI_NUM,
-               SUM(TOTAL_PAID) AS total_paid, SUM(TOTAL_CLAIMS) AS total_claims,
-               SUM(TOTAL_UNIQUE_BENEFICIARIES) AS total_bene,
-               COUNT(DISTINCT HCPCS_CODE) AS n_codes, COUNT(DISTINCT CLAIM_FROM_MONTH) AS active_months,
-               AVG(TOTAL_PAID / NULLIF(TOTAL_CLAIMS, 0)) AS avg_cpc,
-               COUNT(DISTINCT SERVICING_PROVIDER_NPI_NUM) AS n_servicing
-        FROM '{csv}' WHERE TOTAL_CLAIMS > 0 GROUP BY BILLING_PROVIDER_NPI_NUM HAVING total_paid > 1000
+               total_paid_claimed AS total_paid, total_claims_claimed AS total_claims,
+               total_bene_claimed AS total_bene,
+               n_codes_claimed AS n_codes, active_months_claimed AS active_months,
+               avg_cpc,
+               n_servicing_claimed AS n_servicing
+        FROM {provider_summary(con, csv)} WHERE rows_claimed > 0 AND total_paid_claimed > 1000
+        ORDER BY BILLING_PROVIDER_NPI_NUM
     """)
     features = ["total_paid", "total_claims", "total_bene", "n_codes", "active_months", "avg_cpc", "n_servicing"]
     X = profiles[features].fillna(0)
@@ -38,7 +43,7 @@ def s36_provider_clustering(con, csv: str):
     save_csv(cluster_stats, "36_cluster_stats.csv", "fraud")
     log.info("  Clusters: %s", ", ".join(f"C{c}: {n} providers" for c, n in cluster_sizes.sort_index().items()))
 
-    fig, axes = plt.subplots(1, 3, figsize=(20, 7))
+    fig, axes = subplots(1, 3, figsize=(20, 7))
     fig.suptitle("Provider Clustering — Behavioral Profiles", fontsize=15, fontweight="bold", y=1.02)
     colors = plt.cm.Set1(np.linspace(0, 0.8, n_clusters))
     ax = axes[0]
@@ -56,5 +61,5 @@ def s36_provider_clustering(con, csv: str):
         ax.scatter(np.log10(profiles.loc[mask, "avg_cpc"].clip(lower=0.01)), profiles.loc[mask, "n_codes"],
                    alpha=0.15, s=5, color=colors[c], label=f"C{c}")
     ax.set_title("Clusters: Avg CPC vs # Codes", fontweight="bold"); ax.set_xlabel("log₁₀(Avg Cost/Claim)"); ax.set_ylabel("# HCPCS Codes"); ax.legend(fontsize=7)
-    fig.tight_layout(); savefig(fig, "36_provider_clusters.png", "fraud")
+    savefig(fig, "36_provider_clusters.png", "fraud", tight_layout=True)
     return profiles
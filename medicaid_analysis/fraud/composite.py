@@ -1,19 +1,22 @@
 """Fraud Detection — Composite Fraud Risk Score (Section 40)."""
 
 import pandas as pd
-import matplotlib.pyplot as plt
 import matplotlib.ticker as mticker
-from utils import log, banner, query, savefig, save_csv, usd, usd_fmt, num_fmt, OUTPUT_DIR
+from utils import (
+    log, banner, query, provider_summary, uses, PROVIDER_SUMMARY, savefig, subplots, save_csv,
+    usd, usd_fmt, num_fmt, OUTPUT_DIR,
+)
 
 
+@uses(PROVIDER_SUMMARY)
 def s40_composite_fraud_score(con, csv: str, upcoding_df, velocity_df, phantom_df,
                                cost_outlier_df, relationship_df, temporal_df):
     """Combine all fraud signals into a single composite risk score per provider."""
     banner(40, "Composite Fraud Risk Scoring")
 
     all_providers = query(con, f"""
-        SELECT BILLING_PROVIDER_NPI_NUM, SUM(TOTAL_PAID) AS total_paid, SUM(TOTAL_CLAIMS) AS total_claims
-        FROM '{csv}' GROUP BY BILLING_PROVIDER_NPI_NUM
+        SELECT BILLING_PROVIDER_NPI_NUM, total_paid, total_claims
+        FROM {provider_summary(con, csv)}
     """)
     scores = all_providers[["BILLING_PROVIDER_NPI_NUM", "total_paid", "total_claims"]].copy()
     scores["risk_upcoding"] = scores["BILLING_PROVIDER_NPI_NUM"].isin(
@@ -50,7 +53,7 @@ def s40_composite_fraud_score(con, csv: str, upcoding_df, velocity_df, phantom_d
                  row["risk_tier"], row["providers"], row["pct_providers"],
                  usd_fmt(row["total_paid"]), row["pct_spending"])
 
-    fig, axes = plt.subplots(2, 2, figsize=(16, 12))
+    fig, axes = subplots(2, 2, figsize=(16, 12))
     fig.suptitle("Composite Fraud Risk Scoring", fontsize=16, fontweight="bold", y=1.01)
     tier_colors = {"Clean": "#34a853", "Low": "#fbbc04", "Medium": "#e8710a", "High": "#ea4335"}
     ax = axes[0, 0]
@@ -77,5 +80,5 @@ def s40_composite_fraud_score(con, csv: str, upcoding_df, velocity_df, phantom_d
         ax.set_yticks(range(len(top_hr))); ax.set_yticklabels(top_hr["BILLING_PROVIDER_NPI_NUM"].astype(str).str[:10], fontsize=6)
         ax.set_xticks(range(len(risk_cols))); ax.set_xticklabels([c.replace("risk_", "") for c in risk_cols], fontsize=8, rotation=45)
         ax.set_title("Top-50 High-Risk Signal Heatmap", fontsize=13, fontweight="bold")
-    fig.tight_layout(); savefig(fig, "40_fraud_risk_scores.png", "fraud")
+    savefig(fig, "40_fraud_risk_scores.png", "fraud", tight_layout=True)
     return scores
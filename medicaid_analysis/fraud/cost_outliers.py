@@ -1,27 +1,38 @@
 """Fraud Detection — Cost Outliers by Procedure (Section 37)."""
 
-import matplotlib.pyplot as plt
-from utils import log, banner, query, savefig, save_csv, usd, OUTPUT_DIR
+from utils import (
+    log, banner, query, approx_mode, quantile_sketch, sketch_quantiles_sql, CPC_SKETCH, savefig, subplots,
+    save_csv, usd, OUTPUT_DIR,
+)
+
+QUARTILES = {"median_cpc": 0.5, "q1_cpc": 0.25, "q3_cpc": 0.75}
 
 
 def s37_cost_outliers_by_procedure(con, csv: str):
     """Find providers charging far more than peers for the same procedure."""
     banner(37, "Cost Outliers by Procedure (Within-HCPCS)")
 
+    if approx_mode(con):
+        # Per-code quartiles merged from the monthly cost-per-claim sketches
+        code_stats = f"""
+            SELECT * FROM ({sketch_quantiles_sql(quantile_sketch(con, csv, CPC_SKETCH), QUARTILES, ["HCPCS_CODE"])})
+            WHERE n >= 30
+        """
+    else:
+        percentiles = ", ".join(
+            f"PERCENTILE_CONT({p}) WITHIN GROUP (ORDER BY TOTAL_PAID / NULLIF(TOTAL_CLAIMS, 0)) AS {name}"
+            for name, p in QUARTILES.items())
+        code_stats = f"""
+            SELECT HCPCS_CODE, {percentiles}, COUNT(*) AS n
+            FROM {csv} WHERE TOTAL_CLAIMS > 0 GROUP BY HCPCS_CODE HAVING n >= 30
+        """
     outliers = query(con, f"""
-        WITH code_stats AS (
-            SELECT HCPCS_CODE,
-                   PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY TOTAL_PAID / NULLIF(TOTAL_CLAIMS, 0)) AS median_cpc,
-                   PERCENTILE_CONT(0.25) WITHIN GROUP (ORDER BY TOTAL_PAID / NULLIF(TOTAL_CLAIMS, 0)) AS q1_cpc,
-                   PERCENTILE_CONT(0.75) WITHIN GROUP (ORDER BY TOTAL_PAID / NULLIF(TOTAL_CLAIMS, 0)) AS q3_cpc,
-                   COUNT(*) AS n
-            FROM '{csv}' WHERE TOTAL_CLAIMS > 0 GROUP BY HCPCS_CODE HAVING n >= 30
-        )
+        WITH code_stats AS ({code_stats})
         SELECT r.BILLING_PROVIDER_NPI_NUM, r.HCPCS_CODE,
                r.TOTAL_PAID / NULLIF(r.TOTAL_CLAIMS, 0) AS provider_cpc,
                cs.median_cpc, cs.q1_cpc, cs.q3_cpc, (cs.q3_cpc - cs.q1_cpc) AS iqr,
                r.TOTAL_PAID, r.TOTAL_CLAIMS
-        FROM '{csv}' r JOIN code_stats cs ON r.HCPCS_CODE = cs.HCPCS_CODE WHERE r.TOTAL_CLAIMS > 0
+        FROM {csv} r JOIN code_stats cs ON r.HCPCS_CODE = cs.HCPCS_CODE WHERE r.TOTAL_CLAIMS > 0
     """)
     outliers["upper_fence"] = outliers["q3_cpc"] + 3 * outliers["iqr"]
     outliers["excess_ratio"] = outliers["provider_cpc"] / outliers["median_cpc"].clip(lower=0.01)
@@ -35,7 +46,7 @@ def s37_cost_outliers_by_procedure(con, csv: str):
     save_csv(provider_agg, "37_cost_outlier_providers.csv", "fraud")
     log.info("  Cost outlier records: %d (%d providers)", len(flagged), len(provider_agg))
 
-    fig, axes = plt.subplots(1, 3, figsize=(20, 7))
+    fig, axes = subplots(1, 3, figsize=(20, 7))
     fig.suptitle("Within-HCPCS Cost Outliers", fontsize=15, fontweight="bold", y=1.02)
     ax = axes[0]
     ax.hist(outliers["excess_ratio"].clip(0, 20), bins=100, color="#ea4335", edgecolor="white", alpha=0.85, log=True)
@@ -51,5 +62,5 @@ def s37_cost_outliers_by_procedure(con, csv: str):
         sample = flagged.head(2000)
         ax.scatter(sample["excess_ratio"], sample["TOTAL_PAID"], alpha=0.2, s=8, color="#9334e6")
         ax.set_xscale("log"); ax.set_yscale("log"); ax.set_title("Excess Ratio vs Total Paid", fontweight="bold"); usd(ax)
-    fig.tight_layout(); savefig(fig, "37_cost_outliers.png", "fraud")
+    savefig(fig, "37_cost_outliers.png", "fraud", tight_layout=True)
     return provider_agg
@@ -1,30 +1,48 @@
 """Fraud Detection — Phantom / Ghost Billing (Section 35)."""
 
-import matplotlib.pyplot as plt
-from utils import log, banner, query, savefig, save_csv, usd, OUTPUT_DIR
+from utils import (
+    log, banner, query, key_relations, provider_code, uses, PROVIDER_CODE, approx_mode,
+    sketch_sql, sketch_quantiles, savefig, subplots, save_csv, usd, OUTPUT_DIR,
+)
 
+PEER_QUANTILES = {"peer_median_cpb": 0.5, "peer_p95_cpb": 0.95, "peer_p99_cpb": 0.99}
 
+
+@uses(PROVIDER_CODE)
 def s35_phantom_billing(con, csv: str):
     """Detect impossible billing volumes — claims/beneficiary ratios far above norms."""
     banner(35, "Phantom / Ghost Billing Detection")
 
+    _, npi_dim, hcpcs_dim = key_relations(con, csv)
     phantom = query(con, f"""
-        SELECT BILLING_PROVIDER_NPI_NUM, HCPCS_CODE,
-               SUM(TOTAL_PAID) AS total_paid, SUM(TOTAL_CLAIMS) AS total_claims,
-               SUM(TOTAL_UNIQUE_BENEFICIARIES) AS total_bene,
-               COUNT(DISTINCT CLAIM_FROM_MONTH) AS active_months
-        FROM '{csv}' WHERE TOTAL_CLAIMS > 0 AND TOTAL_UNIQUE_BENEFICIARIES > 0
-        GROUP BY BILLING_PROVIDER_NPI_NUM, HCPCS_CODE
+        SELECT n.npi AS BILLING_PROVIDER_NPI_NUM, h.HCPCS_CODE,
+               p.total_paid_valid AS total_paid, p.total_claims_valid AS total_claims,
+               p.total_bene_valid AS total_bene,
+               p.active_months_valid AS active_months
+        FROM {provider_code(con, csv)} p
+        LEFT JOIN {npi_dim} n ON p.billing_id = n.npi_id
+        LEFT JOIN {hcpcs_dim} h ON p.hcpcs_id = h.hcpcs_id
+        WHERE p.rows_valid > 0
+        ORDER BY n.npi, h.HCPCS_CODE
     """)
     phantom["claims_per_bene"] = phantom["total_claims"] / phantom["total_bene"]
     phantom["paid_per_bene"] = phantom["total_paid"] / phantom["total_bene"]
     phantom["claims_per_month"] = phantom["total_claims"] / phantom["active_months"].clip(lower=1)
 
-    peer_stats = phantom.groupby("HCPCS_CODE").agg(
-        peer_median_cpb=("claims_per_bene", "median"),
-        peer_p95_cpb=("claims_per_bene", lambda x: x.quantile(0.95)),
-        peer_p99_cpb=("claims_per_bene", lambda x: x.quantile(0.99)),
-    ).reset_index()
+    if approx_mode(con):
+        cells = f"""(
+            SELECT h.HCPCS_CODE, p.total_claims_valid / p.total_bene_valid AS claims_per_bene
+            FROM {provider_code(con, csv)} p LEFT JOIN {hcpcs_dim} h ON p.hcpcs_id = h.hcpcs_id
+            WHERE p.rows_valid > 0
+        )"""
+        peer_stats = sketch_quantiles(con, f"({sketch_sql(cells, 'claims_per_bene', ['HCPCS_CODE'])})",
+                                      PEER_QUANTILES, ["HCPCS_CODE"]).drop(columns="n")
+    else:
+        peer_stats = phantom.groupby("HCPCS_CODE").agg(
+            peer_median_cpb=("claims_per_bene", "median"),
+            peer_p95_cpb=("claims_per_bene", lambda x: x.quantile(0.95)),
+            peer_p99_cpb=("claims_per_bene", lambda x: x.quantile(0.99)),
+        ).reset_index()
     phantom = phantom.merge(peer_stats, on="HCPCS_CODE")
     phantom["ratio_to_p95"] = phantom["claims_per_bene"] / phantom["peer_p95_cpb"].clip(lower=0.1)
     phantom["flag_phantom"] = (phantom["ratio_to_p95"] > 3) | (phantom["claims_per_bene"] > 50)
@@ -37,7 +55,7 @@ def s35_phantom_billing(con, csv: str):
     save_csv(provider_phantom, "35_phantom_providers.csv", "fraud")
     log.info("  Phantom-flagged records: %d (%d providers)", len(flagged), len(provider_phantom))
 
-    fig, axes = plt.subplots(1, 3, figsize=(20, 7))
+    fig, axes = subplots(1, 3, figsize=(20, 7))
     fig.suptitle("Phantom / Ghost Billing — Impossible Volumes", fontsize=15, fontweight="bold", y=1.02)
     ax = axes[0]
     ax.hist(phantom["claims_per_bene"].clip(0, 30), bins=80, color="#ea4335", edgecolor="white", alpha=0.85, log=True)
@@ -50,5 +68,5 @@ def s35_phantom_billing(con, csv: str):
         sample = flagged.head(1000)
         ax.scatter(sample["claims_per_bene"], sample["total_paid"], alpha=0.3, s=10, color="#9334e6")
         ax.set_xscale("log"); ax.set_yscale("log"); ax.set_title("Flagged: Claims/Bene vs Paid", fontweight="bold"); usd(ax)
-    fig.tight_layout(); savefig(fig, "35_phantom_billing.png", "fraud")
+    savefig(fig, "35_phantom_billing.png", "fraud", tight_layout=True)
     return provider_phantom
@@ -1,23 +1,29 @@
 """Fraud Detection — Billing-Servicing Relationship Anomalies (Section 38)."""
 
-import matplotlib.pyplot as plt
-from utils import log, banner, query, savefig, save_csv, usd, OUTPUT_DIR
+from utils import log, banner, query, key_relations, savefig, subplots, save_csv, usd, OUTPUT_DIR
 
 
 def s38_billing_servicing_anomalies(con, csv: str):
     """Detect suspicious billing-servicing relationships (kickback signals)."""
     banner(38, "Billing-Servicing Relationship Anomalies")
 
+    fact, npi_dim, _ = key_relations(con, csv)
     relationships = query(con, f"""
-        SELECT BILLING_PROVIDER_NPI_NUM, SERVICING_PROVIDER_NPI_NUM,
-               COUNT(DISTINCT HCPCS_CODE) AS shared_codes, COUNT(DISTINCT CLAIM_FROM_MONTH) AS shared_months,
-               SUM(TOTAL_PAID) AS relationship_paid, SUM(TOTAL_CLAIMS) AS relationship_claims
-        FROM '{csv}' WHERE BILLING_PROVIDER_NPI_NUM != SERVICING_PROVIDER_NPI_NUM
-        GROUP BY BILLING_PROVIDER_NPI_NUM, SERVICING_PROVIDER_NPI_NUM
+        WITH pairs AS (
+            SELECT billing_id, servicing_id,
+                   COUNT(DISTINCT hcpcs_id) AS shared_codes, COUNT(DISTINCT CLAIM_FROM_MONTH) AS shared_months,
+                   SUM(TOTAL_PAID) AS relationship_paid, SUM(TOTAL_CLAIMS) AS relationship_claims
+            FROM {fact} WHERE billing_id != servicing_id
+            GROUP BY billing_id, servicing_id
+        )
+        SELECT b.npi AS BILLING_PROVIDER_NPI_NUM, s.npi AS SERVICING_PROVIDER_NPI_NUM,
+               p.shared_codes, p.shared_months, p.relationship_paid, p.relationship_claims,
+               SUM(p.relationship_paid) OVER (PARTITION BY p.billing_id) AS billing_total
+        FROM pairs p
+        JOIN {npi_dim} b ON p.billing_id = b.npi_id
+        JOIN {npi_dim} s ON p.servicing_id = s.npi_id
+        ORDER BY b.npi, s.npi
     """)
-    billing_totals = relationships.groupby("BILLING_PROVIDER_NPI_NUM")["relationship_paid"].sum().reset_index()
-    billing_totals.columns = ["BILLING_PROVIDER_NPI_NUM", "billing_total"]
-    relationships = relationships.merge(billing_totals, on="BILLING_PROVIDER_NPI_NUM")
     relationships["concentration_pct"] = relationships["relationship_paid"] / relationships["billing_total"].clip(lower=1) * 100
     relationships["flag_concentrated"] = (relationships["concentration_pct"] > 90) & (relationships["relationship_paid"] > 10000)
     code_p95 = relationships["shared_codes"].quantile(0.95)
@@ -28,7 +34,7 @@ def s38_billing_servicing_anomalies(con, csv: str):
     log.info("  Concentrated relationships (>90%%): %d", relationships["flag_concentrated"].sum())
     log.info("  Unusually broad (>%d codes): %d", int(code_p95), relationships["flag_broad"].sum())
 
-    fig, axes = plt.subplots(1, 3, figsize=(20, 7))
+    fig, axes = subplots(1, 3, figsize=(20, 7))
     fig.suptitle("Billing-Servicing Relationship Anomalies", fontsize=15, fontweight="bold", y=1.02)
     ax = axes[0]
     ax.hist(relationships["concentration_pct"].clip(0, 100), bins=50, color="#1a73e8", edgecolor="white", alpha=0.85)
@@ -42,5 +48,5 @@ def s38_billing_servicing_anomalies(con, csv: str):
         ax.scatter(sample["concentration_pct"], sample["relationship_paid"], alpha=0.4, s=15,
                    c=sample["flag_concentrated"].astype(int), cmap="RdYlGn_r")
         ax.set_yscale("log"); ax.set_title("Flagged Relationships", fontweight="bold"); usd(ax)
-    fig.tight_layout(); savefig(fig, "38_billing_servicing.png", "fraud")
+    savefig(fig, "38_billing_servicing.png", "fraud", tight_layout=True)
     return flagged
@@ -2,38 +2,43 @@
 
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from scipy import stats as scipy_stats
-from utils import log, banner, query, savefig, save_csv, usd, OUTPUT_DIR
+from utils import log, banner, provider_months, exact_sums, savefig, subplots, save_csv, usd, OUTPUT_DIR
 
 
 def s39_temporal_anomalies(con, csv: str):
     """Detect suspicious temporal patterns — ramping, end-of-year spikes, etc."""
     banner(39, "Temporal Billing Anomalies")
 
-    monthly = query(con, f"""
-        SELECT BILLING_PROVIDER_NPI_NUM, CLAIM_FROM_MONTH,
-               SUM(TOTAL_PAID) AS monthly_paid, SUM(TOTAL_CLAIMS) AS monthly_claims,
-               COUNT(DISTINCT HCPCS_CODE) AS monthly_codes
-        FROM '{csv}' GROUP BY BILLING_PROVIDER_NPI_NUM, CLAIM_FROM_MONTH
-    """)
-    monthly["CLAIM_FROM_MONTH"] = pd.to_datetime(monthly["CLAIM_FROM_MONTH"])
-    monthly["month_num"] = monthly["CLAIM_FROM_MONTH"].dt.month
+    npis, months, m = provider_months(con, csv)
+    paid = np.asarray(m["TOTAL_PAID"], dtype=np.float64)
+    active = ~np.isnan(paid)
+    n = active.sum(axis=1)
+    total = np.nansum(paid, axis=1)
 
-    provider_entropy = monthly.groupby("BILLING_PROVIDER_NPI_NUM").apply(
-        lambda g: scipy_stats.entropy(g["monthly_paid"].values / g["monthly_paid"].sum())
-            if g["monthly_paid"].sum() > 0 and len(g) > 1 else 0
-    ).reset_index(name="temporal_entropy")
-    # Replace -inf/nan entropy with 0 (single-value or degenerate distributions)
-    provider_entropy["temporal_entropy"] = provider_entropy["temporal_entropy"].replace(
-        [np.inf, -np.inf], np.nan).fillna(0)
+    # Shannon entropy of each provider's spending shares across its active months;
+    # 0 for single-month, non-positive or negative-share (undefined) distributions
+    with np.errstate(invalid="ignore", divide="ignore"):
+        share = paid / total[:, None]
+        entropy = -np.nansum(np.where(share > 0, share * np.log(share), 0.0), axis=1)
+        mean = total / n
+        std = np.sqrt(np.nansum((paid - mean[:, None]) ** 2, axis=1) / (n - 1))
+    undefined = (total <= 0) | (n <= 1) | (paid < 0).any(axis=1)
+    entropy = np.where(undefined | ~np.isfinite(entropy), 0.0, entropy)
 
-    provider_stats = monthly.groupby("BILLING_PROVIDER_NPI_NUM").agg(
-        total_paid=("monthly_paid", "sum"), active_months=("CLAIM_FROM_MONTH", "nunique"),
-        max_monthly=("monthly_paid", "max"),
-        cv=("monthly_paid", lambda x: x.std() / x.mean() if x.mean() > 0 else 0),
-    ).reset_index()
-    provider_stats = provider_stats.merge(provider_entropy, on="BILLING_PROVIDER_NPI_NUM")
+    provider_stats = pd.DataFrame({
+        "BILLING_PROVIDER_NPI_NUM": npis, "total_paid": total, "active_months": n,
+        "max_monthly": np.nanmax(paid, axis=1),
+        "cv": np.where(mean > 0, std / mean, 0.0),
+        "temporal_entropy": entropy,
+    })
+    # Reported dollars are exact: provider totals, and the largest month located in the matrix
+    largest = pd.DataFrame({"BILLING_PROVIDER_NPI_NUM": npis,
+                            "CLAIM_FROM_MONTH": months[np.argmax(np.where(active, paid, -np.inf), axis=1)]})
+    largest = exact_sums(con, csv, largest, {"max_monthly": "SUM(TOTAL_PAID)"})
+    provider_stats = exact_sums(con, csv, provider_stats, {"total_paid": "SUM(TOTAL_PAID)"})
+    provider_stats["max_monthly"] = largest["max_monthly"].to_numpy()
+    provider_stats = provider_stats[["BILLING_PROVIDER_NPI_NUM", "total_paid", "active_months",
+                                     "max_monthly", "cv", "temporal_entropy"]]
     provider_stats["max_concentration"] = provider_stats["max_monthly"] / provider_stats["total_paid"].clip(lower=1)
     entropy_p5 = provider_stats.loc[provider_stats["active_months"] >= 6, "temporal_entropy"].quantile(0.05)
     provider_stats["flag_concentrated_time"] = (
@@ -46,7 +51,7 @@ def s39_temporal_anomalies(con, csv: str):
     log.info("  Temporally concentrated: %d", provider_stats["flag_concentrated_time"].sum())
     log.info("  High CV: %d", provider_stats["flag_high_cv"].sum())
 
-    fig, axes = plt.subplots(1, 3, figsize=(20, 7))
+    fig, axes = subplots(1, 3, figsize=(20, 7))
     fig.suptitle("Temporal Billing Anomalies", fontsize=15, fontweight="bold", y=1.02)
     ax = axes[0]; valid = provider_stats[(provider_stats["active_months"] >= 6) & np.isfinite(provider_stats["temporal_entropy"])]
     ax.hist(valid["temporal_entropy"], bins=50, color="#1a73e8", edgecolor="white", alpha=0.85)
@@ -59,5 +64,5 @@ def s39_temporal_anomalies(con, csv: str):
     if len(flagged) > 0:
         ax.scatter(flagged["temporal_entropy"], flagged["total_paid"], alpha=0.5, s=10, color="#ea4335", label="Flagged")
     ax.set_yscale("log"); ax.set_title("Entropy vs Total Paid", fontweight="bold"); usd(ax); ax.legend()
-    fig.tight_layout(); savefig(fig, "39_temporal_anomalies.png", "fraud")
+    savefig(fig, "39_temporal_anomalies.png", "fraud", tight_layout=True)
     return flagged
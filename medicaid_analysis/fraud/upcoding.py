@@ -1,38 +1,62 @@
 """Fraud Detection — Upcoding Detection (Section 33)."""
 
-import matplotlib.pyplot as plt
-from utils import log, banner, query, savefig, save_csv, usd, OUTPUT_DIR
+from utils import (
+    log, banner, query, key_relations, provider_code, uses, PROVIDER_CODE, savefig, subplots,
+    save_csv, usd, OUTPUT_DIR,
+)
 
 
+@uses(PROVIDER_CODE)
 def s33_upcoding_detection(con, csv: str):
     """Detect providers billing systematically higher-cost codes than peers."""
     banner(33, "Upcoding Detection")
 
+    # Peer statistics, z-score sums and maxima follow from the per-cell cost-per-claim
+    # moments; only the count of rows more than 2σ above peers needs the keyed fact.
+    fact, npi_dim, _ = key_relations(con, csv)
     upcoding = query(con, f"""
-        WITH code_stats AS (
-            SELECT HCPCS_CODE,
-                   AVG(TOTAL_PAID / NULLIF(TOTAL_CLAIMS, 0)) AS peer_avg_cpc,
-                   STDDEV(TOTAL_PAID / NULLIF(TOTAL_CLAIMS, 0)) AS peer_std_cpc,
-                   COUNT(*) AS n_providers
-            FROM '{csv}' WHERE TOTAL_CLAIMS > 0
-            GROUP BY HCPCS_CODE HAVING n_providers >= 20
+        WITH cells AS (
+            SELECT * FROM {provider_code(con, csv)} WHERE rows_claimed > 0
+        ),
+        code_stats AS (
+            SELECT hcpcs_id,
+                   SUM(cpc_sum) / SUM(rows_claimed) AS peer_avg_cpc,
+                   SQRT(GREATEST((SUM(cpc_sumsq) - POW(SUM(cpc_sum), 2) / SUM(rows_claimed))
+                                 / (SUM(rows_claimed) - 1), 0)) AS peer_std_cpc,
+                   SUM(rows_claimed) AS n_providers
+            FROM cells GROUP BY hcpcs_id HAVING n_providers >= 20
         ),
         provider_deviation AS (
-            SELECT r.BILLING_PROVIDER_NPI_NUM, r.HCPCS_CODE,
-                   r.TOTAL_PAID / NULLIF(r.TOTAL_CLAIMS, 0) AS provider_cpc,
-                   cs.peer_avg_cpc, cs.peer_std_cpc,
+            SELECT c.billing_id, c.rows_claimed,
+                   CASE WHEN cs.peer_std_cpc > 0
+                        THEN (c.cpc_sum - c.rows_claimed * cs.peer_avg_cpc) / cs.peer_std_cpc
+                        ELSE 0 END AS z_sum,
                    CASE WHEN cs.peer_std_cpc > 0
-                        THEN (r.TOTAL_PAID / NULLIF(r.TOTAL_CLAIMS, 0) - cs.peer_avg_cpc) / cs.peer_std_cpc
-                        ELSE 0 END AS z_score,
-                   r.TOTAL_PAID, r.TOTAL_CLAIMS
-            FROM '{csv}' r JOIN code_stats cs ON r.HCPCS_CODE = cs.HCPCS_CODE
-            WHERE r.TOTAL_CLAIMS > 0
+                        THEN (c.cpc_max - cs.peer_avg_cpc) / cs.peer_std_cpc
+                        ELSE 0 END AS z_max,
+                   c.total_paid_claimed, c.total_claims_claimed
+            FROM cells c JOIN code_stats cs ON c.hcpcs_id = cs.hcpcs_id
+        ),
+        high_z AS (
+            SELECT r.billing_id, COUNT(*) AS high_z_count
+            FROM {fact} r JOIN code_stats cs ON r.hcpcs_id = cs.hcpcs_id
+            WHERE r.TOTAL_CLAIMS > 0 AND cs.peer_std_cpc > 0
+              AND r.TOTAL_PAID / r.TOTAL_CLAIMS > cs.peer_avg_cpc + 2 * cs.peer_std_cpc
+            GROUP BY r.billing_id
+        ),
+        provider_z AS (
+            SELECT billing_id,
+                   CAST(SUM(rows_claimed) AS BIGINT) AS n_codes,
+                   SUM(z_sum) / SUM(rows_claimed) AS avg_z_score, MAX(z_max) AS max_z_score,
+                   SUM(total_paid_claimed) AS total_paid, SUM(total_claims_claimed) AS total_claims
+            FROM provider_deviation GROUP BY billing_id HAVING n_codes >= 3
         )
-        SELECT BILLING_PROVIDER_NPI_NUM,
-               COUNT(*) AS n_codes, AVG(z_score) AS avg_z_score, MAX(z_score) AS max_z_score,
-               SUM(CASE WHEN z_score > 2 THEN 1 ELSE 0 END) AS high_z_count,
-               SUM(TOTAL_PAID) AS total_paid, SUM(TOTAL_CLAIMS) AS total_claims
-        FROM provider_deviation GROUP BY BILLING_PROVIDER_NPI_NUM HAVING n_codes >= 3
+        SELECT d.npi AS BILLING_PROVIDER_NPI_NUM, p.n_codes, p.avg_z_score, p.max_z_score,
+               COALESCE(h.high_z_count, 0) AS high_z_count, p.total_paid, p.total_claims
+        FROM provider_z p
+        LEFT JOIN high_z h ON p.billing_id = h.billing_id
+        LEFT JOIN {npi_dim} d ON p.billing_id = d.npi_id
+        ORDER BY d.npi
     """)
     upcoding["upcode_ratio"] = upcoding["high_z_count"] / upcoding["n_codes"]
     upcoding["flag_upcoding"] = (upcoding["avg_z_score"] > 1.5) | (upcoding["upcode_ratio"] > 0.5)
@@ -42,7 +66,7 @@ def s33_upcoding_detection(con, csv: str):
     log.info("  Flagged upcoding providers: %d / %d (%.1f%%)",
              len(flagged), len(upcoding), len(flagged)/max(len(upcoding),1)*100)
 
-    fig, axes = plt.subplots(1, 3, figsize=(20, 7))
+    fig, axes = subplots(1, 3, figsize=(20, 7))
     fig.suptitle("Upcoding Detection — Billing Higher Than Peers", fontsize=15, fontweight="bold", y=1.02)
     ax = axes[0]
     ax.hist(upcoding["avg_z_score"].clip(-3, 5), bins=60, color="#ea4335", edgecolor="white", alpha=0.85)
@@ -55,5 +79,5 @@ def s33_upcoding_detection(con, csv: str):
         sample = flagged.head(500)
         ax.scatter(sample["avg_z_score"], sample["total_paid"], alpha=0.4, s=15, color="#ea4335")
         ax.set_yscale("log"); ax.set_title("Flagged: Z-Score vs Spending", fontweight="bold"); ax.set_xlabel("Avg Z-Score"); usd(ax)
-    fig.tight_layout(); savefig(fig, "33_upcoding.png", "fraud")
+    savefig(fig, "33_upcoding.png", "fraud", tight_layout=True)
     return flagged
@@ -1,50 +1,61 @@
 """Fraud Detection — Billing Velocity Anomalies (Section 34)."""
 
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from utils import log, banner, query, savefig, save_csv, usd, OUTPUT_DIR
+from utils import log, banner, provider_months, exact_sums, pack_active, savefig, subplots, save_csv, usd, OUTPUT_DIR
 
 
 def s34_billing_velocity_anomalies(con, csv: str):
     """Detect providers with suspicious sudden spikes in billing volume."""
     banner(34, "Billing Velocity Anomalies")
 
-    provider_monthly = query(con, f"""
-        SELECT BILLING_PROVIDER_NPI_NUM, CLAIM_FROM_MONTH,
-               SUM(TOTAL_PAID) AS monthly_paid, SUM(TOTAL_CLAIMS) AS monthly_claims
-        FROM '{csv}' GROUP BY BILLING_PROVIDER_NPI_NUM, CLAIM_FROM_MONTH
-    """)
-    provider_monthly["CLAIM_FROM_MONTH"] = pd.to_datetime(provider_monthly["CLAIM_FROM_MONTH"])
-    provider_monthly = provider_monthly.sort_values(["BILLING_PROVIDER_NPI_NUM", "CLAIM_FROM_MONTH"])
+    npis, months, m = provider_months(con, csv, ["TOTAL_PAID", "TOTAL_CLAIMS"])
+    paid, order, counts = pack_active(m["TOTAL_PAID"])
 
     # Filter to providers with ≥4 active months (required for rolling window)
-    month_counts = provider_monthly.groupby("BILLING_PROVIDER_NPI_NUM").size()
-    eligible_npis = month_counts[month_counts >= 4].index
-    log.info("  Providers with ≥4 months: %d / %d", len(eligible_npis), len(month_counts))
-    eligible = provider_monthly[provider_monthly["BILLING_PROVIDER_NPI_NUM"].isin(eligible_npis)].copy()
+    eligible = counts >= 4
+    log.info("  Providers with ≥4 months: %d / %d", eligible.sum(), len(npis))
 
-    if eligible.empty:
+    if not eligible.any():
         log.info("  No eligible providers — skipping spike detection")
         provider_flags = pd.DataFrame(columns=["BILLING_PROVIDER_NPI_NUM", "spike_count",
                                                 "max_spike_ratio", "max_spike_paid", "total_paid"])
         save_csv(provider_flags, "34_velocity_anomalies.csv", "fraud")
-        fig, axes = plt.subplots(1, 3, figsize=(20, 7))
+        fig, axes = subplots(1, 3, figsize=(20, 7))
         fig.suptitle("Billing Velocity Anomalies — No Data", fontsize=15, fontweight="bold")
-        fig.tight_layout(); savefig(fig, "34_velocity_anomalies.png", "fraud")
+        savefig(fig, "34_velocity_anomalies.png", "fraud", tight_layout=True)
         return provider_flags
 
-    # Compute rolling stats per provider using vectorized groupby + transform
-    eligible = eligible.sort_values(["BILLING_PROVIDER_NPI_NUM", "CLAIM_FROM_MONTH"])
-    eligible["rolling_mean"] = eligible.groupby("BILLING_PROVIDER_NPI_NUM")["monthly_paid"] \
-        .transform(lambda x: x.rolling(3, min_periods=2).mean().shift(1))
-    eligible["rolling_std"] = eligible.groupby("BILLING_PROVIDER_NPI_NUM")["monthly_paid"] \
-        .transform(lambda x: x.rolling(3, min_periods=2).std().shift(1))
-    eligible["spike_ratio"] = eligible["monthly_paid"] / eligible["rolling_mean"].clip(lower=1)
-    eligible["z_spike"] = (eligible["monthly_paid"] - eligible["rolling_mean"]) / eligible["rolling_std"].clip(lower=1)
+    # Trailing 3-active-month mean / std (min 2 values), excluding the current month,
+    # over each provider's active months packed to the left of the row
+    paid, order, npis = paid[eligible].astype(np.float64), order[eligible], npis[eligible]
+    claims = np.take_along_axis(np.asarray(m["TOTAL_CLAIMS"])[eligible], order, axis=1)
+    lagged = np.full((3,) + paid.shape, np.nan)
+    for k in range(1, 4):
+        lagged[k - 1, :, k:] = paid[:, :-k]
+    n_prev = (~np.isnan(lagged)).sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rolling_mean = np.nansum(lagged, axis=0) / n_prev
+        rolling_std = np.sqrt(np.nansum((lagged - rolling_mean) ** 2, axis=0) / (n_prev - 1))
+    valid = (n_prev >= 2) & ~np.isnan(paid)
+    rolling_mean[~valid] = np.nan
+    rolling_std[~valid] = np.nan
 
-    spikes = eligible.dropna(subset=["spike_ratio"])
+    rows, cols = np.nonzero(valid)
+    spikes = pd.DataFrame({
+        "BILLING_PROVIDER_NPI_NUM": npis[rows],
+        "CLAIM_FROM_MONTH": months[order[rows, cols]],
+        "monthly_paid": paid[rows, cols], "monthly_claims": claims[rows, cols].astype(np.float64),
+        "rolling_mean": rolling_mean[rows, cols], "rolling_std": rolling_std[rows, cols],
+    })
+    spikes["spike_ratio"] = spikes["monthly_paid"] / spikes["rolling_mean"].clip(lower=1)
+    spikes["z_spike"] = (spikes["monthly_paid"] - spikes["rolling_mean"]) / spikes["rolling_std"].clip(lower=1)
     spikes["flag_spike"] = (spikes["spike_ratio"] > 5) | (spikes["z_spike"] > 4)
-    flagged_events = spikes[spikes["flag_spike"]]
+    # Flagged months report exact amounts from DuckDB rather than float32 cells
+    flagged_events = exact_sums(con, csv, spikes[spikes["flag_spike"]], {
+        "monthly_paid": "SUM(TOTAL_PAID)", "monthly_claims": "SUM(TOTAL_CLAIMS)::DOUBLE",
+    })[spikes.columns]
+    flagged_events[["rolling_mean", "rolling_std"]] = flagged_events[["rolling_mean", "rolling_std"]].round(2)
 
     if flagged_events.empty:
         log.info("  No spike events detected")
@@ -60,7 +71,7 @@ def s34_billing_velocity_anomalies(con, csv: str):
     save_csv(flagged_events.head(500), "34_spike_events.csv", "fraud")
     log.info("  Spike events: %d across %d providers", len(flagged_events), len(provider_flags))
 
-    fig, axes = plt.subplots(1, 3, figsize=(20, 7))
+    fig, axes = subplots(1, 3, figsize=(20, 7))
     fig.suptitle("Billing Velocity Anomalies — Sudden Spikes", fontsize=15, fontweight="bold", y=1.02)
     ax = axes[0]
     ax.hist(spikes["spike_ratio"].clip(0, 20), bins=100, color="#9334e6", edgecolor="white", alpha=0.85, log=True)
@@ -74,5 +85,5 @@ def s34_billing_velocity_anomalies(con, csv: str):
         sample = provider_flags.head(200)
         ax.scatter(sample["spike_count"], sample["max_spike_paid"], alpha=0.5, s=20, color="#ea4335")
         ax.set_yscale("log"); ax.set_title("Spike Count vs Max Spike $", fontweight="bold"); usd(ax)
-    fig.tight_layout(); savefig(fig, "34_velocity_anomalies.png", "fraud")
+    savefig(fig, "34_velocity_anomalies.png", "fraud", tight_layout=True)
     return provider_flags
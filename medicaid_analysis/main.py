@@ -10,16 +10,39 @@ Usage:
     uv run main.py --sections 1 2 5       # Run specific sections
     uv run main.py --skip-fraud           # Skip fraud sections (33-40)
     uv run main.py --sample               # Use sample dataset
+    uv run main.py --sample-pct 10 --csv ../data/sample_10pct.csv   # Scale a sample without metadata
+    uv run main.py --no-cache             # Query the raw CSV instead of the Parquet cache
+    uv run main.py --db                   # Reuse a persistent per-dataset DuckDB database
+    uv run main.py --append ../data/2025-01.csv --sections 21 22   # Add a new month to the database
+    uv run main.py --from-month 2023-01 --to-month 2023-12   # Analyse one year only
+    uv run main.py --query-cache --sections 33 40   # Reuse cached query results
+    uv run main.py --jobs 8               # Run independent sections on 8 workers
+    uv run main.py --plot-workers 4       # Draw plots in 4 background processes
+    uv run main.py --defer-plots          # Compute only; save plot specs for later
+    uv run main.py --render-plots         # Draw saved plot specs in one batch
+    uv run main.py --force                # Rerun sections even if unchanged since the last run
+    uv run main.py --resume               # Continue an interrupted or failed run
 """
 
+import os
 import sys
 import time
 import argparse
+from datetime import datetime
+from functools import partial
 import pandas as pd
 from pathlib import Path
 
+import matplotlib
+matplotlib.use("Agg")   # before any section imports pyplot: figures are built on worker threads
+
 from utils import (
-    log, connect, query, FULL_CSV, SAMPLE_CSV, OUTPUT_DIR, PLOTS_DIR,
+    log, connect, query, ingest, register_claims, open_store, append_months, prepare, CLAIMS_TABLE,
+    fingerprint, catalog_fingerprint, enable_query_cache, log_query_cache_stats, SPECS_VERSION,
+    Step, run_steps, log_schedule_report, RunManifest, journal, interrupted_run,
+    read_sample_design, set_sample_design, set_approx_mode, set_approx_distinct, RELATIVE_ERROR,
+    set_plot_theme, start_plot_workers, defer_plots, finish_plots, render_specs,
+    FULL_CSV, SAMPLE_CSV, SAMPLE_PARQUET, OUTPUT_DIR, PLOTS_DIR,
     FULL_ROW_COUNT, FULL_TOTAL_PAID, FULL_TOTAL_CLAIMS,
     FULL_BILLING_NPIS, FULL_SERVICING_NPIS, FULL_HCPCS_CODES,
 )
@@ -69,9 +92,56 @@ from fraud import (
     s39_temporal_anomalies, s40_composite_fraud_score,
 )
 
+SECTIONS = {
+    1: s01_eda, 2: s02_monthly_trends, 3: s03_top_procedures, 4: s04_top_providers,
+    5: s05_cost_efficiency, 6: s06_anomaly_detection, 7: s07_billing_vs_servicing,
+    8: s08_concentration, 9: s09_correlations, 10: s10_procedure_diversity,
+    11: s11_temporal_patterns, 12: s12_high_value_claims, 13: s13_provider_growth,
+    14: s14_hcpcs_categories, 15: s15_power_law, 16: s16_provider_network,
+    17: s17_statistical_tests, 18: s18_spending_deciles, 19: s19_beneficiary_intensity,
+    20: s20_distribution_deep_dive, 21: s21_rolling_cumulative, 22: s22_yoy_comparison,
+    23: s23_procedure_cooccurrence, 24: s24_provider_tenure, 25: s25_spending_velocity,
+    26: s26_claims_size_distribution, 27: s27_provider_specialization,
+    28: s28_outlier_profiles, 29: s29_market_share_dynamics, 30: s30_hcpcs_lifecycle,
+    31: s31_benfords_law, 32: s32_executive_summary, 33: s33_upcoding_detection,
+    34: s34_billing_velocity_anomalies, 35: s35_phantom_billing, 36: s36_provider_clustering,
+    37: s37_cost_outliers_by_procedure, 38: s38_billing_servicing_anomalies,
+    39: s39_temporal_anomalies, 40: s40_composite_fraud_score,
+}
+
+# ── Results passed between sections ───────────────────────────────────────
+FRAUD_RESULTS = ("upcoding_df", "velocity_df", "phantom_df",
+                 "cost_outlier_df", "relationship_df", "temporal_fraud_df")
+OUTPUTS = {
+    1: "eda_result", 22: "yoy_totals",
+    33: "upcoding_df", 34: "velocity_df", 35: "phantom_df",
+    37: "cost_outlier_df", 38: "relationship_df", 39: "temporal_fraud_df",
+}
+INPUTS = {
+    32: ("eda_result", "yoy_totals"),
+    40: FRAUD_RESULTS,
+}
+# Inputs a section can do without, and the value it gets instead
+OPTIONAL = {
+    32: {"yoy_totals": None},
+    # Composite scoring treats a missing detector as flagging nobody
+    40: dict.fromkeys(FRAUD_RESULTS, pd.DataFrame(columns=["BILLING_PROVIDER_NPI_NUM"])),
+}
+STEPS = [Step(num, func, INPUTS.get(num, ()), OUTPUTS.get(num), OPTIONAL.get(num))
+         for num, func in SECTIONS.items()]
+FAILED = set()   # sections whose last run raised
+
+
+def month_arg(value: str) -> str:
+    """argparse type for YYYY-MM month bounds."""
+    try:
+        return datetime.strptime(value, "%Y-%m").strftime("%Y-%m")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected YYYY-MM, got {value!r}")
+
 
-def parse_args():
-    """Parse command-line arguments."""
+def parse_args(argv=None):
+    """Parse command-line arguments (``sys.argv`` by default)."""
     parser = argparse.ArgumentParser(description="Medicaid Provider Spending Analysis Pipeline")
     parser.add_argument("--sections", nargs="*", type=int,
                         help="Specific section numbers to run (default: all)")
@@ -81,7 +151,44 @@ def parse_args():
                         help="Use sample dataset instead of full dataset")
     parser.add_argument("--csv", type=str, default=None,
                         help="Path to a specific CSV file to analyse")
-    return parser.parse_args()
+    parser.add_argument("--sample-pct", type=float, default=None, metavar="PCT",
+                        help="Percentage the dataset was sampled at, for samples written without "
+                             "create_sample.py metadata (population estimates are added either way)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Query the raw CSV directly instead of its cached Parquet copy")
+    parser.add_argument("--db", action="store_true",
+                        help="Load the dataset into a persistent DuckDB database and reuse it across runs")
+    parser.add_argument("--append", nargs="+", default=None, metavar="FILE",
+                        help="Append the new months of these CSV / Parquet files to the persistent "
+                             "database, updating its aggregates (implies --db)")
+    parser.add_argument("--from-month", type=month_arg, default=None, metavar="YYYY-MM",
+                        help="First claim month to include (inclusive)")
+    parser.add_argument("--to-month", type=month_arg, default=None, metavar="YYYY-MM",
+                        help="Last claim month to include (inclusive)")
+    parser.add_argument("--where", type=str, default=None, metavar="SQL",
+                        help="Only analyse rows matching this SQL predicate on the original columns "
+                             "(e.g. \"HCPCS_CODE LIKE 'T%%'\")")
+    parser.add_argument("--approx", action="store_true",
+                        help="Compute percentiles from mergeable quantile sketches "
+                             "(within 1%% relative error) instead of sorting every row")
+    parser.add_argument("--approx-distinct", action="store_true",
+                        help="Estimate distinct NPI / HCPCS counts from HyperLogLog sketches "
+                             "(about 1%% error) instead of counting them exactly")
+    parser.add_argument("--query-cache", action="store_true",
+                        help="Reuse results of identical queries on unchanged data from disk")
+    parser.add_argument("--jobs", "-j", type=int, default=1, metavar="N",
+                        help="Run up to N independent sections concurrently (default: 1)")
+    parser.add_argument("--plot-workers", type=int, default=0, metavar="N",
+                        help="Draw plots in N background processes (default: draw inline)")
+    parser.add_argument("--defer-plots", action="store_true",
+                        help="Save plot specs under plots/specs instead of drawing them")
+    parser.add_argument("--force", action="store_true",
+                        help="Rerun selected sections even if their code, data and parameters are unchanged")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue the last run with its arguments if it was interrupted or had failures")
+    parser.add_argument("--render-plots", action="store_true",
+                        help="Draw the saved plot specs and exit")
+    return parser.parse_args(argv)
 
 
 def should_run(section_num: int, args) -> bool:
@@ -102,18 +209,50 @@ def run_section(section_num: int, func, *args, **kwargs):
         return result
     except Exception as e:
         log.error("  ✗ Section %d FAILED: %s", section_num, e, exc_info=True)
+        FAILED.add(section_num)
         return None
 
 
+def run_checkpointed(manifest, section_num: int, func, *args):
+    """``run_section``, then checkpoint its result and status so a resumed run continues after it."""
+    t0 = time.time()
+    result = run_section(section_num, func, *args)
+    if section_num in FAILED:
+        manifest.forget([section_num])
+        journal("failed", section=section_num)
+    else:
+        manifest.checkpoint(section_num, result, started=t0)
+        journal("completed", section=section_num, seconds=round(time.time() - t0, 2))
+    return result
+
+
 def main():
     """Main pipeline orchestrator."""
-    args = parse_args()
+    argv = sys.argv[1:]
+    args = parse_args(argv)
     t_start = time.time()
 
+    if args.resume:
+        interrupted = interrupted_run()
+        if interrupted is None:
+            log.info("Nothing to resume: the last run completed")
+            return 0
+        recorded, done = interrupted
+        # Options given now (e.g. --jobs) override the recorded ones
+        argv = recorded + [a for a in argv if a != "--resume"]
+        args = parse_args(argv)
+        log.info("Resuming main.py %s after %d completed sections", " ".join(recorded), len(done))
+
+    if args.render_plots:
+        t0 = time.time()
+        rendered = render_specs(workers=args.plot_workers or os.cpu_count())
+        log.info("Rendered %d plot specs in %.1fs", rendered, time.time() - t0)
+        return 0
+
     if args.csv:
         csv = args.csv
     elif args.sample:
-        csv = str(SAMPLE_CSV)
+        csv = str(SAMPLE_PARQUET if SAMPLE_PARQUET.exists() else SAMPLE_CSV)
     else:
         csv = str(FULL_CSV)
     csv_path = Path(csv)
@@ -132,137 +271,82 @@ def main():
     log.info("Dataset: %s", csv_path.name)
     log.info("Output:  %s", OUTPUT_DIR)
     log.info("Plots:   %s", PLOTS_DIR)
+    windowed = args.from_month is not None or args.to_month is not None
+    if windowed:
+        log.info("Months:  %s → %s", args.from_month or "start", args.to_month or "end")
+    if args.where:
+        log.info("Filter:  %s", args.where)
+    design = read_sample_design(csv_path, args.sample_pct)
+    if design is not None:
+        log.info("Sample:  %s — sections add population estimates", design.describe())
+    if args.approx:
+        log.info("Approx:  percentiles from quantile sketches (±%g%%)", RELATIVE_ERROR * 100)
+    if args.approx_distinct:
+        log.info("Approx:  distinct counts from HyperLogLog sketches")
     log.info("")
-
-    con = connect()
-
-    # ── Shared state (results passed between sections) ────────────────────
-    eda_result = None
-    cost_df = None
-    yoy_totals = None
-
-    # ── S01–S05: EDA & Core Analysis ─────────────────────────────────────
-    if should_run(1, args):
-        eda_result = run_section(1, s01_eda, con, csv)
-    if should_run(2, args):
-        run_section(2, s02_monthly_trends, con, csv)
-    if should_run(3, args):
-        run_section(3, s03_top_procedures, con, csv)
-    if should_run(4, args):
-        run_section(4, s04_top_providers, con, csv)
-    if should_run(5, args):
-        cost_df = run_section(5, s05_cost_efficiency, con, csv)
-
-    # ── S06–S10: Statistical & Provider Analysis ─────────────────────────
-    if should_run(6, args):
-        if cost_df is not None:
-            run_section(6, s06_anomaly_detection, con, csv, cost_df)
-        else:
-            log.warning("  Skipping S06: requires S05 cost_df (run S05 first)")
-    if should_run(7, args):
-        run_section(7, s07_billing_vs_servicing, con, csv)
-    if should_run(8, args):
-        run_section(8, s08_concentration, con, csv)
-    if should_run(9, args):
-        if cost_df is not None:
-            run_section(9, s09_correlations, con, csv, cost_df)
-        else:
-            log.warning("  Skipping S09: requires S05 cost_df (run S05 first)")
-    if should_run(10, args):
-        run_section(10, s10_procedure_diversity, con, csv)
-
-    # ── S11–S15: Temporal & Deep Analysis ────────────────────────────────
-    if should_run(11, args):
-        run_section(11, s11_temporal_patterns, con, csv)
-    if should_run(12, args):
-        run_section(12, s12_high_value_claims, con, csv)
-    if should_run(13, args):
-        run_section(13, s13_provider_growth, con, csv)
-    if should_run(14, args):
-        run_section(14, s14_hcpcs_categories, con, csv)
-    if should_run(15, args):
-        run_section(15, s15_power_law, con, csv)
-
-    # ── S16–S20: Network & Distributions ─────────────────────────────────
-    if should_run(16, args):
-        run_section(16, s16_provider_network, con, csv)
-    if should_run(17, args):
-        if cost_df is not None:
-            run_section(17, s17_statistical_tests, con, csv, cost_df)
-        else:
-            log.warning("  Skipping S17: requires S05 cost_df (run S05 first)")
-    if should_run(18, args):
-        run_section(18, s18_spending_deciles, con, csv)
-    if should_run(19, args):
-        run_section(19, s19_beneficiary_intensity, con, csv)
-    if should_run(20, args):
-        if cost_df is not None:
-            run_section(20, s20_distribution_deep_dive, con, csv, cost_df)
-        else:
-            log.warning("  Skipping S20: requires S05 cost_df (run S05 first)")
-
-    # ── S21–S25: Rolling & Growth ────────────────────────────────────────
-    if should_run(21, args):
-        run_section(21, s21_rolling_cumulative, con, csv)
-    if should_run(22, args):
-        yoy_totals = run_section(22, s22_yoy_comparison, con, csv)
-    if should_run(23, args):
-        run_section(23, s23_procedure_cooccurrence, con, csv)
-    if should_run(24, args):
-        run_section(24, s24_provider_tenure, con, csv)
-    if should_run(25, args):
-        run_section(25, s25_spending_velocity, con, csv)
-
-    # ── S26–S32: Size, Specialization & Summaries ────────────────────────
-    if should_run(26, args):
-        run_section(26, s26_claims_size_distribution, con, csv)
-    if should_run(27, args):
-        run_section(27, s27_provider_specialization, con, csv)
-    if should_run(28, args):
-        if cost_df is not None:
-            run_section(28, s28_outlier_profiles, con, csv, cost_df)
-        else:
-            log.warning("  Skipping S28: requires S05 cost_df (run S05 first)")
-    if should_run(29, args):
-        run_section(29, s29_market_share_dynamics, con, csv)
-    if should_run(30, args):
-        run_section(30, s30_hcpcs_lifecycle, con, csv)
-    if should_run(31, args):
-        run_section(31, s31_benfords_law, con, csv)
-    if should_run(32, args):
-        if eda_result is not None:
-            run_section(32, s32_executive_summary, con, csv, eda_result, yoy_totals)
-        else:
-            log.warning("  Skipping S32: requires S01 eda_result (run S01 first)")
-
-    # ── S33–S40: Fraud Detection ─────────────────────────────────────────
-    upcoding_df = velocity_df = phantom_df = None
-    cost_outlier_df = relationship_df = temporal_fraud_df = None
-
-    if should_run(33, args):
-        upcoding_df = run_section(33, s33_upcoding_detection, con, csv)
-    if should_run(34, args):
-        velocity_df = run_section(34, s34_billing_velocity_anomalies, con, csv)
-    if should_run(35, args):
-        phantom_df = run_section(35, s35_phantom_billing, con, csv)
-    if should_run(36, args):
-        run_section(36, s36_provider_clustering, con, csv)
-    if should_run(37, args):
-        cost_outlier_df = run_section(37, s37_cost_outliers_by_procedure, con, csv)
-    if should_run(38, args):
-        relationship_df = run_section(38, s38_billing_servicing_anomalies, con, csv)
-    if should_run(39, args):
-        temporal_fraud_df = run_section(39, s39_temporal_anomalies, con, csv)
-    if should_run(40, args):
-        # Composite requires all prior fraud DataFrames
-        empty = pd.DataFrame(columns=["BILLING_PROVIDER_NPI_NUM"])
-        run_section(40, s40_composite_fraud_score, con, csv,
-                   upcoding_df if upcoding_df is not None else empty,
-                   velocity_df if velocity_df is not None else empty,
-                   phantom_df if phantom_df is not None else empty,
-                   cost_outlier_df if cost_outlier_df is not None else empty,
-                   relationship_df if relationship_df is not None else empty,
-                   temporal_fraud_df if temporal_fraud_df is not None else empty)
+    journal("start", argv=[a for a in argv if a not in ("--resume", "--force")])
+
+    if args.db or args.append:
+        con = open_store(csv_path, use_cache=not args.no_cache)
+        for path in args.append or ():
+            append_months(con, path)
+        csv = CLAIMS_TABLE
+        if windowed or args.where:
+            csv = register_claims(con, CLAIMS_TABLE, args.from_month, args.to_month,
+                                  name="claims_window", where=args.where)
+    else:
+        con = connect()
+        source = csv_path if args.no_cache else ingest(csv_path, con=con)
+        csv = register_claims(con, source, args.from_month, args.to_month, where=args.where)
+
+    if design is not None:
+        set_sample_design(con, design)
+    if args.approx:
+        set_approx_mode(con)
+    if args.approx_distinct:
+        set_approx_distinct(con)
+
+    # The store's fingerprint also covers the months appended to it
+    data_fp = catalog_fingerprint(con, CLAIMS_TABLE) if args.db or args.append else fingerprint(csv_path)
+    dataset_key = ":".join([data_fp, args.from_month or "", args.to_month or "",
+                            args.where or ""])
+    if args.query_cache:
+        enable_query_cache(con, f"{dataset_key}:{SPECS_VERSION}")
+
+    # ── Sections unchanged since the last run keep their outputs ──────────
+    manifest = RunManifest(STEPS, dataset_key,
+                           params={"from_month": args.from_month, "to_month": args.to_month,
+                                   "where": args.where, "sample_pct": args.sample_pct,
+                                   "approx": args.approx, "approx_distinct": args.approx_distinct})
+    selected = [num for num in SECTIONS if should_run(num, args)]
+    if not args.force:
+        selected = manifest.stale(selected)
+
+    # ── Shared aggregates declared by the selected sections (@uses) ───────
+    needs = [name for num in selected for name in getattr(SECTIONS[num], "aggregates", ())]
+    t0 = time.time()
+    if prepare(con, csv, needs):
+        log.info("  Shared aggregates ready in %.1fs", time.time() - t0)
+
+    set_plot_theme()
+    if args.defer_plots:
+        defer_plots()
+    elif args.plot_workers > 0:
+        start_plot_workers(args.plot_workers)
+
+    # ── S01–S40, each once its declared inputs are available ──────────────
+    jobs = max(1, args.jobs)
+    if jobs > 1:
+        log.info("Running %d sections on %d workers", len(selected), jobs)
+    t0 = time.time()
+    timings = run_steps(con, csv, STEPS, selected, partial(run_checkpointed, manifest),
+                        jobs=jobs, timings_key=csv_path.name, manifest=manifest)
+    sections_wall = time.time() - t0
+    finish_plots()
+    manifest.record(set(timings) - FAILED)
+    manifest.forget(FAILED)
+    manifest.write()
+    journal("finish", failed=sorted(FAILED))
 
     # ── Summary ──────────────────────────────────────────────────────────
     elapsed = time.time() - t_start
@@ -270,6 +354,8 @@ def main():
     log.info("=" * 72)
     log.info("PIPELINE COMPLETE — %.1f minutes (%.0f seconds)", elapsed / 60, elapsed)
     log.info("=" * 72)
+    log_schedule_report(STEPS, timings, sections_wall, jobs)
+    log_query_cache_stats()
 
     con.close()
     return 0
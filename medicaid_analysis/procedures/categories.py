@@ -3,44 +3,40 @@
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-from utils import log, banner, query, savefig, usd, OUTPUT_DIR
+from utils import (
+    log, banner, query, approx_distinct, distinct_sketch, hll_count, HCPCS_CATEGORY, savefig, subplots, usd,
+    OUTPUT_DIR,
+)
+
+# output column → sketched column it counts
+DISTINCT = {"code_count": "HCPCS_CODE", "provider_count": "BILLING_PROVIDER_NPI_NUM"}
 
 
 def s14_hcpcs_categories(con, csv: str):
     """HCPCS code category analysis using code prefix grouping."""
     banner(14, "HCPCS Category Analysis")
 
+    approx = approx_distinct(con)
+    counts = {name: "NULL::BIGINT" if approx else f"COUNT(DISTINCT {column})" for name, column in DISTINCT.items()}
     cats = query(con, f"""
         SELECT
-            CASE
-                WHEN HCPCS_CODE LIKE '99%' THEN 'E&M (99xxx)'
-                WHEN HCPCS_CODE LIKE 'T%'  THEN 'State Codes (T)'
-                WHEN HCPCS_CODE LIKE 'S%'  THEN 'Commercial (S)'
-                WHEN HCPCS_CODE LIKE 'J%'  THEN 'Drugs (J)'
-                WHEN HCPCS_CODE LIKE 'H%'  THEN 'Behavioral Health (H)'
-                WHEN HCPCS_CODE LIKE 'G%'  THEN 'Temporary Procedures (G)'
-                WHEN HCPCS_CODE LIKE 'A%'  THEN 'Transport/Supplies (A)'
-                WHEN HCPCS_CODE LIKE 'D%'  THEN 'Dental (D)'
-                WHEN HCPCS_CODE LIKE 'E%'  THEN 'DME (E)'
-                WHEN HCPCS_CODE LIKE 'L%'  THEN 'Orthotics/Prosthetics (L)'
-                WHEN HCPCS_CODE LIKE 'V%'  THEN 'Vision/Hearing (V)'
-                WHEN HCPCS_CODE BETWEEN '00100' AND '01999' THEN 'Anesthesia'
-                WHEN HCPCS_CODE BETWEEN '10004' AND '69990' THEN 'Surgery'
-                WHEN HCPCS_CODE BETWEEN '70010' AND '79999' THEN 'Radiology'
-                WHEN HCPCS_CODE BETWEEN '80047' AND '89398' THEN 'Pathology/Lab'
-                WHEN HCPCS_CODE BETWEEN '90281' AND '99199' THEN 'Medicine'
-                ELSE 'Other'
-            END AS category,
-            COUNT(DISTINCT HCPCS_CODE) AS code_count,
+            {HCPCS_CATEGORY} AS category,
+            {counts['code_count']} AS code_count,
             SUM(TOTAL_PAID) AS total_paid, SUM(TOTAL_CLAIMS) AS total_claims,
             SUM(TOTAL_UNIQUE_BENEFICIARIES) AS total_bene,
-            COUNT(DISTINCT BILLING_PROVIDER_NPI_NUM) AS provider_count
-        FROM '{csv}' GROUP BY category ORDER BY total_paid DESC
+            {counts['provider_count']} AS provider_count
+        FROM {csv} GROUP BY category ORDER BY total_paid DESC
     """)
+    if approx:
+        # Per-category counts merged from the monthly HyperLogLog sketches
+        est = hll_count(con, distinct_sketch(con, csv), ["category", "column_name"])
+        est = est.pivot(index="category", columns="column_name", values="n_distinct")
+        for name, column in DISTINCT.items():
+            cats[name] = cats["category"].map(est[column]).astype("int64")
     cats.to_csv(OUTPUT_DIR / "14_hcpcs_categories.csv", index=False)
     log.info("  Categories found: %d", len(cats))
 
-    fig, axes = plt.subplots(1, 2, figsize=(18, 8))
+    fig, axes = subplots(1, 2, figsize=(18, 8))
     ax = axes[0]
     d = cats.sort_values("total_paid", ascending=True)
     colors = plt.cm.tab20(np.linspace(0, 1, len(d)))
@@ -53,13 +49,13 @@ def s14_hcpcs_categories(con, csv: str):
     ax.pie(pie_data["total_paid"], labels=pie_data["category"], autopct="%1.1f%%", startangle=90,
            textprops={"fontsize": 9}, colors=plt.cm.Set3(np.linspace(0, 1, len(pie_data))))
     ax.set_title("Spending Share by Category", fontsize=14, fontweight="bold")
-    fig.tight_layout(); savefig(fig, "14_hcpcs_categories.png")
+    savefig(fig, "14_hcpcs_categories.png", tight_layout=True)
 
-    fig, ax = plt.subplots(figsize=(12, 7))
+    fig, ax = subplots(figsize=(12, 7))
     cats["avg_cost_per_claim"] = cats["total_paid"] / cats["total_claims"].replace(0, np.nan)
     d = cats.dropna(subset=["avg_cost_per_claim"]).sort_values("avg_cost_per_claim", ascending=True)
     ax.barh(d["category"], d["avg_cost_per_claim"], color="#9334e6", edgecolor="white")
     ax.set_title("Average Cost per Claim by HCPCS Category", fontsize=14, fontweight="bold")
     ax.set_xlabel("Avg Cost per Claim (USD)"); usd(ax, axis="x")
-    fig.tight_layout(); savefig(fig, "14_category_cost_per_claim.png")
+    savefig(fig, "14_category_cost_per_claim.png", tight_layout=True)
     return cats
@@ -1,9 +1,8 @@
 """Procedures — Claims Size Distribution (Section 26)."""
 
 import numpy as np
-import matplotlib.pyplot as plt
 import matplotlib.ticker as mticker
-from utils import log, banner, query, savefig, num_fmt, OUTPUT_DIR
+from utils import log, banner, query, savefig, subplots, num_fmt, OUTPUT_DIR
 
 
 def s26_claims_size_distribution(con, csv: str):
@@ -22,14 +21,14 @@ def s26_claims_size_distribution(con, csv: str):
             END AS size_bucket,
             COUNT(*) AS record_count, SUM(TOTAL_PAID) AS total_paid, AVG(TOTAL_PAID) AS avg_paid,
             SUM(TOTAL_CLAIMS) AS total_claims, SUM(TOTAL_UNIQUE_BENEFICIARIES) AS total_bene
-        FROM '{csv}' GROUP BY size_bucket ORDER BY size_bucket
+        FROM {csv} GROUP BY size_bucket ORDER BY size_bucket
     """)
     buckets["pct_records"] = buckets["record_count"] / buckets["record_count"].sum() * 100
     buckets["pct_spending"] = buckets["total_paid"] / buckets["total_paid"].sum() * 100
     buckets.to_csv(OUTPUT_DIR / "26_claims_size_buckets.csv", index=False)
     log.info("  Buckets:\n%s", buckets[["size_bucket", "pct_records", "pct_spending"]].to_string(index=False))
 
-    fig, axes = plt.subplots(1, 3, figsize=(20, 7))
+    fig, axes = subplots(1, 3, figsize=(20, 7))
     labels = [b.split(". ")[1] for b in buckets["size_bucket"]]
     ax = axes[0]
     ax.bar(labels, buckets["pct_records"], color="#1a73e8", edgecolor="white")
@@ -46,5 +45,5 @@ def s26_claims_size_distribution(con, csv: str):
     ax.set_title("Record Count by Size", fontsize=13, fontweight="bold"); ax.set_ylabel("Records"); ax.tick_params(axis="x", rotation=30)
     ax.yaxis.set_major_formatter(mticker.FuncFormatter(num_fmt))
     fig.suptitle("Claims Size Distribution", fontsize=15, fontweight="bold", y=1.02)
-    fig.tight_layout(); savefig(fig, "26_claims_size.png")
+    savefig(fig, "26_claims_size.png", tight_layout=True)
     return buckets
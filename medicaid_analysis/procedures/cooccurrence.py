@@ -1,36 +1,50 @@
 """Procedures — Co-occurrence Analysis (Section 23)."""
 
-import matplotlib.pyplot as plt
-from utils import log, banner, query, savefig, OUTPUT_DIR
+from utils import (
+    log, banner, query, key_relations, provider_code, uses, PROVIDER_CODE, savefig, subplots,
+    OUTPUT_DIR,
+)
 
 
+@uses(PROVIDER_CODE)
 def s23_procedure_cooccurrence(con, csv: str):
     """Which procedures are commonly billed together by the same provider."""
     banner(23, "Procedure Co-occurrence Analysis")
 
+    _, _, hcpcs_dim = key_relations(con, csv)
+    # Ids do not follow code order, so each pair is oriented by the codes' sort rank
     pairs = query(con, f"""
-        WITH provider_procs AS (
-            SELECT BILLING_PROVIDER_NPI_NUM, HCPCS_CODE, SUM(TOTAL_PAID) AS total_paid
-            FROM '{csv}' GROUP BY BILLING_PROVIDER_NPI_NUM, HCPCS_CODE
+        WITH code_order AS (
+            SELECT hcpcs_id, CAST(ROW_NUMBER() OVER (ORDER BY HCPCS_CODE) AS INTEGER) AS code_rank
+            FROM {hcpcs_dim}
+        ), provider_procs AS (
+            SELECT p.billing_id, p.hcpcs_id, o.code_rank, p.total_paid
+            FROM {provider_code(con, csv)} p JOIN code_order o USING (hcpcs_id)
+        ), top_pairs AS (
+            SELECT a.hcpcs_id AS id_a, b.hcpcs_id AS id_b, a.code_rank AS rank_a, b.code_rank AS rank_b,
+                   COUNT(DISTINCT a.billing_id) AS shared_providers,
+                   SUM(a.total_paid + b.total_paid) AS combined_paid
+            FROM provider_procs a
+            JOIN provider_procs b ON a.billing_id = b.billing_id AND a.code_rank < b.code_rank
+            GROUP BY ALL HAVING shared_providers >= 50
+            ORDER BY shared_providers DESC, rank_a, rank_b LIMIT 50
         )
-        SELECT a.HCPCS_CODE AS code_a, b.HCPCS_CODE AS code_b,
-               COUNT(DISTINCT a.BILLING_PROVIDER_NPI_NUM) AS shared_providers,
-               SUM(a.total_paid + b.total_paid) AS combined_paid
-        FROM provider_procs a
-        JOIN provider_procs b ON a.BILLING_PROVIDER_NPI_NUM = b.BILLING_PROVIDER_NPI_NUM AND a.HCPCS_CODE < b.HCPCS_CODE
-        GROUP BY a.HCPCS_CODE, b.HCPCS_CODE HAVING shared_providers >= 50
-        ORDER BY shared_providers DESC LIMIT 50
+        SELECT ca.HCPCS_CODE AS code_a, cb.HCPCS_CODE AS code_b, p.shared_providers, p.combined_paid
+        FROM top_pairs p
+        JOIN {hcpcs_dim} ca ON p.id_a = ca.hcpcs_id
+        JOIN {hcpcs_dim} cb ON p.id_b = cb.hcpcs_id
+        ORDER BY p.shared_providers DESC, p.rank_a, p.rank_b
     """)
     pairs.to_csv(OUTPUT_DIR / "23_procedure_cooccurrence.csv", index=False)
     log.info("  Top pair: %s + %s (%d shared providers)",
              pairs.iloc[0]["code_a"], pairs.iloc[0]["code_b"],
              pairs.iloc[0]["shared_providers"] if len(pairs) > 0 else 0)
 
-    fig, ax = plt.subplots(figsize=(14, 8))
+    fig, ax = subplots(figsize=(14, 8))
     top = pairs.head(20).iloc[::-1]
     top["pair"] = top["code_a"] + " + " + top["code_b"]
     ax.barh(top["pair"], top["shared_providers"], color="#1a73e8", edgecolor="white")
     ax.set_title("Top 20 Procedure Co-occurrence Pairs (by Shared Providers)", fontsize=14, fontweight="bold")
     ax.set_xlabel("Number of Shared Providers")
-    fig.tight_layout(); savefig(fig, "23_cooccurrence.png")
+    savefig(fig, "23_cooccurrence.png", tight_layout=True)
     return pairs
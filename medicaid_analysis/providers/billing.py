@@ -1,9 +1,7 @@
 """Providers — Billing vs Servicing (Section 7)."""
 
-import pandas as pd
-import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
-from utils import log, banner, query, savefig, usd, OUTPUT_DIR
+from utils import log, banner, query, savefig, subplots, usd, OUTPUT_DIR
 
 
 def s07_billing_vs_servicing(con, csv: str):
@@ -18,7 +16,7 @@ def s07_billing_vs_servicing(con, csv: str):
             SUM(TOTAL_CLAIMS) AS total_claims,
             SUM(TOTAL_UNIQUE_BENEFICIARIES) AS total_bene,
             AVG(TOTAL_PAID / NULLIF(TOTAL_CLAIMS, 0)) AS avg_cost_per_claim
-        FROM '{csv}' WHERE TOTAL_CLAIMS > 0 GROUP BY billing_type
+        FROM {csv} WHERE TOTAL_CLAIMS > 0 GROUP BY billing_type
     """)
     billing.to_csv(OUTPUT_DIR / "07_billing_vs_servicing.csv", index=False)
     log.info("  Breakdown:\n%s", billing.to_string(index=False))
@@ -28,12 +26,11 @@ def s07_billing_vs_servicing(con, csv: str):
             CASE WHEN BILLING_PROVIDER_NPI_NUM = SERVICING_PROVIDER_NPI_NUM
                  THEN 'Same' ELSE 'Third-Party' END AS billing_type,
             SUM(TOTAL_PAID) AS total_paid
-        FROM '{csv}' GROUP BY CLAIM_FROM_MONTH, billing_type ORDER BY CLAIM_FROM_MONTH
+        FROM {csv} GROUP BY CLAIM_FROM_MONTH, billing_type ORDER BY CLAIM_FROM_MONTH
     """)
-    billing_monthly["CLAIM_FROM_MONTH"] = pd.to_datetime(billing_monthly["CLAIM_FROM_MONTH"])
     billing_monthly.to_csv(OUTPUT_DIR / "07_billing_monthly_by_type.csv", index=False)
 
-    fig, axes = plt.subplots(1, 3, figsize=(20, 6))
+    fig, axes = subplots(1, 3, figsize=(20, 6))
     colors = ["#1a73e8", "#e8710a"]
     ax = axes[0]
     ax.pie(billing["row_count"], labels=billing["billing_type"],
@@ -51,5 +48,5 @@ def s07_billing_vs_servicing(con, csv: str):
     ax.set_ylabel("Total Paid (USD)"); usd(ax); ax.legend(fontsize=10)
     ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y"))
     fig.suptitle("Billing vs Servicing Provider", fontsize=15, fontweight="bold", y=1.02)
-    fig.tight_layout(); savefig(fig, "07_billing_analysis.png")
+    savefig(fig, "07_billing_analysis.png", tight_layout=True)
     return billing
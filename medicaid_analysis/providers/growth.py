@@ -1,27 +1,41 @@
 """Providers — Growth Trajectories (Section 13)."""
 
-import matplotlib.pyplot as plt
-from utils import log, banner, query, savefig, OUTPUT_DIR
+import numpy as np
+import pandas as pd
+from utils import log, banner, provider_months, exact_sums, savefig, subplots, OUTPUT_DIR
+
+SPLIT_MONTH = "2021-07-01"   # first month of the late half
+MIN_PAID = 10000             # in each half
 
 
 def s13_provider_growth(con, csv: str):
     """Provider spending growth trajectories — fastest-growing and declining."""
     banner(13, "Provider Growth & Trajectory Analysis")
 
-    growth = query(con, f"""
-        WITH halves AS (
-            SELECT BILLING_PROVIDER_NPI_NUM,
-                SUM(CASE WHEN CLAIM_FROM_MONTH < '2021-07' THEN TOTAL_PAID ELSE 0 END) AS early_paid,
-                SUM(CASE WHEN CLAIM_FROM_MONTH >= '2021-07' THEN TOTAL_PAID ELSE 0 END) AS late_paid,
-                SUM(TOTAL_PAID) AS total_paid,
-                COUNT(DISTINCT CLAIM_FROM_MONTH) AS active_months
-            FROM '{csv}' GROUP BY BILLING_PROVIDER_NPI_NUM
-            HAVING early_paid > 10000 AND late_paid > 10000 AND active_months >= 12
-        )
-        SELECT *, (late_paid - early_paid) / NULLIF(early_paid, 0) * 100 AS growth_pct,
-                  late_paid - early_paid AS growth_abs
-        FROM halves ORDER BY growth_pct DESC
-    """)
+    npis, months, m = provider_months(con, csv)
+    paid = np.asarray(m["TOTAL_PAID"], dtype=np.float64)
+    early = months < pd.Timestamp(SPLIT_MONTH)
+    growth = pd.DataFrame({
+        "BILLING_PROVIDER_NPI_NUM": npis,
+        "early_paid": np.nansum(paid[:, early], axis=1),
+        "late_paid": np.nansum(paid[:, ~early], axis=1),
+        "total_paid": np.nansum(paid, axis=1),
+        "active_months": (~np.isnan(paid)).sum(axis=1),
+    })
+    # Candidates from the float32 matrix (with slack for its rounding); the thresholds
+    # and reported dollars then use exact sums from DuckDB
+    slack = MIN_PAID * 0.999
+    growth = growth[(growth["early_paid"] > slack) & (growth["late_paid"] > slack)
+                    & (growth["active_months"] >= 12)]
+    growth = exact_sums(con, csv, growth, {
+        "early_paid": f"SUM(TOTAL_PAID) FILTER (WHERE CLAIM_FROM_MONTH < DATE '{SPLIT_MONTH}')",
+        "late_paid": f"SUM(TOTAL_PAID) FILTER (WHERE CLAIM_FROM_MONTH >= DATE '{SPLIT_MONTH}')",
+        "total_paid": "SUM(TOTAL_PAID)",
+    })[["BILLING_PROVIDER_NPI_NUM", "early_paid", "late_paid", "total_paid", "active_months"]]
+    growth = growth[(growth["early_paid"] > MIN_PAID) & (growth["late_paid"] > MIN_PAID)].copy()
+    growth["growth_pct"] = (growth["late_paid"] - growth["early_paid"]) / growth["early_paid"] * 100
+    growth["growth_abs"] = growth["late_paid"] - growth["early_paid"]
+    growth = growth.sort_values("growth_pct", ascending=False).reset_index(drop=True)
     growth.to_csv(OUTPUT_DIR / "13_provider_growth.csv", index=False)
     log.info("  Providers with growth data: %d", len(growth))
     log.info("  Median growth: %.1f%%", growth["growth_pct"].median())
@@ -29,7 +43,7 @@ def s13_provider_growth(con, csv: str):
     top_growers = growth.head(20)
     top_decliners = growth.tail(20).iloc[::-1]
 
-    fig, axes = plt.subplots(1, 3, figsize=(20, 8))
+    fig, axes = subplots(1, 3, figsize=(20, 8))
     ax = axes[0]
     clipped = growth["growth_pct"].clip(-200, 500)
     ax.hist(clipped, bins=80, color="#1a73e8", alpha=0.8, edgecolor="white")
@@ -51,5 +65,5 @@ def s13_provider_growth(con, csv: str):
     ax.set_yticklabels(top_decliners["BILLING_PROVIDER_NPI_NUM"].astype(str), fontsize=7)
     ax.set_title("Top 20 Fastest-Declining Providers", fontsize=13, fontweight="bold"); ax.set_xlabel("Growth %")
 
-    fig.tight_layout(); savefig(fig, "13_provider_growth.png")
+    savefig(fig, "13_provider_growth.png", tight_layout=True)
     return growth
@@ -2,30 +2,38 @@
 
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from utils import log, banner, query, savefig, usd, OUTPUT_DIR
+from utils import (
+    log, banner, query, key_relations, provider_code, uses, PROVIDER_CODE, savefig, subplots,
+    usd, OUTPUT_DIR,
+)
 
 
+@uses(PROVIDER_CODE)
 def s27_provider_specialization(con, csv: str):
     """Provider specialization via HHI (Herfindahl–Hirschman Index)."""
     banner(27, "Provider Specialization Index (HHI)")
 
+    _, npi_dim, _ = key_relations(con, csv)
     hhi = query(con, f"""
-        WITH provider_code AS (
-            SELECT BILLING_PROVIDER_NPI_NUM, HCPCS_CODE, SUM(TOTAL_PAID) AS code_paid
-            FROM '{csv}' GROUP BY BILLING_PROVIDER_NPI_NUM, HCPCS_CODE
+        WITH cells AS (
+            SELECT billing_id, hcpcs_id, total_paid AS code_paid
+            FROM {provider_code(con, csv)}
         ), provider_total AS (
-            SELECT BILLING_PROVIDER_NPI_NUM, SUM(code_paid) AS total_paid, COUNT(DISTINCT HCPCS_CODE) AS num_codes
-            FROM provider_code GROUP BY BILLING_PROVIDER_NPI_NUM
+            SELECT billing_id, SUM(code_paid) AS total_paid, COUNT(DISTINCT hcpcs_id) AS num_codes
+            FROM cells GROUP BY billing_id
         ), provider_shares AS (
-            SELECT pc.BILLING_PROVIDER_NPI_NUM, pc.HCPCS_CODE,
+            SELECT pc.billing_id, pc.hcpcs_id,
                    (pc.code_paid / pt.total_paid) AS share, pt.total_paid, pt.num_codes
-            FROM provider_code pc JOIN provider_total pt ON pc.BILLING_PROVIDER_NPI_NUM = pt.BILLING_PROVIDER_NPI_NUM
+            FROM cells pc JOIN provider_total pt ON pc.billing_id = pt.billing_id
             WHERE pt.total_paid > 0
+        ), provider_hhi AS (
+            SELECT billing_id, SUM(share * share) AS hhi,
+                   MAX(total_paid) AS total_paid, MAX(num_codes) AS num_codes
+            FROM provider_shares GROUP BY billing_id
         )
-        SELECT BILLING_PROVIDER_NPI_NUM, SUM(share * share) AS hhi,
-               MAX(total_paid) AS total_paid, MAX(num_codes) AS num_codes
-        FROM provider_shares GROUP BY BILLING_PROVIDER_NPI_NUM
+        SELECT d.npi AS BILLING_PROVIDER_NPI_NUM, h.hhi, h.total_paid, h.num_codes
+        FROM provider_hhi h LEFT JOIN {npi_dim} d ON h.billing_id = d.npi_id
+        ORDER BY d.npi
     """)
     hhi["specialization"] = pd.cut(hhi["hhi"], bins=[0, 0.15, 0.25, 0.5, 1.01],
                                    labels=["Diversified", "Moderate", "Concentrated", "Specialist"])
@@ -38,7 +46,7 @@ def s27_provider_specialization(con, csv: str):
     log.info("  Mean HHI: %.4f", hhi["hhi"].mean())
     log.info("  Specialists (HHI>0.5): %.1f%%", (hhi["hhi"] > 0.5).mean() * 100)
 
-    fig, axes = plt.subplots(1, 3, figsize=(20, 7))
+    fig, axes = subplots(1, 3, figsize=(20, 7))
     ax = axes[0]
     ax.hist(hhi["hhi"], bins=50, color="#9334e6", edgecolor="white", alpha=0.85)
     ax.axvline(0.25, color="red", linestyle="--", label="HHI=0.25 (concentrated)")
@@ -52,5 +60,5 @@ def s27_provider_specialization(con, csv: str):
     ax.scatter(sample["hhi"], sample["total_paid"], alpha=0.15, s=3, color="#1a73e8"); ax.set_yscale("log")
     ax.set_title("HHI vs Total Paid", fontsize=13, fontweight="bold"); ax.set_xlabel("HHI (Specialization)"); ax.set_ylabel("Total Paid (USD, log)"); usd(ax)
     fig.suptitle("Provider Specialization (HHI)", fontsize=15, fontweight="bold", y=1.02)
-    fig.tight_layout(); savefig(fig, "27_specialization.png")
+    savefig(fig, "27_specialization.png", tight_layout=True)
     return hhi
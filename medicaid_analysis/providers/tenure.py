@@ -1,25 +1,26 @@
 """Providers — Tenure & Longevity (Section 24)."""
 
 import pandas as pd
-import matplotlib.pyplot as plt
-from utils import log, banner, query, savefig, usd, OUTPUT_DIR
+from utils import (
+    log, banner, query, provider_summary, uses, PROVIDER_SUMMARY, savefig, subplots, usd,
+    OUTPUT_DIR,
+)
 
 
+@uses(PROVIDER_SUMMARY)
 def s24_provider_tenure(con, csv: str):
     """Provider tenure and longevity — new vs established providers."""
     banner(24, "Provider Tenure & Longevity")
 
     tenure = query(con, f"""
         SELECT BILLING_PROVIDER_NPI_NUM,
-               MIN(CLAIM_FROM_MONTH) AS first_month, MAX(CLAIM_FROM_MONTH) AS last_month,
-               COUNT(DISTINCT CLAIM_FROM_MONTH) AS active_months,
-               SUM(TOTAL_PAID) AS total_paid, SUM(TOTAL_CLAIMS) AS total_claims,
-               COUNT(DISTINCT HCPCS_CODE) AS procedure_count
-        FROM '{csv}' GROUP BY BILLING_PROVIDER_NPI_NUM
+               first_month, last_month,
+               active_months,
+               total_paid, total_claims,
+               n_codes AS procedure_count
+        FROM {provider_summary(con, csv)}
     """)
-    tenure["first_dt"] = pd.to_datetime(tenure["first_month"])
-    tenure["last_dt"] = pd.to_datetime(tenure["last_month"])
-    tenure["tenure_months"] = ((tenure["last_dt"] - tenure["first_dt"]).dt.days / 30.44).round().astype(int)
+    tenure["tenure_months"] = ((tenure["last_month"] - tenure["first_month"]).dt.days / 30.44).round().astype(int)
     tenure["activity_rate"] = tenure["active_months"] / tenure["tenure_months"].clip(lower=1)
     tenure["avg_monthly_paid"] = tenure["total_paid"] / tenure["active_months"].clip(lower=1)
     tenure["cohort"] = pd.cut(tenure["tenure_months"], bins=[0, 6, 12, 24, 48, 200],
@@ -38,7 +39,7 @@ def s24_provider_tenure(con, csv: str):
     log.info("  Avg tenure: %.1f months", tenure["tenure_months"].mean())
     log.info("  Avg activity rate: %.2f", tenure["activity_rate"].mean())
 
-    fig, axes = plt.subplots(2, 2, figsize=(16, 12))
+    fig, axes = subplots(2, 2, figsize=(16, 12))
     fig.suptitle("Provider Tenure & Longevity", fontsize=16, fontweight="bold", y=1.01)
     ax = axes[0, 0]
     ax.hist(tenure["tenure_months"].clip(upper=84), bins=42, color="#1a73e8", edgecolor="white", alpha=0.85)
@@ -57,5 +58,5 @@ def s24_provider_tenure(con, csv: str):
     ax.hist(tenure["activity_rate"].clip(upper=1), bins=50, color="#34a853", edgecolor="white", alpha=0.85)
     ax.set_title("Provider Activity Rate (active/tenure months)", fontsize=13, fontweight="bold")
     ax.set_xlabel("Activity Rate"); ax.set_ylabel("Provider Count")
-    fig.tight_layout(); savefig(fig, "24_provider_tenure.png")
+    savefig(fig, "24_provider_tenure.png", tight_layout=True)
     return tenure
@@ -5,13 +5,23 @@ Multi-Scale Analysis Runner
 Runs the full analysis pipeline at 1%, 10%, 50%, and 100% data scales,
 outputting into percentage-based subfolders under `output/`.
 
+The full CSV is ingested once; samples are drawn from that typed Parquet copy and
+ingested with its NPI / HCPCS dimension tables, so no run re-parses a CSV. Scales
+then run concurrently as far as memory allows, each main.py capped to a DuckDB
+memory_limit / threads budget carved out of the machine, and a table comparing
+their timings is written to `output/multi_scale_timings.csv`.
+
 Usage:
     uv run run_multi_scale.py                     # Run all 4 scales
     uv run run_multi_scale.py --scales 1 10       # Run only 1% and 10%
     uv run run_multi_scale.py --skip-fraud        # Pass --skip-fraud to each run
+    uv run run_multi_scale.py --max-parallel 1    # One scale at a time
+    uv run run_multi_scale.py --memory-gb 24      # Budget 24 GB across concurrent runs
 """
 
 import argparse
+import csv
+import json
 import os
 import subprocess
 import sys
@@ -19,9 +29,14 @@ import time
 import logging
 from pathlib import Path
 
+from create_sample import sample_path
+from utils.ingest import cache_path, ingest
+from utils.manifest import JOURNAL_PATH
+
 BASE_DIR = Path(__file__).resolve().parent
 DATA_DIR = BASE_DIR.parent / "data"
 OUTPUT_ROOT = BASE_DIR / "output"
+TIMINGS_CSV = OUTPUT_ROOT / "multi_scale_timings.csv"
 
 logging.basicConfig(
     level=logging.INFO,
@@ -31,73 +46,220 @@ logging.basicConfig(
 log = logging.getLogger("multi_scale")
 
 # ── Scale definitions ──────────────────────────────────────────────────────
+FULL_CSV = DATA_DIR / "medicaid-provider-spending.csv"
 SCALES = {
-    1:   {"csv": DATA_DIR / "sample.csv",                  "label": "1pct"},
-    10:  {"csv": DATA_DIR / "sample_10pct.csv",            "label": "10pct"},
-    50:  {"csv": DATA_DIR / "sample_50pct.csv",            "label": "50pct"},
-    100: {"csv": DATA_DIR / "medicaid-provider-spending.csv", "label": "100pct"},
+    1:   {"label": "1pct"},
+    10:  {"label": "10pct"},
+    50:  {"label": "50pct"},
+    100: {"label": "100pct"},
 }
 
+# ── Resource budgets ───────────────────────────────────────────────────────
+RAM_FRACTION    = 0.8       # share of physical memory the concurrent runs may use together
+MIN_RUN_MEMORY  = 1 << 30   # smallest memory_limit given to a run
+MEMORY_PER_BYTE = {".csv": 1.0, ".parquet": 4.0}   # DuckDB working memory per input byte (rough)
+POLL_SECONDS    = 1.0
 
-def ensure_sample(pct: int):
-    """Create the sample CSV if it does not exist."""
-    info = SCALES[pct]
-    csv_path = info["csv"]
-    if csv_path.exists():
-        size_mb = csv_path.stat().st_size / (1024 * 1024)
-        log.info("  Sample %d%% already exists: %s (%.0f MB)", pct, csv_path.name, size_mb)
-        return True
 
+def scale_path(pct: int) -> Path:
+    """Dataset for a scale: the full CSV, a nested Parquet sample, or a legacy CSV sample."""
     if pct == 100:
-        log.error("  Full dataset not found: %s", csv_path)
-        return False
+        return FULL_CSV
+    parquet = sample_path(pct)
+    return parquet if parquet.exists() else sample_path(pct, "csv")
+
+
+def ingest_full(scales: list[int]):
+    """The full dataset's ingested Parquet copy, built now if any scale needs it; else None.
+
+    It is needed by the 100% run and to draw missing samples; otherwise an existing
+    copy is still used for its dimension tables.
+    """
+    if not FULL_CSV.exists():
+        return None
+    missing = [pct for pct in scales if pct != 100 and not sample_path(pct).exists()]
+    if 100 not in scales and not missing and not cache_path(FULL_CSV).exists():
+        return None
+    return ingest(FULL_CSV)
+
 
-    # Generate via create_sample.py
-    log.info("  Creating %d%% sample...", pct)
+def ensure_samples(scales: list[int], source: Path = None) -> dict:
+    """Create missing samples for ``scales`` in one create_sample.py pass; returns ok per scale.
+
+    Scales without a Parquet sample are (re)created together, so the samples stay
+    nested even where an older CSV sample exists. ``source`` is the full CSV or its
+    ingested copy, which is read instead of parsing the CSV again.
+    """
+    ok = {}
+    if 100 in scales:
+        ok[100] = FULL_CSV.exists()
+        if not ok[100]:
+            log.error("  Full dataset not found: %s", FULL_CSV)
+    missing = [pct for pct in scales if pct != 100 and not sample_path(pct).exists()]
+    for pct in scales:
+        if pct != 100 and pct not in missing:
+            size_mb = sample_path(pct).stat().st_size / (1024 * 1024)
+            log.info("  Sample %d%% already exists: %s (%.0f MB)", pct, sample_path(pct).name, size_mb)
+            ok[pct] = True
+    if not missing:
+        return ok
+
+    # Generate via create_sample.py, one pass over the full dataset
+    log.info("  Creating %s samples...", ", ".join(f"{pct}%" for pct in missing))
     result = subprocess.run(
-        [sys.executable, str(BASE_DIR / "create_sample.py"), "--pct", str(pct)],
+        [sys.executable, str(BASE_DIR / "create_sample.py"), "--pct", *map(str, missing),
+         "--source", str(source or FULL_CSV)],
         cwd=str(BASE_DIR),
     )
     if result.returncode != 0:
-        log.error("  Failed to create %d%% sample", pct)
-        return False
+        log.error("  Failed to create samples")
+    for pct in missing:
+        path = sample_path(pct)
+        ok[pct] = path.exists()
+        if ok[pct]:
+            log.info("  ✓ Created %s (%.0f MB)", path.name, path.stat().st_size / (1024 * 1024))
+        elif result.returncode == 0:
+            log.error("  Sample file not created at expected path: %s", path)
+    return ok
 
-    if not csv_path.exists():
-        log.error("  Sample file not created at expected path: %s", csv_path)
-        return False
-    size_mb = csv_path.stat().st_size / (1024 * 1024)
-    log.info("  ✓ Created %s (%.0f MB)", csv_path.name, size_mb)
-    return True
 
+def share_dimensions(scales: list[int], full: Path) -> dict:
+    """Ingest each Parquet sample with the full dataset's dimension tables; returns the data per scale.
 
-def run_pipeline(pct: int, extra_args: list[str] | None = None):
-    """Run the full pipeline for a given scale."""
-    info = SCALES[pct]
-    csv_path = info["csv"]
-    label = info["label"]
+    A sample that cannot be ingested (e.g. drawn from another dataset) is analysed as-is.
+    """
+    data = {}
+    for pct in scales:
+        path = scale_path(pct)
+        data[pct] = full if pct == 100 else path
+        if pct != 100 and path.suffix == ".parquet":
+            try:
+                data[pct] = ingest(path, dims=full)
+            except ValueError as e:
+                log.warning("  %s", e)
+    return data
+
+
+def machine_budget(memory_gb: float = None) -> tuple:
+    """``(memory bytes, cores)`` the concurrent runs may use together."""
+    if memory_gb:
+        memory = memory_gb * 2**30
+    else:
+        memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") * RAM_FRACTION
+    return int(memory), os.cpu_count() or 1
 
-    output_dir = OUTPUT_ROOT / label
-    plots_dir = BASE_DIR / "plots" / label
 
-    log.info("─" * 72)
-    log.info("SCALE: %d%%  →  output/%s", pct, label)
-    log.info("─" * 72)
+def memory_need(data: Path, budget: int) -> int:
+    """Estimated DuckDB memory for a run on ``data``, between ``MIN_RUN_MEMORY`` and ``budget``."""
+    if data.is_dir():
+        size, factor = sum(f.stat().st_size for f in data.rglob("*.parquet")), MEMORY_PER_BYTE[".parquet"]
+    else:
+        size, factor = data.stat().st_size, MEMORY_PER_BYTE.get(data.suffix, 1.0)
+    return int(min(budget, max(MIN_RUN_MEMORY, size * factor)))
+
+
+def launch(pct: int, memory: int, threads: int, extra_args: list[str] | None = None):
+    """Start main.py for a scale within a DuckDB budget; returns ``(process, log path)``."""
+    label = SCALES[pct]["label"]
+    output_dir = OUTPUT_ROOT / label
+    output_dir.mkdir(parents=True, exist_ok=True)
+    log_path = output_dir / "pipeline.log"
 
     env = os.environ.copy()
     env["MEDICAID_OUTPUT_DIR"] = str(output_dir)
-    env["MEDICAID_PLOTS_DIR"] = str(plots_dir)
+    env["MEDICAID_PLOTS_DIR"] = str(BASE_DIR / "plots" / label)
+    env["MEDICAID_MEMORY_LIMIT"] = f"{memory // 2**20}MB"
+    env["MEDICAID_THREADS"] = str(threads)
 
-    cmd = [sys.executable, str(BASE_DIR / "main.py"), "--csv", str(csv_path)]
+    cmd = [sys.executable, str(BASE_DIR / "main.py"), "--csv", str(scale_path(pct))]
     if extra_args:
         cmd.extend(extra_args)
+    log.info("  ▶ %d%% started: %.1f GB, %d thread(s) → output/%s/%s",
+             pct, memory / 2**30, threads, label, log_path.name)
+    with open(log_path, "w") as out:
+        process = subprocess.Popen(cmd, cwd=str(BASE_DIR), env=env, stdout=out, stderr=subprocess.STDOUT)
+    return process, log_path
+
+
+def run_scales(needs: dict, budget: int, cores: int, max_parallel: int = 0,
+               extra_args: list[str] | None = None) -> dict:
+    """Run main.py for every scale in ``needs`` ({pct: memory bytes}); returns ``{pct: (ok, seconds)}``.
+
+    Scales start largest first whenever their memory fits in what the running ones
+    leave (one always runs, even if it needs the whole budget); the cores still free
+    are split among the scales starting together in proportion to their memory.
+    """
+    pending = sorted(needs, key=lambda pct: (-needs[pct], -pct))
+    running, results = {}, {}
+    free_memory, free_cores = budget, cores
+    while pending or running:
+        starting, room = [], free_memory
+        for pct in pending:
+            if max_parallel and len(running) + len(starting) >= max_parallel:
+                break
+            if needs[pct] <= room or not (running or starting):
+                starting.append(pct)
+                room -= needs[pct]
+        total = sum(needs[pct] for pct in starting)
+        for pct in starting:
+            pending.remove(pct)
+            threads = max(1, int(free_cores * needs[pct] / total))
+            process, log_path = launch(pct, needs[pct], threads, extra_args)
+            running[pct] = (process, log_path, time.time(), threads)
+            free_memory -= needs[pct]
+            free_cores -= min(threads, free_cores)
+        time.sleep(POLL_SECONDS)
+        for pct, (process, log_path, t0, threads) in list(running.items()):
+            if process.poll() is None:
+                continue
+            del running[pct]
+            free_memory += needs[pct]
+            free_cores += threads
+            ok = process.returncode == 0
+            results[pct] = (ok, time.time() - t0)
+            log.info("  %s  %d%% completed in %.1f minutes", "✓ PASSED" if ok else "✗ FAILED",
+                     pct, results[pct][1] / 60)
+            if not ok:
+                for line in log_path.read_text().splitlines()[-15:]:
+                    log.error("    %s", line)
+    return results
 
-    t0 = time.time()
-    result = subprocess.run(cmd, cwd=str(BASE_DIR), env=env)
-    elapsed = time.time() - t0
 
-    status = "✓ PASSED" if result.returncode == 0 else "✗ FAILED"
-    log.info("  %s  %d%% completed in %.1f minutes", status, pct, elapsed / 60)
-    return result.returncode == 0
+def section_times(pct: int) -> dict:
+    """Seconds per section of a scale's last run, from its run journal."""
+    path = OUTPUT_ROOT / SCALES[pct]["label"] / JOURNAL_PATH.name
+    try:
+        events = [json.loads(line) for line in path.read_text().splitlines()]
+    except (OSError, ValueError):
+        return {}
+    return {e["section"]: e["seconds"] for e in events if e["event"] == "completed"}
+
+
+def write_timing_table(results: dict, path: Path = TIMINGS_CSV) -> list:
+    """Write seconds per section (rows) and scale (columns) plus each run's wall time; returns the rows.
+
+    Sections a run reused from its previous outputs are left empty.
+    """
+    scales = sorted(results)
+    times = {pct: section_times(pct) for pct in scales}
+    sections = sorted({num for t in times.values() for num in t})
+    rows = [["section", *(f"{pct}%" for pct in scales)]]
+    rows += [[f"S{num:02d}", *(times[pct].get(num, "") for pct in scales)] for num in sections]
+    rows.append(["sections total", *(round(sum(times[pct].values()), 2) for pct in scales)])
+    rows.append(["wall", *(round(results[pct][1], 2) for pct in scales)])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", newline="") as f:
+        csv.writer(f).writerows(rows)
+
+    log.info("  %-6s %10s %10s %8s  %s", "Scale", "Wall", "Sections", "vs min", "Slowest section")
+    smallest = min((results[pct][1] for pct in scales), default=0) or 1e-9
+    for pct in scales:
+        slowest = max(times[pct], key=times[pct].get, default=None)
+        log.info("  %5d%% %9.1fs %9.1fs %7.1f×  %s", pct, results[pct][1], sum(times[pct].values()),
+                 results[pct][1] / smallest,
+                 f"S{slowest:02d} ({times[pct][slowest]:.1f}s)" if slowest else "—")
+    log.info("  Per-section timings: %s", path.relative_to(BASE_DIR) if path.is_relative_to(BASE_DIR) else path)
+    return rows
 
 
 def main():
@@ -106,28 +268,41 @@ def main():
                         help="Percentage scales to run (default: 1 10 50 100)")
     parser.add_argument("--skip-fraud", action="store_true",
                         help="Pass --skip-fraud to each pipeline run")
+    parser.add_argument("--max-parallel", type=int, default=0, metavar="N",
+                        help="Run at most N scales at once (default: as many as memory allows)")
+    parser.add_argument("--memory-gb", type=float, default=None, metavar="GB",
+                        help=f"Memory shared by concurrent runs (default: {RAM_FRACTION:.0%} of RAM)")
     args = parser.parse_args()
 
     log.info("=" * 72)
     log.info("MULTI-SCALE ANALYSIS RUNNER")
-    log.info("Scales: %s", ", ".join(f"{s}%%" for s in args.scales))
+    log.info("Scales: %s", ", ".join(f"{s}%" for s in args.scales))
     log.info("=" * 72)
 
     t_start = time.time()
     results = {}
-
     for pct in args.scales:
         if pct not in SCALES:
             log.error("Unknown scale: %d%%  (valid: %s)", pct, list(SCALES.keys()))
-            results[pct] = False
-            continue
+            results[pct] = (False, 0.0)
+    scales = [pct for pct in args.scales if pct in SCALES]
 
-        if not ensure_sample(pct):
-            results[pct] = False
-            continue
+    # ── Shared inputs: one ingest of the full CSV, samples drawn from it ──
+    full = ingest_full(scales)
+    available = ensure_samples(scales, full)
+    for pct in scales:
+        if not available[pct]:
+            results[pct] = (False, 0.0)
+    scales = [pct for pct in scales if available[pct]]
+    data = share_dimensions(scales, full) if full else {pct: scale_path(pct) for pct in scales}
 
-        extra = ["--skip-fraud"] if args.skip_fraud else None
-        results[pct] = run_pipeline(pct, extra)
+    # ── Concurrent runs within the machine's memory ───────────────────────
+    budget, cores = machine_budget(args.memory_gb)
+    needs = {pct: memory_need(data[pct], budget) for pct in scales}
+    log.info("Budget: %.1f GB, %d cores for %d run(s)", budget / 2**30, cores, len(scales))
+    extra = ["--skip-fraud"] if args.skip_fraud else None
+    ran = run_scales(needs, budget, cores, args.max_parallel, extra)
+    results.update(ran)
 
     # ── Summary ──────────────────────────────────────────────────────────
     elapsed = time.time() - t_start
@@ -135,12 +310,15 @@ def main():
     log.info("=" * 72)
     log.info("MULTI-SCALE SUMMARY — %.1f minutes total", elapsed / 60)
     log.info("=" * 72)
-    for pct, ok in results.items():
+    for pct, (ok, _) in results.items():
         status = "✓ PASSED" if ok else "✗ FAILED"
-        log.info("  %3d%%  %s  →  output/%s/", pct, status, SCALES[pct]["label"])
+        label = SCALES[pct]["label"] if pct in SCALES else "—"
+        log.info("  %3d%%  %s  →  output/%s/", pct, status, label)
+    if ran:
+        write_timing_table(ran)
     log.info("=" * 72)
 
-    return 0 if all(results.values()) else 1
+    return 0 if all(ok for ok, _ in results.values()) else 1
 
 
 if __name__ == "__main__":
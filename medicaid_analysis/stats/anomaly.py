@@ -1,15 +1,17 @@
 """Statistics — Anomaly Detection (Section 6)."""
 
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
 import seaborn as sns
 from sklearn.preprocessing import StandardScaler
 from sklearn.ensemble import IsolationForest
-from utils import log, banner, query, savefig, usd, OUTPUT_DIR
+from utils import (
+    log, banner, query, provider_summary, uses, PROVIDER_SUMMARY, savefig, subplots, usd,
+    OUTPUT_DIR,
+)
 
 
-def s06_anomaly_detection(con, csv: str, cost_df: pd.DataFrame):
+@uses(PROVIDER_SUMMARY)
+def s06_anomaly_detection(con, csv: str):
     """Statistical anomaly detection using z-scores and Isolation Forest."""
     banner(6, "Anomaly Detection")
 
@@ -17,7 +19,7 @@ def s06_anomaly_detection(con, csv: str, cost_df: pd.DataFrame):
     anomalies_z = query(con, f"""
         WITH per_row AS (
             SELECT *, TOTAL_PAID / NULLIF(TOTAL_UNIQUE_BENEFICIARIES, 0) AS cpb
-            FROM '{csv}' WHERE TOTAL_UNIQUE_BENEFICIARIES > 10
+            FROM {csv} WHERE TOTAL_UNIQUE_BENEFICIARIES > 10
         ),
         stats AS (
             SELECT HCPCS_CODE, AVG(cpb) AS avg_cpb, STDDEV(cpb) AS std_cpb, COUNT(*) AS n
@@ -37,13 +39,14 @@ def s06_anomaly_detection(con, csv: str, cost_df: pd.DataFrame):
     log.info("  6b. Isolation Forest on provider-level aggregates...")
     provider_agg = query(con, f"""
         SELECT BILLING_PROVIDER_NPI_NUM,
-               SUM(TOTAL_PAID) AS total_paid, SUM(TOTAL_CLAIMS) AS total_claims,
-               SUM(TOTAL_UNIQUE_BENEFICIARIES) AS total_bene,
-               COUNT(DISTINCT HCPCS_CODE) AS procedure_count,
-               COUNT(DISTINCT CLAIM_FROM_MONTH) AS active_months,
-               AVG(TOTAL_PAID / NULLIF(TOTAL_CLAIMS, 0)) AS avg_cost_per_claim
-        FROM '{csv}' WHERE TOTAL_CLAIMS > 0
-        GROUP BY BILLING_PROVIDER_NPI_NUM HAVING total_paid > 1000
+               total_paid_claimed AS total_paid, total_claims_claimed AS total_claims,
+               total_bene_claimed AS total_bene,
+               n_codes_claimed AS procedure_count,
+               active_months_claimed AS active_months,
+               avg_cpc AS avg_cost_per_claim
+        FROM {provider_summary(con, csv)}
+        WHERE rows_claimed > 0 AND total_paid_claimed > 1000
+        ORDER BY BILLING_PROVIDER_NPI_NUM
     """)
 
     features = ["total_paid", "total_claims", "total_bene", "procedure_count",
@@ -61,7 +64,7 @@ def s06_anomaly_detection(con, csv: str, cost_df: pd.DataFrame):
     log.info("    Isolation Forest anomalies: %d / %d providers (%.1f%%)",
              len(anomalies_if), len(provider_agg), 100 * len(anomalies_if) / len(provider_agg))
 
-    fig, ax = plt.subplots(figsize=(12, 8))
+    fig, ax = subplots(figsize=(12, 8))
     normal = provider_agg[provider_agg["anomaly_label"] == "normal"]
     anom = provider_agg[provider_agg["anomaly_label"] == "anomaly"]
     ax.scatter(normal["total_claims"], normal["total_paid"], alpha=0.3, s=5, color="#aaa", label="Normal")
@@ -69,15 +72,15 @@ def s06_anomaly_detection(con, csv: str, cost_df: pd.DataFrame):
     ax.set_title("Provider Anomaly Detection (Isolation Forest)", fontsize=14, fontweight="bold")
     ax.set_xlabel("Total Claims"); ax.set_ylabel("Total Paid (USD)")
     ax.set_xscale("log"); ax.set_yscale("log"); usd(ax); ax.legend(fontsize=11)
-    fig.tight_layout(); savefig(fig, "06_anomaly_scatter.png")
+    savefig(fig, "06_anomaly_scatter.png", tight_layout=True)
 
     if len(anomalies_z) > 0:
         anom_by = anomalies_z.groupby("HCPCS_CODE").size().reset_index(name="count") \
                     .sort_values("count", ascending=False).head(15)
-        fig, ax = plt.subplots(figsize=(10, 6))
+        fig, ax = subplots(figsize=(10, 6))
         sns.barplot(data=anom_by.iloc[::-1], y="HCPCS_CODE", x="count", ax=ax, palette="Reds_r")
         ax.set_title("HCPCS Codes with Most Z-score Anomalies", fontsize=13, fontweight="bold")
         ax.set_xlabel("Count of Anomalous Provider Entries")
-        fig.tight_layout(); savefig(fig, "06_zscore_by_procedure.png")
+        savefig(fig, "06_zscore_by_procedure.png", tight_layout=True)
 
     return anomalies_z, anomalies_if
@@ -2,9 +2,8 @@
 
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 from scipy import stats as scipy_stats
-from utils import log, banner, query, savefig, OUTPUT_DIR
+from utils import log, banner, query, savefig, subplots, OUTPUT_DIR
 
 
 def s31_benfords_law(con, csv: str):
@@ -15,7 +14,7 @@ def s31_benfords_law(con, csv: str):
         SELECT
             CAST(SUBSTR(CAST(CAST(ABS(FLOOR(TOTAL_PAID)) AS BIGINT) AS VARCHAR), 1, 1) AS INTEGER) AS first_digit,
             COUNT(*) AS observed_count
-        FROM '{csv}'
+        FROM {csv}
         WHERE TOTAL_PAID >= 10
         GROUP BY first_digit
         HAVING first_digit BETWEEN 1 AND 9
@@ -43,7 +42,7 @@ def s31_benfords_law(con, csv: str):
     log.info("  Chi-squared: %.2f (p=%.4f)", chi2, p_value)
     log.info("  MAD: %.4f (%s)", mad, benford_stats.iloc[3]["value"])
 
-    fig, axes = plt.subplots(1, 3, figsize=(20, 6))
+    fig, axes = subplots(1, 3, figsize=(20, 6))
     fig.suptitle("Benford's Law Analysis (First-Digit Distribution)", fontsize=15, fontweight="bold", y=1.02)
     digits = first_digits["first_digit"].values.astype(str)
 
@@ -72,5 +71,5 @@ def s31_benfords_law(con, csv: str):
     ax.set_title(f"Q-Q: Observed vs Benford (MAD={mad:.2f})", fontsize=13, fontweight="bold")
     ax.set_xlabel("Observed %"); ax.set_ylabel("Benford Expected %")
 
-    fig.tight_layout(); savefig(fig, "31_benfords_law.png")
+    savefig(fig, "31_benfords_law.png", tight_layout=True)
     return first_digits
@@ -3,16 +3,21 @@
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-from utils import log, banner, query, savefig, usd, OUTPUT_DIR
+from utils import (
+    log, banner, query, provider_summary, uses, PROVIDER_SUMMARY, savefig, subplots, usd,
+    sample_design, estimate_totals, weighted_gini, bootstrap_interval, perturbed_estimate,
+    OUTPUT_DIR,
+)
 
 
+@uses(PROVIDER_SUMMARY)
 def s08_concentration(con, csv: str):
     """Provider and procedure market concentration (Lorenz / Gini / HHI)."""
     banner(8, "Market Concentration Analysis")
 
     prov_spend = query(con, f"""
-        SELECT BILLING_PROVIDER_NPI_NUM, SUM(TOTAL_PAID) AS total_paid
-        FROM '{csv}' GROUP BY BILLING_PROVIDER_NPI_NUM ORDER BY total_paid
+        SELECT BILLING_PROVIDER_NPI_NUM, total_paid
+        FROM {provider_summary(con, csv)} ORDER BY total_paid
     """)
     prov_vals = prov_spend["total_paid"].values
     prov_cum = np.cumsum(prov_vals) / prov_vals.sum()
@@ -30,7 +35,7 @@ def s08_concentration(con, csv: str):
 
     proc_spend = query(con, f"""
         SELECT HCPCS_CODE, SUM(TOTAL_PAID) AS total_paid
-        FROM '{csv}' GROUP BY HCPCS_CODE ORDER BY total_paid
+        FROM {csv} GROUP BY HCPCS_CODE ORDER BY total_paid
     """)
     proc_vals = proc_spend["total_paid"].values
     proc_cum = np.cumsum(proc_vals) / proc_vals.sum()
@@ -44,8 +49,12 @@ def s08_concentration(con, csv: str):
         "value": [gini, proc_gini, top10_share, top100_share],
     })
     conc.to_csv(OUTPUT_DIR / "08_concentration_metrics.csv", index=False)
+    design = sample_design(con)
+    if design is not None:
+        estimates = concentration_estimates(con, csv, design, prov_vals, conc)
+        estimates.to_csv(OUTPUT_DIR / "08_concentration_estimates.csv", index=False)
 
-    fig, axes = plt.subplots(1, 2, figsize=(14, 6))
+    fig, axes = subplots(1, 2, figsize=(14, 6))
     fig.suptitle("Spending Concentration (Lorenz Curves)", fontsize=15, fontweight="bold", y=1.02)
     for ax, pct, cum, label, g in [
         (axes[0], prov_pct, prov_cum, "Provider", gini),
@@ -56,18 +65,49 @@ def s08_concentration(con, csv: str):
         ax.fill_between(pct, cum, pct, alpha=0.15, color="#1a73e8")
         ax.set_title(f"{label} Concentration (Gini={g:.3f})", fontsize=13, fontweight="bold")
         ax.set_xlabel(f"Cumulative % of {label}s"); ax.set_ylabel("Cumulative % of Spending"); ax.legend()
-    fig.tight_layout(); savefig(fig, "08_lorenz_curves.png")
+    savefig(fig, "08_lorenz_curves.png", tight_layout=True)
     return conc
 
 
+def concentration_estimates(con, csv: str, design, prov_vals, conc: pd.DataFrame) -> pd.DataFrame:
+    """Full-dataset Gini coefficients with 95% intervals.
+
+    The provider Gini needs whole providers, i.e. a ``--by provider`` sample; it is
+    bootstrapped over the sampled providers. The procedure Gini is taken over the
+    estimated code totals, corrected for their sampling errors. Top-N shares
+    depend on providers a sample may have missed and are not estimated.
+    """
+    sample = dict(zip(conc["metric"], conc["value"]))
+    rows = []
+    if design.unit == "BILLING_PROVIDER_NPI_NUM":
+        weights = np.full(len(prov_vals), 100.0 / design.pct)
+        low, high = bootstrap_interval(weighted_gini, prov_vals, weights)
+        rows.append(("provider_gini", weighted_gini(prov_vals, weights), low, high, "bootstrap"))
+    else:
+        rows.append(("provider_gini", np.nan, np.nan, np.nan, "needs a provider sample"))
+
+    codes = estimate_totals(con, csv, design, {"total_paid": "TOTAL_PAID"}, by={"code": "HCPCS_CODE"})
+    totals, se = codes["total_paid"].to_numpy(), codes["total_paid_se"].to_numpy()
+    rows.append(("procedure_gini", *perturbed_estimate(weighted_gini, totals, se), "perturbed totals"))
+    for metric in ("top10_provider_share", "top100_provider_share"):
+        rows.append((metric, np.nan, np.nan, np.nan, "not estimable from a sample"))
+
+    estimates = pd.DataFrame(rows, columns=["metric", "estimate", "ci_low", "ci_high", "method"])
+    estimates.insert(1, "sample_value", estimates["metric"].map(sample))
+    for row in estimates.dropna(subset="estimate").itertuples():
+        log.info("  %s (population, %s sample): %.4f [%.4f – %.4f]",
+                 row.metric, design.describe(), row.estimate, row.ci_low, row.ci_high)
+    return estimates
+
+
+@uses(PROVIDER_SUMMARY)
 def s18_spending_deciles(con, csv: str):
     """Spending inequality via provider decile analysis."""
     banner(18, "Spending Decile & Inequality Analysis")
 
     prov = query(con, f"""
-        SELECT BILLING_PROVIDER_NPI_NUM, SUM(TOTAL_PAID) AS total_paid,
-               SUM(TOTAL_CLAIMS) AS total_claims
-        FROM '{csv}' GROUP BY BILLING_PROVIDER_NPI_NUM HAVING total_paid > 0
+        SELECT BILLING_PROVIDER_NPI_NUM, total_paid, total_claims
+        FROM {provider_summary(con, csv)} WHERE total_paid > 0
     """)
 
     prov["decile"] = pd.qcut(prov["total_paid"], 10, labels=[f"D{i}" for i in range(1, 11)])
@@ -82,7 +122,7 @@ def s18_spending_deciles(con, csv: str):
     log.info("  Top decile (D10): %.1f%% of total spending", decile_summary.iloc[-1]["pct_of_total"])
     log.info("  Bottom decile (D1): %.1f%% of total spending", decile_summary.iloc[0]["pct_of_total"])
 
-    fig, axes = plt.subplots(1, 3, figsize=(20, 7))
+    fig, axes = subplots(1, 3, figsize=(20, 7))
     ax = axes[0]
     ax.bar(decile_summary["decile"].astype(str), decile_summary["pct_of_total"],
            color=plt.cm.RdYlGn_r(np.linspace(0, 1, 10)), edgecolor="white")
@@ -104,5 +144,5 @@ def s18_spending_deciles(con, csv: str):
     ax.set_xlabel("Decile"); ax.set_ylabel("Avg Paid (USD, log)"); usd(ax)
 
     fig.suptitle("Provider Spending Inequality", fontsize=15, fontweight="bold", y=1.02)
-    fig.tight_layout(); savefig(fig, "18_spending_deciles.png")
+    savefig(fig, "18_spending_deciles.png", tight_layout=True)
     return decile_summary
@@ -4,33 +4,34 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from scipy import stats as scipy_stats
-from utils import log, banner, savefig, OUTPUT_DIR
+from utils import log, banner, query, cost_metrics, savefig, OUTPUT_DIR
 
+METRICS = ["TOTAL_PAID", "TOTAL_CLAIMS", "cost_per_claim", "cost_per_beneficiary"]
+TEST_ROWS = 50_000   # normality tests and Q-Q plots run on a sample this size
+QQ_ROWS = 10_000
 
-def s17_statistical_tests(con, csv: str, cost_df: pd.DataFrame):
+
+def s17_statistical_tests(con, csv: str):
     """Statistical distribution tests — skewness, kurtosis, normality."""
     banner(17, "Statistical Distribution Tests")
 
-    metrics = {
-        "TOTAL_PAID": cost_df["TOTAL_PAID"],
-        "TOTAL_CLAIMS": cost_df["TOTAL_CLAIMS"],
-        "cost_per_claim": cost_df["cost_per_claim"],
-        "cost_per_beneficiary": cost_df["cost_per_beneficiary"],
-    }
+    costs = cost_metrics(con, csv)
+    moments = query(con, "SELECT " + ", ".join(
+        f"COUNT({m}) AS {m}_n, SKEWNESS({m}) AS {m}_skew, KURTOSIS({m}) AS {m}_kurt, "
+        f"SKEWNESS(LN(1 + CASE WHEN {m} > 0 THEN {m} END)) AS {m}_log_skew" for m in METRICS
+    ) + f" FROM {costs}").iloc[0]
+    sample = query(con, f"""
+        SELECT {', '.join(METRICS)} FROM {costs}
+        USING SAMPLE reservoir({TEST_ROWS} ROWS) REPEATABLE (42)
+    """)
 
     results = []
-    for name, vals in metrics.items():
-        v = vals.dropna()
-        n = len(v)
-        skew = float(v.skew())
-        kurt = float(v.kurtosis())
-        sample = v.sample(n=min(50_000, n), random_state=42).values
+    for name in METRICS:
+        n, skew, kurt, log_skew = (moments[f"{name}_{k}"] for k in ("n", "skew", "kurt", "log_skew"))
         try:
-            _, p_normal = scipy_stats.normaltest(sample)
+            _, p_normal = scipy_stats.normaltest(sample[name].dropna().values)
         except Exception:
             p_normal = 0.0
-        log_v = np.log1p(v[v > 0])
-        log_skew = float(log_v.skew())
         results.append({
             "metric": name, "n": n, "skewness": skew, "kurtosis": kurt,
             "p_normal": p_normal, "is_normal": p_normal > 0.05, "log_skewness": log_skew,
@@ -43,11 +44,12 @@ def s17_statistical_tests(con, csv: str, cost_df: pd.DataFrame):
 
     fig, axes = plt.subplots(2, 2, figsize=(14, 12))
     fig.suptitle("Log-Transformed Q-Q Plots", fontsize=15, fontweight="bold", y=1.01)
-    for ax, (name, vals) in zip(axes.flat, metrics.items()):
-        v = vals.dropna()
-        log_v = np.log1p(v[v > 0]).sample(n=min(10_000, len(v)), random_state=42)
+    for ax, name in zip(axes.flat, METRICS):
+        v = sample[name].dropna()
+        log_v = np.log1p(v[v > 0])
+        log_v = log_v.sample(n=min(QQ_ROWS, len(log_v)), random_state=42)
         scipy_stats.probplot(log_v, dist="norm", plot=ax)
         ax.set_title(f"QQ: log({name})", fontsize=12, fontweight="bold")
         ax.get_lines()[0].set(markersize=2, alpha=0.4)
-    fig.tight_layout(); savefig(fig, "17_qq_plots.png")
+    savefig(fig, "17_qq_plots.png", tight_layout=True)
     return stats_df
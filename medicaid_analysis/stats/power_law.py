@@ -2,18 +2,18 @@
 
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from utils import log, banner, query, savefig, OUTPUT_DIR
+from utils import log, banner, query, provider_summary, uses, PROVIDER_SUMMARY, savefig, subplots, OUTPUT_DIR
 
 
+@uses(PROVIDER_SUMMARY)
 def s15_power_law(con, csv: str):
     """Power-law / Pareto distribution analysis of spending."""
     banner(15, "Power-Law & Pareto Analysis")
 
     prov = query(con, f"""
-        SELECT BILLING_PROVIDER_NPI_NUM, SUM(TOTAL_PAID) AS total_paid
-        FROM '{csv}' GROUP BY BILLING_PROVIDER_NPI_NUM
-        HAVING total_paid > 0 ORDER BY total_paid DESC
+        SELECT BILLING_PROVIDER_NPI_NUM, total_paid
+        FROM {provider_summary(con, csv)}
+        WHERE total_paid > 0 ORDER BY total_paid DESC
     """)
     vals = prov["total_paid"].values
     n = len(vals)
@@ -37,7 +37,7 @@ def s15_power_law(con, csv: str):
     })
     pareto_stats.to_csv(OUTPUT_DIR / "15_pareto_stats.csv", index=False)
 
-    fig, axes = plt.subplots(1, 3, figsize=(20, 6))
+    fig, axes = subplots(1, 3, figsize=(20, 6))
     fig.suptitle("Power-Law & Pareto Analysis (Provider Spending)", fontsize=15, fontweight="bold", y=1.02)
 
     ax = axes[0]
@@ -63,5 +63,5 @@ def s15_power_law(con, csv: str):
     ax.set_title("CCDF (Complementary CDF)", fontsize=13, fontweight="bold")
     ax.set_xlabel("Spending Threshold (USD)"); ax.set_ylabel("P(X > x)")
 
-    fig.tight_layout(); savefig(fig, "15_power_law.png")
+    savefig(fig, "15_power_law.png", tight_layout=True)
     return pareto_stats
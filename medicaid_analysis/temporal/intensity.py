@@ -1,8 +1,7 @@
 """Temporal — Beneficiary Intensity (Section 19)."""
 
 import numpy as np
-import matplotlib.pyplot as plt
-from utils import log, banner, query, savefig, usd, OUTPUT_DIR
+from utils import log, banner, query, savefig, subplots, usd, OUTPUT_DIR
 
 
 def s19_beneficiary_intensity(con, csv: str):
@@ -13,7 +12,7 @@ def s19_beneficiary_intensity(con, csv: str):
         SELECT BILLING_PROVIDER_NPI_NUM, HCPCS_CODE, TOTAL_CLAIMS, TOTAL_UNIQUE_BENEFICIARIES, TOTAL_PAID,
                TOTAL_CLAIMS * 1.0 / NULLIF(TOTAL_UNIQUE_BENEFICIARIES, 0) AS claims_per_bene,
                TOTAL_PAID / NULLIF(TOTAL_UNIQUE_BENEFICIARIES, 0) AS paid_per_bene
-        FROM '{csv}' WHERE TOTAL_UNIQUE_BENEFICIARIES > 5 AND TOTAL_CLAIMS > 0
+        FROM {csv} WHERE TOTAL_UNIQUE_BENEFICIARIES > 5 AND TOTAL_CLAIMS > 0
     """)
     log.info("  Mean claims/beneficiary: %.2f", intensity["claims_per_bene"].mean())
     log.info("  Median claims/beneficiary: %.2f", intensity["claims_per_bene"].median())
@@ -25,7 +24,7 @@ def s19_beneficiary_intensity(con, csv: str):
     ).reset_index().sort_values("avg_claims_per_bene", ascending=False)
     proc_intensity.head(50).to_csv(OUTPUT_DIR / "19_beneficiary_intensity.csv", index=False)
 
-    fig, axes = plt.subplots(2, 2, figsize=(16, 12))
+    fig, axes = subplots(2, 2, figsize=(16, 12))
     fig.suptitle("Beneficiary Utilization Intensity", fontsize=16, fontweight="bold", y=1.01)
     ax = axes[0, 0]
     cpb = intensity["claims_per_bene"].clip(upper=intensity["claims_per_bene"].quantile(0.99))
@@ -44,5 +43,5 @@ def s19_beneficiary_intensity(con, csv: str):
     top_int = proc_intensity[proc_intensity["total_records"] >= 20].head(15).iloc[::-1]
     ax.barh(top_int["HCPCS_CODE"], top_int["avg_claims_per_bene"], color="#34a853", edgecolor="white")
     ax.set_title("Top 15 Procedures by Avg Claims/Beneficiary", fontsize=13, fontweight="bold"); ax.set_xlabel("Avg Claims per Beneficiary")
-    fig.tight_layout(); savefig(fig, "19_beneficiary_intensity.png")
+    savefig(fig, "19_beneficiary_intensity.png", tight_layout=True)
     return proc_intensity
@@ -2,23 +2,23 @@
 
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 import matplotlib.ticker as mticker
-from utils import log, banner, query, savefig, usd, num_fmt, OUTPUT_DIR
+from utils import (
+    log, banner, query, monthly_summary, uses, MONTHLY_SUMMARY, savefig, subplots, usd,
+    num_fmt, OUTPUT_DIR,
+)
 
 
+@uses(MONTHLY_SUMMARY)
 def s11_temporal_patterns(con, csv: str):
     """Day-of-week, month, and seasonal spending patterns."""
     banner(11, "Temporal Patterns & Seasonality")
 
     monthly = query(con, f"""
-        SELECT CLAIM_FROM_MONTH, SUM(TOTAL_PAID) AS total_paid,
-               SUM(TOTAL_CLAIMS) AS total_claims,
-               COUNT(DISTINCT BILLING_PROVIDER_NPI_NUM) AS providers
-        FROM '{csv}' GROUP BY CLAIM_FROM_MONTH ORDER BY CLAIM_FROM_MONTH
+        SELECT CLAIM_FROM_MONTH, total_paid, total_claims, providers
+        FROM {monthly_summary(con, csv)} ORDER BY CLAIM_FROM_MONTH
     """)
-    monthly["CLAIM_FROM_MONTH"] = pd.to_datetime(monthly["CLAIM_FROM_MONTH"])
     monthly["month_num"] = monthly["CLAIM_FROM_MONTH"].dt.month
     monthly["year"] = monthly["CLAIM_FROM_MONTH"].dt.year
     monthly["quarter"] = monthly["CLAIM_FROM_MONTH"].dt.quarter
@@ -40,7 +40,7 @@ def s11_temporal_patterns(con, csv: str):
     qtr = monthly.groupby("quarter").agg(avg_paid=("total_paid", "mean")).reset_index()
     qtr["quarter_name"] = "Q" + qtr["quarter"].astype(str)
 
-    fig, axes = plt.subplots(2, 2, figsize=(16, 12))
+    fig, axes = subplots(2, 2, figsize=(16, 12))
     fig.suptitle("Temporal Patterns & Seasonality", fontsize=16, fontweight="bold", y=1.01)
     ax = axes[0, 0]
     ax.bar(seasonal["month_name"], seasonal["seasonal_index"], color="#1a73e8", edgecolor="white")
@@ -59,5 +59,5 @@ def s11_temporal_patterns(con, csv: str):
     ax.plot(monthly["CLAIM_FROM_MONTH"], monthly["providers"], color="#34a853", linewidth=2, marker="o", markersize=3)
     ax.set_title("Active Providers per Month", fontsize=13, fontweight="bold"); ax.set_ylabel("Provider Count")
     ax.yaxis.set_major_formatter(mticker.FuncFormatter(num_fmt)); ax.xaxis.set_major_formatter(mdates.DateFormatter("%Y"))
-    fig.tight_layout(); savefig(fig, "11_temporal_patterns.png")
+    savefig(fig, "11_temporal_patterns.png", tight_layout=True)
     return monthly, seasonal
@@ -1,23 +1,22 @@
 """Temporal — Rolling & Cumulative Metrics (Section 21)."""
 
-import pandas as pd
-import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 import matplotlib.ticker as mticker
-from utils import log, banner, query, savefig, usd, num_fmt, OUTPUT_DIR
+from utils import (
+    log, banner, query, monthly_summary, uses, MONTHLY_SUMMARY, savefig, subplots, usd,
+    num_fmt, OUTPUT_DIR,
+)
 
 
+@uses(MONTHLY_SUMMARY)
 def s21_rolling_cumulative(con, csv: str):
     """Rolling averages and cumulative spending curves."""
     banner(21, "Rolling & Cumulative Metrics")
 
     monthly = query(con, f"""
-        SELECT CLAIM_FROM_MONTH, SUM(TOTAL_PAID) AS total_paid,
-               SUM(TOTAL_CLAIMS) AS total_claims,
-               COUNT(DISTINCT BILLING_PROVIDER_NPI_NUM) AS providers
-        FROM '{csv}' GROUP BY CLAIM_FROM_MONTH ORDER BY CLAIM_FROM_MONTH
+        SELECT CLAIM_FROM_MONTH, total_paid, total_claims, providers
+        FROM {monthly_summary(con, csv)} ORDER BY CLAIM_FROM_MONTH
     """)
-    monthly["CLAIM_FROM_MONTH"] = pd.to_datetime(monthly["CLAIM_FROM_MONTH"])
     monthly = monthly.sort_values("CLAIM_FROM_MONTH")
     monthly["paid_3m_avg"] = monthly["total_paid"].rolling(3, center=True).mean()
     monthly["paid_6m_avg"] = monthly["total_paid"].rolling(6, center=True).mean()
@@ -28,7 +27,7 @@ def s21_rolling_cumulative(con, csv: str):
     monthly.to_csv(OUTPUT_DIR / "21_rolling_cumulative.csv", index=False)
     log.info("  Total cumulative spending: $%s", f"{monthly['cumulative_paid'].iloc[-1]:,.0f}")
 
-    fig, axes = plt.subplots(2, 2, figsize=(18, 12))
+    fig, axes = subplots(2, 2, figsize=(18, 12))
     fig.suptitle("Rolling Averages & Cumulative Metrics", fontsize=16, fontweight="bold", y=1.01)
     ax = axes[0, 0]
     ax.plot(monthly["CLAIM_FROM_MONTH"], monthly["total_paid"], alpha=0.3, color="#aaa", label="Monthly")
@@ -49,5 +48,5 @@ def s21_rolling_cumulative(con, csv: str):
     ax.yaxis.set_major_formatter(mticker.FuncFormatter(num_fmt))
     for a in axes.flat:
         a.xaxis.set_major_formatter(mdates.DateFormatter("%Y"))
-    fig.tight_layout(); savefig(fig, "21_rolling_cumulative.png")
+    savefig(fig, "21_rolling_cumulative.png", tight_layout=True)
     return monthly
@@ -1,24 +1,23 @@
 """Temporal — Spending Velocity & Acceleration (Section 25)."""
 
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 import matplotlib.ticker as mticker
-from utils import log, banner, query, savefig, usd, num_fmt, OUTPUT_DIR
+from utils import (
+    log, banner, query, monthly_summary, uses, MONTHLY_SUMMARY, savefig, subplots, usd,
+    num_fmt, OUTPUT_DIR,
+)
 
 
+@uses(MONTHLY_SUMMARY)
 def s25_spending_velocity(con, csv: str):
     """Spending acceleration — month-over-month velocity and acceleration."""
     banner(25, "Spending Velocity & Acceleration")
 
     monthly = query(con, f"""
-        SELECT CLAIM_FROM_MONTH, SUM(TOTAL_PAID) AS total_paid,
-               SUM(TOTAL_CLAIMS) AS total_claims,
-               COUNT(DISTINCT BILLING_PROVIDER_NPI_NUM) AS providers
-        FROM '{csv}' GROUP BY CLAIM_FROM_MONTH ORDER BY CLAIM_FROM_MONTH
+        SELECT CLAIM_FROM_MONTH, total_paid, total_claims, providers
+        FROM {monthly_summary(con, csv)} ORDER BY CLAIM_FROM_MONTH
     """)
-    monthly["CLAIM_FROM_MONTH"] = pd.to_datetime(monthly["CLAIM_FROM_MONTH"])
     monthly["velocity_paid"] = monthly["total_paid"].diff()
     monthly["velocity_claims"] = monthly["total_claims"].diff()
     monthly["accel_paid"] = monthly["velocity_paid"].diff()
@@ -29,7 +28,7 @@ def s25_spending_velocity(con, csv: str):
     log.info("  Avg monthly velocity: $%s", f"{monthly['velocity_paid'].mean():,.0f}")
     log.info("  Max acceleration: $%s", f"{monthly['accel_paid'].max():,.0f}")
 
-    fig, axes = plt.subplots(2, 2, figsize=(18, 12))
+    fig, axes = subplots(2, 2, figsize=(18, 12))
     fig.suptitle("Spending Velocity & Acceleration", fontsize=16, fontweight="bold", y=1.01)
     ax = axes[0, 0]
     ax.bar(monthly["CLAIM_FROM_MONTH"], monthly["velocity_paid"],
@@ -56,5 +55,5 @@ def s25_spending_velocity(con, csv: str):
     ax.yaxis.set_major_formatter(mticker.FuncFormatter(num_fmt))
     for a in axes.flat:
         a.xaxis.set_major_formatter(mdates.DateFormatter("%Y"))
-    fig.tight_layout(); savefig(fig, "25_spending_velocity.png")
+    savefig(fig, "25_spending_velocity.png", tight_layout=True)
     return monthly
@@ -4,19 +4,22 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.ticker as mticker
-from utils import log, banner, query, savefig, usd, num_fmt, OUTPUT_DIR
+from utils import (
+    log, banner, query, monthly_summary, uses, MONTHLY_SUMMARY, savefig, subplots, usd,
+    num_fmt, OUTPUT_DIR,
+)
 
 
+@uses(MONTHLY_SUMMARY)
 def s22_yoy_comparison(con, csv: str):
     """Year-over-year comparison of spending, claims, and providers."""
     banner(22, "Year-over-Year Cohort Comparison")
 
     yearly_monthly = query(con, f"""
-        SELECT EXTRACT(YEAR FROM CAST(CLAIM_FROM_MONTH || '-01' AS DATE)) AS year,
-               EXTRACT(MONTH FROM CAST(CLAIM_FROM_MONTH || '-01' AS DATE)) AS month_num,
-               SUM(TOTAL_PAID) AS total_paid, SUM(TOTAL_CLAIMS) AS total_claims,
-               COUNT(DISTINCT BILLING_PROVIDER_NPI_NUM) AS providers
-        FROM '{csv}' GROUP BY year, month_num ORDER BY year, month_num
+        SELECT EXTRACT(YEAR FROM CLAIM_FROM_MONTH) AS year,
+               EXTRACT(MONTH FROM CLAIM_FROM_MONTH) AS month_num,
+               total_paid, total_claims, providers
+        FROM {monthly_summary(con, csv)} ORDER BY year, month_num
     """)
     yearly_monthly["month_name"] = pd.to_datetime(yearly_monthly["month_num"].astype(int), format="%m").dt.strftime("%b")
     yearly_monthly.to_csv(OUTPUT_DIR / "22_yoy_monthly.csv", index=False)
@@ -31,7 +34,7 @@ def s22_yoy_comparison(con, csv: str):
              ", ".join([f"{y:.0f}: {c:+.1f}%" for y, c in
                         zip(yearly_totals["year"], yearly_totals["paid_yoy_change"].fillna(0))]))
 
-    fig, axes = plt.subplots(2, 2, figsize=(18, 12))
+    fig, axes = subplots(2, 2, figsize=(18, 12))
     fig.suptitle("Year-over-Year Comparison", fontsize=16, fontweight="bold", y=1.01)
     years = sorted(yearly_monthly["year"].unique())
     colors = plt.cm.viridis(np.linspace(0.1, 0.9, len(years)))
@@ -68,5 +71,5 @@ def s22_yoy_comparison(con, csv: str):
     ax.set_title("Monthly Claims by Year", fontsize=13, fontweight="bold"); ax.set_xlabel("Month"); ax.set_ylabel("Total Claims")
     ax.yaxis.set_major_formatter(mticker.FuncFormatter(num_fmt))
     ax.set_xticks(range(1, 13)); ax.set_xticklabels(["J","F","M","A","M","J","J","A","S","O","N","D"]); ax.legend(fontsize=8, ncol=2)
-    fig.tight_layout(); savefig(fig, "22_yoy_comparison.png")
+    savefig(fig, "22_yoy_comparison.png", tight_layout=True)
     return yearly_totals
@@ -0,0 +1,46 @@
+"""Shared fixtures for the test suite."""
+
+import os
+
+import pytest
+
+RUN_DIRS = {"MEDICAID_CACHE_DIR": "cache", "MEDICAID_OUTPUT_DIR": "output", "MEDICAID_PLOTS_DIR": "plots"}
+
+CLAIMS_HEADER = ("BILLING_PROVIDER_NPI_NUM,SERVICING_PROVIDER_NPI_NUM,HCPCS_CODE,CLAIM_FROM_MONTH,"
+                 "TOTAL_UNIQUE_BENEFICIARIES,TOTAL_CLAIMS,TOTAL_PAID")
+CLAIMS_ROWS = [
+    "1000000001,1000000002,99213,2018-01,12,20,1500.50",
+    "1000000001,1000000001,T1019,2018-02,15,40,3200.00",
+    "1000000003,1000000003,J1745,2018-03,11,12,99.99",
+]
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_configure(config):
+    """Point the cache, output and plot directories at pytest's temporary directory.
+
+    ``utils.config`` reads them when first imported, before any fixture runs, so
+    they are set here; the tests never write to ``data/cache`` or the tracked
+    ``output`` / ``plots`` trees.
+    """
+    base = config._tmp_path_factory.mktemp("medicaid")
+    for variable, name in RUN_DIRS.items():
+        os.environ[variable] = str(base / name)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def run_dirs():
+    """The temporary output and plot directories, with their ``fraud/`` subdirectories."""
+    from utils import OUTPUT_DIR, PLOTS_DIR, CACHE_DIR
+    for root in (OUTPUT_DIR, PLOTS_DIR):
+        (root / "fraud").mkdir(parents=True, exist_ok=True)
+    return {"cache": CACHE_DIR, "output": OUTPUT_DIR, "plots": PLOTS_DIR}
+
+
+@pytest.fixture
+def small_csv(request, tmp_path):
+    """A claims CSV with the first few ``CLAIMS_ROWS`` (two unless parametrized indirectly)."""
+    rows = CLAIMS_ROWS[:getattr(request, "param", 2)]
+    path = tmp_path / "claims.csv"
+    path.write_text("\n".join([CLAIMS_HEADER, *rows]) + "\n")
+    return path
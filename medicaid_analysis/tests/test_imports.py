@@ -14,11 +14,11 @@ SECTION_REGISTRY = {
     "eda.s05_cost_efficiency": ["con", "csv"],
     "eda.s12_high_value_claims": ["con", "csv"],
     # stats
-    "stats.s06_anomaly_detection": ["con", "csv", "cost_df"],
+    "stats.s06_anomaly_detection": ["con", "csv"],
     "stats.s08_concentration": ["con", "csv"],
-    "stats.s09_correlations": ["con", "csv", "cost_df"],
+    "stats.s09_correlations": ["con", "csv"],
     "stats.s15_power_law": ["con", "csv"],
-    "stats.s17_statistical_tests": ["con", "csv", "cost_df"],
+    "stats.s17_statistical_tests": ["con", "csv"],
     "stats.s18_spending_deciles": ["con", "csv"],
     "stats.s31_benfords_law": ["con", "csv"],
     # providers
@@ -41,8 +41,8 @@ SECTION_REGISTRY = {
     "temporal.s22_yoy_comparison": ["con", "csv"],
     "temporal.s25_spending_velocity": ["con", "csv"],
     # visualization
-    "visualization.s20_distribution_deep_dive": ["con", "csv", "cost_df"],
-    "visualization.s28_outlier_profiles": ["con", "csv", "cost_df"],
+    "visualization.s20_distribution_deep_dive": ["con", "csv"],
+    "visualization.s28_outlier_profiles": ["con", "csv"],
     "visualization.s32_executive_summary": ["con", "csv", "eda", "yoy_totals"],
     # fraud
     "fraud.s33_upcoding_detection": ["con", "csv"],
@@ -17,6 +17,15 @@ class TestOrchestrator:
         assert "--sections" in result.stdout
         assert "--skip-fraud" in result.stdout
         assert "--sample" in result.stdout
+        assert "--no-cache" in result.stdout
+        assert "--db" in result.stdout
+        assert "--from-month" in result.stdout
+        assert "--query-cache" in result.stdout
+        assert "--jobs" in result.stdout
+        assert "--plot-workers" in result.stdout
+        assert "--defer-plots" in result.stdout
+        assert "--force" in result.stdout
+        assert "--resume" in result.stdout
 
     def test_parse_args_defaults(self):
         from main import parse_args
@@ -28,6 +37,13 @@ class TestOrchestrator:
         assert args.sections is None
         assert args.skip_fraud is False
         assert args.sample is False
+        assert args.no_cache is False
+        assert args.db is False
+        assert args.from_month is None and args.to_month is None
+        assert args.query_cache is False
+        assert args.jobs == 1
+        assert args.plot_workers == 0 and not args.defer_plots and not args.render_plots
+        assert args.force is False and args.resume is False
 
     def test_should_run_all(self):
         from main import should_run
@@ -56,10 +72,39 @@ class TestOrchestrator:
         assert should_run(33, args) is False
 
     def test_run_section_error_handling(self):
-        from main import run_section
+        from main import run_section, FAILED
 
         def failing_func(*args):
             raise ValueError("Test error")
 
         result = run_section(99, failing_func, "a", "b")
         assert result is None  # Should catch error and return None
+        assert 99 in FAILED    # ...and keep it out of the run manifest
+        FAILED.discard(99)
+
+    def test_month_arg(self):
+        import argparse
+        from main import month_arg
+        assert month_arg("2021-7") == "2021-07"
+        with pytest.raises(argparse.ArgumentTypeError):
+            month_arg("July 2021")
+
+    def test_sections_declare_shared_aggregates(self):
+        from main import SECTIONS
+        from utils import PROVIDER_SUMMARY, MONTHLY_SUMMARY, PROVIDER_CODE
+        assert sorted(SECTIONS) == list(range(1, 41))
+        assert PROVIDER_SUMMARY in SECTIONS[4].aggregates
+        assert MONTHLY_SUMMARY in SECTIONS[2].aggregates
+        assert PROVIDER_CODE in SECTIONS[33].aggregates
+        assert not hasattr(SECTIONS[1], "aggregates")
+
+    def test_steps_declare_section_results(self):
+        from main import STEPS
+        producer = {s.output: s.num for s in STEPS if s.output}
+        assert producer["yoy_totals"] == 22
+        # Row-level cost metrics stay in DuckDB (``cost_metrics``), not a published frame
+        assert 5 not in {s.num for s in STEPS if s.output}
+        for step in STEPS:
+            for name in step.inputs:
+                assert producer[name] < step.num
+        assert set(STEPS[39].inputs) == set(STEPS[39].optional)
@@ -0,0 +1,167 @@
+"""Tests for the create_sample.py sampler."""
+
+import duckdb
+import pytest
+
+
+@pytest.fixture
+def claims_csv(tmp_path):
+    path = tmp_path / "claims.csv"
+    rows = ["BILLING_PROVIDER_NPI_NUM,SERVICING_PROVIDER_NPI_NUM,HCPCS_CODE,CLAIM_FROM_MONTH,"
+            "TOTAL_UNIQUE_BENEFICIARIES,TOTAL_CLAIMS,TOTAL_PAID"]
+    for i in range(4000):
+        rows.append(f"{1000000000 + i % 200},{1100000000 + i % 37},C{i % 50:03d},"
+                    f"20{18 + i % 6}-{1 + i % 12:02d},{i % 20 + 12},{i % 30 + 12},{i * 1.5:.2f}")
+    path.write_text("\n".join(rows) + "\n")
+    return path
+
+
+class TestCreateSamples:
+    """Verify hash sampling is nested, deterministic and written in the declared schema."""
+
+    @staticmethod
+    def rows(con, path, columns="*"):
+        return set(con.execute(f"SELECT {columns} FROM '{path}'").fetchall())
+
+    def test_samples_are_nested_and_deterministic(self, claims_csv, tmp_path):
+        from create_sample import create_samples, sample_path
+        from utils import connect, register_claims
+        con = duckdb.connect()
+        counts = create_samples(con, claims_csv, [50, 5, 20], data_dir=tmp_path)
+        assert list(counts) == [5, 20, 50]
+        assert 0.6 < counts[20] / (0.2 * 4000) < 1.4
+        small, mid, large = (self.rows(con, sample_path(p, data_dir=tmp_path)) for p in (5, 20, 50))
+        assert small <= mid <= large
+        assert len(small) == counts[5]
+
+        # The same percentage on its own gives the same rows
+        again = tmp_path / "again"
+        again.mkdir()
+        create_samples(con, claims_csv, [20], data_dir=again)
+        assert self.rows(con, sample_path(20, data_dir=again)) == mid
+
+        # Samples load like the full dataset
+        view = connect()
+        register_claims(view, sample_path(20, data_dir=tmp_path))
+        assert view.execute("SELECT COUNT(*) FROM claims").fetchone()[0] == counts[20]
+        con.close()
+        view.close()
+
+    def test_provider_samples_keep_whole_providers(self, claims_csv, tmp_path):
+        from create_sample import create_samples, sample_path
+        con = duckdb.connect()
+        create_samples(con, claims_csv, [25], by="provider", fmt="csv", data_dir=tmp_path)
+        path = sample_path(25, "csv", tmp_path)
+        npis = {r[0] for r in self.rows(con, path, "BILLING_PROVIDER_NPI_NUM")}
+        assert 0 < len(npis) < 200
+        per_npi = con.execute(f"""
+            SELECT COUNT(*) FROM '{claims_csv}' WHERE BILLING_PROVIDER_NPI_NUM IN ({",".join(map(str, npis))})
+        """).fetchone()[0]
+        assert per_npi == con.execute(f"SELECT COUNT(*) FROM '{path}'").fetchone()[0]
+        assert path.read_text().splitlines()[1].split(",")[3].count("-") == 1   # YYYY-MM months
+        con.close()
+
+    def test_stratified_samples_cover_codes_and_reweight(self, claims_csv, tmp_path):
+        from create_sample import create_stratified_samples, sample_path
+        from utils import WEIGHT_COLUMN
+        con = duckdb.connect()
+        counts = create_stratified_samples(con, claims_csv, [1, 10], min_per_code=20, data_dir=tmp_path)
+        small, large = (sample_path(p, data_dir=tmp_path, stratified=True) for p in (1, 10))
+        assert counts[1] < 4000 * 0.5
+        assert self.rows(con, small, f"* EXCLUDE ({WEIGHT_COLUMN})") <= self.rows(con, large, f"* EXCLUDE ({WEIGHT_COLUMN})")
+
+        # Every code is kept with at least min_per_code rows (an unstratified 1% would keep ~1)
+        per_code = con.execute(f"""
+            SELECT HCPCS_CODE, COUNT(*) AS n, SUM({WEIGHT_COLUMN}) AS weighted
+            FROM '{small}' GROUP BY HCPCS_CODE
+        """).df()
+        assert len(per_code) == 50
+        assert (per_code["n"] >= 20).all()
+        # Weights add back up to the full code counts
+        assert per_code["weighted"].round(6).eq(80).all()
+        con.close()
+
+
+class TestEstimates:
+    """Verify population estimates from samples bracket the full-dataset figures."""
+
+    def test_sample_design_from_metadata(self, claims_csv, tmp_path):
+        from create_sample import create_samples, sample_path
+        from utils import connect, cursor, read_sample_design, set_sample_design, sample_design
+        create_samples(duckdb.connect(), claims_csv, [20], by="provider", data_dir=tmp_path)
+        design = read_sample_design(sample_path(20, data_dir=tmp_path))
+        assert design.pct == 20 and design.unit == "BILLING_PROVIDER_NPI_NUM"
+        assert read_sample_design(claims_csv) is None
+        assert read_sample_design(claims_csv, pct=5).weight == "20.0"
+
+        con = connect()
+        assert sample_design(con) is None
+        set_sample_design(con, design)
+        assert sample_design(cursor(con)) == design
+
+    @pytest.mark.parametrize("by", ["row", "provider"])
+    def test_totals_and_distinct_counts(self, claims_csv, tmp_path, by):
+        from create_sample import create_samples, sample_path
+        from utils import read_sample_design, estimate_totals, estimate_distinct
+        con = duckdb.connect()
+        create_samples(con, claims_csv, [50], by=by, data_dir=tmp_path)
+        path = sample_path(50, data_dir=tmp_path)
+        design = read_sample_design(path)
+        est = estimate_totals(con, f"'{path}'", design, {"rows": "1", "paid": "TOTAL_PAID"}).iloc[0]
+        paid = con.execute(f"SELECT SUM(TOTAL_PAID) FROM '{claims_csv}'").fetchone()[0]
+        assert abs(est["rows"] - 4000) < 3 * est["rows_se"]
+        assert abs(est["paid"] - paid) < 3 * est["paid_se"]
+        assert est["paid_low"] < est["paid"] < est["paid_high"]
+
+        yearly = estimate_totals(con, f"'{path}'", design, {"rows": "1"}, by={"year": "YEAR(CLAIM_FROM_MONTH)"})
+        assert list(yearly["year"]) == list(range(2018, 2024))
+        assert yearly["rows"].sum() == pytest.approx(est["rows"])
+
+        providers = estimate_distinct(con, f"'{path}'", design, "BILLING_PROVIDER_NPI_NUM").iloc[0]
+        assert providers["low"] <= 200 <= providers["high"]
+        assert providers["method"] == ("Horvitz-Thompson" if by == "provider" else "GEE")
+
+    def test_quantiles_and_gini(self, claims_csv, tmp_path):
+        import numpy as np
+        from create_sample import create_samples, sample_path
+        from utils import (read_sample_design, estimate_quantiles, weighted_gini,
+                           bootstrap_interval, perturbed_estimate)
+        con = duckdb.connect()
+        create_samples(con, claims_csv, [25], data_dir=tmp_path)
+        path = sample_path(25, data_dir=tmp_path)
+        q = estimate_quantiles(con, f"'{path}'", read_sample_design(path), "TOTAL_PAID", [0.5, 0.9]).iloc[0]
+        assert q["low"] < q["estimate"] < q["high"]
+        assert q["estimate"] == pytest.approx(3000, rel=0.1)   # TOTAL_PAID runs evenly over 0 … 6000
+
+        values = np.arange(1.0, 101.0)
+        n = len(values)
+        assert weighted_gini(values) == pytest.approx(2 * np.sum(np.arange(1, n + 1) * values) / (n * values.sum())
+                                                       - (n + 1) / n)
+        assert weighted_gini(values, np.full(n, 3.0)) == pytest.approx(weighted_gini(values))
+        low, high = bootstrap_interval(weighted_gini, values, np.ones(n))
+        assert low < weighted_gini(values) < high
+        estimate, low, high = perturbed_estimate(weighted_gini, values, np.full(n, 5.0))
+        assert low < estimate < high
+
+
+class TestMultiScale:
+    """Verify run_multi_scale.py schedules scales within the memory budget."""
+
+    def test_scales_share_memory_and_cores(self, monkeypatch):
+        import subprocess
+        import sys
+        import run_multi_scale
+        started = []
+
+        def launch(pct, memory, threads, extra_args=None):
+            started.append((pct, memory, threads))
+            # Bigger scales run longer
+            return subprocess.Popen([sys.executable, "-c", f"import time; time.sleep({0.4 * memory})"]), None
+
+        monkeypatch.setattr(run_multi_scale, "launch", launch)
+        monkeypatch.setattr(run_multi_scale, "POLL_SECONDS", 0.05)
+        results = run_multi_scale.run_scales({1: 1, 10: 1, 50: 2, 100: 3}, budget=3, cores=4)
+        assert all(ok for ok, _ in results.values())
+        # 100% needs the whole budget and runs alone; 50% and 10% then split memory and
+        # cores; 1% waits for one of them
+        assert started == [(100, 3, 4), (50, 2, 2), (10, 1, 1), (1, 1, 2)]
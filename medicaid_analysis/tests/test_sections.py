@@ -3,32 +3,23 @@
 import pytest
 import pandas as pd
 from pathlib import Path
-from utils import connect, SAMPLE_CSV, OUTPUT_DIR, PLOTS_DIR
+from utils import open_store, CLAIMS_TABLE, SAMPLE_CSV, OUTPUT_DIR, PLOTS_DIR
 
 
 @pytest.fixture(scope="module")
-def data_csv():
-    """Provide path to sample CSV or skip if unavailable."""
+def con():
+    """Attach the persistent sample database read-only, or skip if unavailable."""
     if not SAMPLE_CSV.exists():
         pytest.skip("Sample CSV not available — run create_sample.py first")
-    return str(SAMPLE_CSV)
-
-
-@pytest.fixture(scope="module")
-def con():
-    """Provide a DuckDB connection."""
-    c = connect()
+    c = open_store(SAMPLE_CSV, read_only=True)
     yield c
     c.close()
 
 
-@pytest.fixture(autouse=True)
-def ensure_dirs():
-    """Ensure output directories exist."""
-    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    PLOTS_DIR.mkdir(parents=True, exist_ok=True)
-    (PLOTS_DIR / "fraud").mkdir(parents=True, exist_ok=True)
-    (OUTPUT_DIR / "fraud").mkdir(parents=True, exist_ok=True)
+@pytest.fixture(scope="module")
+def data_csv(con):
+    """Relation the sections read from (the store's claims table)."""
+    return CLAIMS_TABLE
 
 
 class TestEDASections:
@@ -56,23 +47,19 @@ class TestEDASections:
 
     def test_s05_cost_efficiency(self, con, data_csv):
         from eda import s05_cost_efficiency
-        cost_df = s05_cost_efficiency(con, data_csv)
-        assert isinstance(cost_df, pd.DataFrame)
-        assert len(cost_df) > 0
-        assert "cost_per_claim" in cost_df.columns
+        costs = s05_cost_efficiency(con, data_csv)
+        columns = [c[0] for c in con.execute(f"DESCRIBE {costs}").fetchall()]
+        assert "cost_per_claim" in columns
+        assert con.execute(f"SELECT COUNT(*) FROM {costs}").fetchone()[0] > 0
+        assert (OUTPUT_DIR / "05_cost_efficiency_percentiles.csv").exists()
 
 
 class TestStatsSections:
     """Test stats sections."""
 
-    @pytest.fixture(scope="class")
-    def cost_df(self, con, data_csv):
-        from eda import s05_cost_efficiency
-        return s05_cost_efficiency(con, data_csv)
-
-    def test_s06_anomaly_detection(self, con, data_csv, cost_df):
+    def test_s06_anomaly_detection(self, con, data_csv):
         from stats import s06_anomaly_detection
-        s06_anomaly_detection(con, data_csv, cost_df)
+        s06_anomaly_detection(con, data_csv)
         assert (OUTPUT_DIR / "06a_anomalies_zscore.csv").exists()
 
     def test_s08_concentration(self, con, data_csv):
@@ -85,6 +72,24 @@ class TestStatsSections:
         s15_power_law(con, data_csv)
         assert (PLOTS_DIR / "15_power_law.png").exists()
 
+    def test_s17_statistical_tests_with_refunds(self):
+        from stats import s17_statistical_tests
+        from utils import connect
+        c = connect()
+        # Adjustments leave negative and zero payments; log-skew only covers positive ones
+        c.execute("""
+            CREATE TABLE claims AS
+            SELECT 1000000000 + i % 7 AS BILLING_PROVIDER_NPI_NUM, 'A' || i % 3 AS HCPCS_CODE,
+                   CASE WHEN i % 10 = 0 THEN -25.0 * i WHEN i % 10 = 1 THEN 0.0 ELSE i * i END AS TOTAL_PAID,
+                   1 + i % 4 AS TOTAL_CLAIMS, 1 + i % 2 AS TOTAL_UNIQUE_BENEFICIARIES
+            FROM range(1, 200) t(i)
+        """)
+        stats_df = s17_statistical_tests(c, "claims").set_index("metric")
+        c.close()
+        assert stats_df.loc["TOTAL_PAID", "n"] == 199
+        assert pd.notna(stats_df.loc["TOTAL_PAID", "log_skewness"])
+        assert (PLOTS_DIR / "17_qq_plots.png").exists()
+
     def test_s18_spending_deciles(self, con, data_csv):
         from stats import s18_spending_deciles
         s18_spending_deciles(con, data_csv)
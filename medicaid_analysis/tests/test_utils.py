@@ -1,5 +1,6 @@
 """Tests for the utils package — config, formatting, I/O, and DB helpers."""
 
+import pandas as pd
 import pytest
 from pathlib import Path
 
@@ -77,6 +78,39 @@ class TestDatabase:
         assert df.iloc[0]["text"] == "hello"
         con.close()
 
+    def test_query_matches_fetchdf_types(self, tmp_path):
+        from utils import connect, query, enable_query_cache
+        con = connect()
+        sql = """
+            SELECT range AS i, (range * 1.5)::DECIMAL(18, 2) AS paid, 'C' || range AS code,
+                   DATE '2024-01-01' + range::INTEGER AS d,
+                   CASE WHEN range % 2 = 0 THEN range END AS sparse,
+                   CASE WHEN range % 2 = 0 THEN range > 2 END AS flag
+            FROM range(5)
+        """
+        expected = con.execute(sql).fetchdf()
+        pd.testing.assert_frame_equal(query(con, sql), expected)
+        # The same types come back from the result cache
+        enable_query_cache(con, "test", cache_dir=tmp_path)
+        query(con, sql)
+        pd.testing.assert_frame_equal(query(con, sql), expected)
+        con.close()
+
+    def test_query_returns_low_cardinality_strings_as_categoricals(self):
+        from utils import connect, query
+        con = connect()
+        sql = """
+            SELECT 'C' || (range * 7919 % 50) AS code, CASE WHEN range % 9 > 0 THEN 'tier ' || range % 3 END AS tier,
+                   'N' || range AS npi
+            FROM range(20000)
+        """
+        df, expected = query(con, sql), con.execute(sql).fetchdf()
+        assert isinstance(df["code"].dtype, pd.CategoricalDtype) and isinstance(df["tier"].dtype, pd.CategoricalDtype)
+        assert df["npi"].dtype == expected["npi"].dtype
+        pd.testing.assert_frame_equal(df.astype(expected.dtypes.to_dict()), expected)
+        assert df.sort_values("code", kind="stable").index.equals(expected.sort_values("code", kind="stable").index)
+        con.close()
+
     def test_query_with_csv(self):
         """Test querying a real CSV file (uses sample data)."""
         from utils import connect, query, SAMPLE_CSV
@@ -88,6 +122,56 @@ class TestDatabase:
         assert df.iloc[0]["n"] > 0
         con.close()
 
+    def test_query_cache_hits_and_evicts(self, tmp_path):
+        from utils import connect, query, enable_query_cache
+        from utils.query_cache import stats
+        con = connect()
+        enable_query_cache(con, "test", cache_dir=tmp_path, max_bytes=10**9)
+        sql = "SELECT range AS i, range * 0.5 AS x, DATE '2024-01-01' AS d FROM range(100)"
+        first = query(con, sql)
+        hits = stats["hits"]
+        second = query(con, "  ".join(sql.split(" ")))   # whitespace does not change the key
+        assert stats["hits"] == hits + 1
+        pd.testing.assert_frame_equal(first, second)
+        assert len(list(tmp_path.glob("*.parquet"))) == 1
+
+        # A different dataset key misses
+        enable_query_cache(con, "other", cache_dir=tmp_path, max_bytes=10**9)
+        query(con, sql)
+        assert stats["hits"] == hits + 1
+        assert len(list(tmp_path.glob("*.parquet"))) == 2
+
+        # A budget smaller than any result keeps nothing on disk
+        enable_query_cache(con, "other", cache_dir=tmp_path, max_bytes=1)
+        query(con, "SELECT 1 AS one")
+        assert len(list(tmp_path.glob("*.parquet"))) == 0
+        con.close()
+
+    def test_query_cache_eviction_skips_vanished_files(self, tmp_path, monkeypatch):
+        from utils.query_cache import _evict
+        for name in ("a", "b", "gone"):
+            (tmp_path / f"{name}.parquet").write_bytes(b"x" * 10)
+        stat = Path.stat
+
+        def racing_stat(self, *args, **kwargs):
+            if self.name == "gone.parquet":   # evicted by another process after the listing
+                raise FileNotFoundError(self)
+            return stat(self, *args, **kwargs)
+
+        monkeypatch.setattr(Path, "stat", racing_stat)
+        _evict(tmp_path, max_bytes=10)
+        monkeypatch.undo()
+        assert len([p for p in tmp_path.glob("*.parquet") if p.name != "gone.parquet"]) == 1
+
+    def test_query_cache_skips_nondeterministic(self, tmp_path):
+        from utils import connect, query, enable_query_cache
+        con = connect()
+        enable_query_cache(con, "test", cache_dir=tmp_path)
+        query(con, "SELECT random() AS r")
+        query(con, "SELECT * FROM range(1000) USING SAMPLE 10")
+        assert not list(tmp_path.glob("*.parquet"))
+        con.close()
+
 
 class TestIO:
     """Verify I/O helper functions."""
@@ -112,6 +196,43 @@ class TestIO:
         path.unlink()  # cleanup
         plt.close(fig)
 
+    def test_plot_workers_render_in_background(self, tmp_path):
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+        from utils import start_plot_workers, finish_plots
+        from utils.render import render_figure
+
+        fig, ax = plt.subplots()
+        ax.plot([1, 2, 3])
+        start_plot_workers(1)
+        try:
+            assert render_figure(fig, tmp_path / "bg.png") == "queued"
+        finally:
+            finish_plots()
+        plt.close(fig)
+        assert (tmp_path / "bg.png").stat().st_size > 0
+
+    def test_deferred_plot_specs_render_later(self, tmp_path, monkeypatch):
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+        import utils.render as render
+
+        monkeypatch.setattr(render, "PLOTS_DIR", tmp_path)
+        monkeypatch.setitem(render._state, "spec_dir", tmp_path / "specs")
+        fig, ax = plt.subplots()
+        ax.bar(["a", "b"], [1, 2])
+        target = tmp_path / "fraud" / "spec.png"
+        assert render.render_figure(fig, target, tight_layout=True) == "deferred"
+        plt.close(fig)
+        assert not target.exists()
+        assert (tmp_path / "specs" / "fraud" / "spec.png.fig.pkl").exists()
+
+        assert render.render_specs(tmp_path / "specs", workers=1) == 1
+        assert target.stat().st_size > 0
+        assert not list((tmp_path / "specs").rglob("*.fig.pkl"))
+
     def test_save_csv_creates_file(self, tmp_path):
         import pandas as pd
         from utils import save_csv, OUTPUT_DIR
@@ -124,3 +245,614 @@ class TestIO:
         loaded = pd.read_csv(path)
         assert len(loaded) == 2
         path.unlink()  # cleanup
+
+
+class TestIngest:
+    """Verify the CSV → Parquet columnar cache."""
+
+    def test_fingerprint_stable(self, small_csv):
+        from utils import fingerprint
+        assert fingerprint(small_csv) == fingerprint(small_csv)
+
+    def test_fingerprint_changes_with_content(self, small_csv):
+        from utils import fingerprint
+        before = fingerprint(small_csv)
+        with open(small_csv, "a") as f:
+            f.write("1000000003,1000000003,J1745,2018-03,11,12,99.99\n")
+        assert fingerprint(small_csv) != before
+
+    def test_ingest_creates_and_reuses_parquet(self, small_csv, tmp_path):
+        from utils import ingest, connect, query, register_claims
+        cache = tmp_path / "cache"
+        path = ingest(small_csv, cache_dir=cache)
+        assert path.is_dir() and (path / "year=2018" / "month=2").is_dir()
+        assert (path / "npi_dim.parquet").exists() and (path / "hcpcs_dim.parquet").exists()
+        mtime = path.stat().st_mtime_ns
+        assert ingest(small_csv, cache_dir=cache) == path
+        assert path.stat().st_mtime_ns == mtime
+        con = connect()
+        view = register_claims(con, path)
+        df = query(con, f"SELECT COUNT(*) AS n, SUM(TOTAL_CLAIMS) AS c FROM '{view}'")
+        assert df.iloc[0]["n"] == 2 and df.iloc[0]["c"] == 60
+        assert "year" not in query(con, f"SELECT * FROM {view}").columns
+        con.close()
+
+    def test_keyed_fact_matches_raw(self, small_csv, tmp_path):
+        from utils import ingest, connect, query, register_claims, key_relations
+        con = connect()
+        sql = """
+            SELECT d.npi AS npi, h.HCPCS_CODE AS code, SUM(f.TOTAL_PAID) AS paid
+            FROM {fact} f JOIN {npi} d ON f.billing_id = d.npi_id JOIN {hcpcs} h USING (hcpcs_id)
+            GROUP BY ALL ORDER BY ALL
+        """
+        results = []
+        for source in (small_csv, ingest(small_csv, cache_dir=tmp_path / "cache")):
+            fact, npi, hcpcs = key_relations(con, register_claims(con, source))
+            results.append(query(con, sql.format(fact=fact, npi=npi, hcpcs=hcpcs)))
+        assert results[0].equals(results[1])
+        assert results[0]["code"].tolist() == ["99213", "T1019"]
+        con.close()
+
+    def test_register_claims_month_window(self, small_csv, tmp_path):
+        from utils import ingest, connect, query, register_claims
+        con = connect()
+        for source in (small_csv, ingest(small_csv, cache_dir=tmp_path / "cache")):
+            view = register_claims(con, source, from_month="2018-02", to_month="2018-02")
+            df = query(con, f"SELECT HCPCS_CODE FROM {view}")
+            assert df["HCPCS_CODE"].tolist() == ["T1019"]
+        con.close()
+
+    def test_register_claims_frames_and_filters(self, small_csv, tmp_path):
+        from utils import ingest, connect, query, register_claims, provider_summary, read_csv_sql
+        con = connect()
+        frame = con.execute(f"SELECT * FROM {read_csv_sql(small_csv)}").df()
+        for source in (frame, ingest(small_csv, cache_dir=tmp_path / "cache")):
+            view = register_claims(con, source, where="HCPCS_CODE = 'T1019'")
+            assert query(con, f"SELECT COUNT(*) AS n FROM {view}")["n"][0] == 1
+            # Aggregates follow the filter (the keyed fact is rebuilt from the view)
+            summary = query(con, f"SELECT total_paid FROM {provider_summary(con, view)}")
+            assert summary["total_paid"].tolist() == [3200.0]
+        # Re-registering with another filter does not reuse the previous keys
+        view = register_claims(con, frame, where="HCPCS_CODE = '99213'")
+        assert query(con, f"SELECT total_paid FROM {provider_summary(con, view)}")["total_paid"].tolist() == [1500.5]
+        con.close()
+
+    def test_ingest_replaces_stale_cache(self, small_csv, tmp_path):
+        from utils import ingest
+        cache = tmp_path / "cache"
+        old = ingest(small_csv, cache_dir=cache)
+        with open(small_csv, "a") as f:
+            f.write("1000000003,1000000003,J1745,2018-03,11,12,99.99\n")
+        new = ingest(small_csv, cache_dir=cache)
+        assert new != old and new.exists() and not old.exists()
+
+    def test_sample_ingest_shares_dimensions(self, small_csv, tmp_path):
+        import duckdb
+        from utils import ingest, connect, query, register_claims, read_csv_sql
+        cache = tmp_path / "cache"
+        full = ingest(small_csv, cache_dir=cache)
+        sample = tmp_path / "sample.parquet"
+        con = connect()
+        register_claims(con, full)
+        con.execute(f"COPY (SELECT * FROM claims WHERE HCPCS_CODE = 'T1019') TO '{sample}' (FORMAT PARQUET)")
+
+        # Without dimensions a Parquet file is analysed as-is
+        assert ingest(sample, cache_dir=cache) == sample
+        keyed = ingest(sample, cache_dir=cache, dims=full)
+        assert keyed.is_dir() and ingest(sample, cache_dir=cache) == keyed
+        register_claims(con, keyed)
+        ids = query(con, "SELECT billing_id, hcpcs_id FROM claims_keyed")
+        assert ids.values.tolist() == [[1, 2]]    # the full dataset's ids, not renumbered from 1
+        con.close()
+
+        with open(small_csv, "a") as f:
+            f.write("1000000003,1000000003,J1745,2018-03,11,12,99.99\n")
+        other = tmp_path / "other.parquet"
+        duckdb.execute(f"COPY (SELECT * FROM {read_csv_sql(small_csv)}) TO '{other}' (FORMAT PARQUET)")
+        with pytest.raises(ValueError, match="missing from the dimensions"):
+            ingest(other, cache_dir=cache, dims=full)
+
+
+class TestStore:
+    """Verify the persistent per-dataset DuckDB store."""
+
+    def test_open_store_loads_claims_once(self, small_csv, tmp_path):
+        from utils import open_store, query
+        db = tmp_path / "claims.duckdb"
+        con = open_store(small_csv, path=db)
+        assert query(con, "SELECT COUNT(*) AS n FROM 'claims'").iloc[0]["n"] == 2
+        built = query(con, "SELECT built_at FROM _catalog WHERE name = 'claims'").iloc[0, 0]
+        con.close()
+        con = open_store(small_csv, path=db)
+        assert query(con, "SELECT built_at FROM _catalog WHERE name = 'claims'").iloc[0, 0] == built
+        con.close()
+
+    def test_materialize_skips_current_tables(self, small_csv, tmp_path):
+        from utils import open_store, materialize
+        con = open_store(small_csv, path=tmp_path / "claims.duckdb")
+        sql = "SELECT HCPCS_CODE, SUM(TOTAL_PAID) AS paid FROM claims GROUP BY 1"
+        assert materialize(con, "by_code", sql) is True
+        assert materialize(con, "by_code", sql) is False
+        con.close()
+
+    def test_changed_csv_reloads_and_drops_derived(self, small_csv, tmp_path):
+        from utils import open_store, materialize, query
+        db = tmp_path / "claims.duckdb"
+        con = open_store(small_csv, path=db)
+        materialize(con, "by_code", "SELECT HCPCS_CODE FROM claims GROUP BY 1")
+        con.close()
+        with open(small_csv, "a") as f:
+            f.write("1000000003,1000000003,J1745,2018-03,11,12,99.99\n")
+        con = open_store(small_csv, path=db)
+        assert query(con, "SELECT COUNT(*) AS n FROM claims").iloc[0]["n"] == 3
+        assert query(con, "SELECT COUNT(*) AS n FROM _catalog WHERE name = 'by_code'").iloc[0]["n"] == 0
+        con.close()
+
+    def test_read_only_attach(self, small_csv, tmp_path):
+        import duckdb
+        from utils import open_store, query
+        con = open_store(small_csv, path=tmp_path / "claims.duckdb", read_only=True)
+        assert query(con, "SELECT SUM(TOTAL_CLAIMS) AS c FROM claims").iloc[0]["c"] == 60
+        with pytest.raises(duckdb.Error):
+            con.execute("CREATE TABLE t AS SELECT 1")
+        con.close()
+
+    def test_provider_summary(self, small_csv, tmp_path):
+        from utils import open_store, provider_summary, query
+        with open(small_csv, "a") as f:
+            f.write("1000000003,1000000003,J1745,2018-03,0,0,0.00\n")
+        con = open_store(small_csv, path=tmp_path / "claims.duckdb")
+        name = provider_summary(con, "claims")
+        assert name == "provider_summary"
+        df = query(con, f"SELECT * FROM {name}").set_index("BILLING_PROVIDER_NPI_NUM")
+        assert df.loc[1000000001, "total_paid"] == pytest.approx(4700.50)
+        assert df.loc[1000000001, "n_codes"] == 2
+        assert df.loc[1000000001, "n_servicing_claimed"] == 2
+        assert df.loc[1000000003, "rows_claimed"] == 0
+        assert provider_summary(con, "claims") == name
+        con.close()
+
+    def test_monthly_summary(self, small_csv, tmp_path):
+        from utils import connect, monthly_summary, query, register_claims
+        with open(small_csv, "a") as f:
+            f.write("1000000003,1000000003,J1745,2018-02,0,0,0.00\n")
+        con = connect()
+        csv = register_claims(con, small_csv)
+        df = query(con, f"SELECT * FROM {monthly_summary(con, csv)} ORDER BY CLAIM_FROM_MONTH")
+        assert len(df) == 2
+        assert df["total_paid"].sum() == pytest.approx(4700.50)
+        assert df.iloc[1]["providers"] == 2 and df.iloc[1]["providers_valid"] == 1
+        con.close()
+
+    def test_prepare_builds_declared_aggregates_once(self, small_csv, tmp_path):
+        from utils import connect, prepare, register_claims, uses, query, monthly_summary
+        from utils import PROVIDER_SUMMARY, MONTHLY_SUMMARY
+        with pytest.raises(ValueError, match="unknown aggregates"):
+            uses("no_such_table")
+        con = connect()
+        csv = register_claims(con, small_csv)
+        assert prepare(con, csv, [MONTHLY_SUMMARY, PROVIDER_SUMMARY, MONTHLY_SUMMARY]) == [
+            MONTHLY_SUMMARY, PROVIDER_SUMMARY]
+        assert prepare(con, csv, [MONTHLY_SUMMARY, PROVIDER_SUMMARY]) == []
+        assert query(con, f"SELECT COUNT(*) AS n FROM {monthly_summary(con, csv)}").iloc[0]["n"] == 2
+        con.close()
+
+    def test_provider_code_moments(self, small_csv, tmp_path):
+        from utils import open_store, provider_code, query
+        with open(small_csv, "a") as f:
+            f.write("1000000001,1000000001,T1019,2018-03,10,10,1000.00\n")
+        con = open_store(small_csv, path=tmp_path / "claims.duckdb")
+        df = query(con, f"SELECT * FROM {provider_code(con, 'claims')} ORDER BY hcpcs_id")
+        assert len(df) == 2
+        cell = df.iloc[1]
+        assert cell["rows_claimed"] == 2 and cell["active_months"] == 2
+        assert cell["cpc_sum"] == pytest.approx(80.0 + 100.0)
+        assert cell["cpc_sumsq"] == pytest.approx(80.0 ** 2 + 100.0 ** 2)
+        assert cell["cpc_max"] == pytest.approx(100.0)
+        con.close()
+
+    def test_append_months_matches_full_load(self, small_csv, tmp_path):
+        from utils import (open_store, append_months, prepare, quantile_sketch, distinct_sketch, query,
+                           PROVIDER_SUMMARY, MONTHLY_SUMMARY, PROVIDER_CODE, PAID_SKETCH)
+        new = tmp_path / "2018-03.csv"
+        new.write_text(small_csv.read_text().splitlines()[0] + "\n"
+                       "1000000001,1000000001,T1019,2018-02,99,99,99.00\n"   # month already stored
+                       "1000000000,1000000001,A0100,2018-03,10,10,1000.00\n"
+                       "1000000001,1000000001,T1019,2018-03,10,10,1000.00\n")
+        full = tmp_path / "full.csv"
+        full.write_text(small_csv.read_text() + "".join(new.read_text().splitlines(True)[2:]))
+
+        def build(csv, db):
+            con = open_store(csv, path=db)
+            prepare(con, "claims", [PROVIDER_SUMMARY, MONTHLY_SUMMARY, PROVIDER_CODE])
+            quantile_sketch(con, "claims", PAID_SKETCH)
+            distinct_sketch(con, "claims")
+            return con
+
+        db = tmp_path / "claims.duckdb"
+        con = build(small_csv, db)
+        ids = query(con, "SELECT * FROM npi_dim ORDER BY npi_id")
+        assert [f"{m:%Y-%m}" for m in append_months(con, new)] == ["2018-03"]
+        assert append_months(con, new) == []
+        # Stored ids are kept; the new NPI is numbered after them
+        extended = query(con, "SELECT * FROM npi_dim ORDER BY npi_id")
+        pd.testing.assert_frame_equal(extended.head(len(ids)), ids)
+        assert extended["npi"].tolist()[len(ids):] == [1000000000]
+
+        expected = build(full, tmp_path / "full.duckdb")
+        decoded = {   # keyed tables compared on the NPIs / codes their ids stand for
+            "claims_keyed": """SELECT b.npi AS billing, s.npi AS servicing, h.HCPCS_CODE, f.* EXCLUDE (billing_id, servicing_id, hcpcs_id)
+                               FROM claims_keyed f JOIN npi_dim b ON f.billing_id = b.npi_id
+                               JOIN npi_dim s ON f.servicing_id = s.npi_id JOIN hcpcs_dim h USING (hcpcs_id)""",
+            "provider_code": """SELECT b.npi AS billing, h.HCPCS_CODE, f.* EXCLUDE (billing_id, hcpcs_id)
+                                FROM provider_code f JOIN npi_dim b ON f.billing_id = b.npi_id JOIN hcpcs_dim h USING (hcpcs_id)""",
+        }
+        for table in ["claims_keyed", "monthly_summary", "provider_summary", "provider_code", "paid_sketch",
+                      "distinct_sketch"]:
+            sql = decoded.get(table, f"SELECT * FROM {table}")
+            got, want = (query(c, f"SELECT * FROM ({sql}) ORDER BY ALL") for c in (con, expected))
+            pd.testing.assert_frame_equal(got, want, check_dtype=False)
+        # provider_summary is stored in NPI order, as a full build writes it
+        got, want = (query(c, "SELECT * FROM provider_summary") for c in (con, expected))
+        pd.testing.assert_frame_equal(got, want, check_dtype=False)
+        expected.close()
+        con.close()
+
+        # Reopening keeps the appended month; a changed CSV reloads without it
+        con = open_store(small_csv, path=db)
+        assert query(con, "SELECT COUNT(*) AS n FROM claims").iloc[0]["n"] == 4
+        con.close()
+        with open(small_csv, "a") as f:
+            f.write("1000000003,1000000003,J1745,2018-01,11,12,99.99\n")
+        con = open_store(small_csv, path=db)
+        assert query(con, "SELECT COUNT(*) AS n FROM claims").iloc[0]["n"] == 3
+        con.close()
+
+
+class TestMatrix:
+    """Verify the dense provider × month matrices."""
+
+    @pytest.mark.parametrize("small_csv", [3], indirect=True)
+    def test_provider_months_dense_and_cached(self, small_csv, tmp_path, monkeypatch):
+        import numpy as np
+        import utils.matrix
+        from utils import connect, ingest, provider_months, register_claims
+        monkeypatch.setattr(utils.matrix, "MATRIX_DIR", tmp_path / "matrices")
+        con = connect()
+        csv = register_claims(con, ingest(small_csv, cache_dir=tmp_path / "cache"))
+        npis, months, m = provider_months(con, csv)
+        assert npis.tolist() == [1000000001, 1000000003]
+        assert [str(d.date()) for d in months] == ["2018-01-01", "2018-02-01", "2018-03-01"]
+        paid = m["TOTAL_PAID"]
+        assert paid.dtype == np.float32 and np.isnan(paid[0, 2]) and np.isnan(paid[1, 0])
+        assert paid[0, 1] == pytest.approx(3200.00) and paid[1, 2] == pytest.approx(99.99)
+        assert len(list((tmp_path / "matrices").glob("*.npy"))) == 3
+        assert isinstance(provider_months(con, csv)[2]["TOTAL_PAID"], np.memmap)
+        con.close()
+
+    @pytest.mark.parametrize("small_csv", [3], indirect=True)
+    def test_exact_sums_per_provider_and_month(self, small_csv):
+        from utils import connect, exact_sums, register_claims
+        con = connect()
+        csv = register_claims(con, small_csv)
+        cells = pd.DataFrame({"BILLING_PROVIDER_NPI_NUM": [1000000003, 1000000001], "paid": [0.0, 0.0]})
+        got = exact_sums(con, csv, cells, {"paid": "SUM(TOTAL_PAID)"})
+        assert got["BILLING_PROVIDER_NPI_NUM"].tolist() == [1000000003, 1000000001]
+        assert got["paid"].tolist() == [99.99, 4700.50]
+        cells["CLAIM_FROM_MONTH"] = pd.to_datetime(["2018-03-01", "2018-02-01"])
+        got = exact_sums(con, csv, cells, {"paid": "SUM(TOTAL_PAID)"})
+        assert got["paid"].tolist() == [99.99, 3200.00]
+        con.close()
+
+    def test_pack_active(self):
+        import numpy as np
+        from utils import pack_active
+        values = np.array([[np.nan, 1.0, np.nan, 2.0], [3.0, np.nan, 4.0, 5.0]])
+        packed, order, counts = pack_active(values)
+        assert counts.tolist() == [2, 3]
+        assert packed[0, :2].tolist() == [1.0, 2.0] and np.isnan(packed[0, 2:]).all()
+        assert order[1, :3].tolist() == [0, 2, 3]
+
+
+class TestDistribution:
+    """Verify the DuckDB distribution summaries match their pandas counterparts."""
+
+    @pytest.fixture
+    def frame(self):
+        import numpy as np
+        rng = np.random.default_rng(0)
+        return pd.DataFrame({"g": rng.choice(["a", "b"], 500), "x": rng.lognormal(3, 1, 500),
+                             "y": rng.integers(0, 20, 500).astype(float)})
+
+    def test_describe_matches_pandas(self, frame):
+        from utils import connect, describe
+        con = connect()
+        con.register("frame", frame)
+        pcts = [0.01, 0.25, 0.5, 0.99]
+        got = describe(con, "frame", "x", pcts).iloc[0]
+        pd.testing.assert_series_equal(got, frame["x"].describe(percentiles=pcts), check_names=False)
+        by = describe(con, "frame", "x", pcts, by="g", where="y > 5").set_index("g")
+        want = frame[frame["y"] > 5].groupby("g")["x"].describe(percentiles=pcts)
+        pd.testing.assert_frame_equal(by, want, check_names=False)
+        con.close()
+
+    def test_histogram_and_correlations(self, frame):
+        import numpy as np
+        from utils import connect, histogram, correlation_matrix
+        con = connect()
+        con.register("frame", frame)
+        counts, edges = histogram(con, "frame", "x", bins=20)
+        want_counts, want_edges = np.histogram(frame["x"], bins=20)
+        assert counts.tolist() == want_counts.tolist()
+        assert edges == pytest.approx(want_edges)
+        for method in ("pearson", "spearman"):   # y has ties, which spearman averages
+            pd.testing.assert_frame_equal(correlation_matrix(con, "frame", ["x", "y"], method),
+                                          frame[["x", "y"]].corr(method=method))
+        con.close()
+
+    def test_sketch_quantiles_within_relative_error(self, frame):
+        import numpy as np
+        from utils import (connect, cursor, describe, set_approx_mode, approx_mode, sketch_sql,
+                           sketch_quantiles, RELATIVE_ERROR)
+        con = connect()
+        frame["x"] -= 20   # negative, zero-crossing and positive values
+        frame.loc[::50, "x"] = 0.0
+        con.register("frame", frame)
+        pcts = {"p1": 0.01, "p25": 0.25, "median": 0.5, "p99": 0.99}
+        con.execute(f"CREATE TABLE sketch AS {sketch_sql('frame', 'x', ['g', 'y'])}")
+        for g, values in [(None, frame["x"])] + list(frame.groupby("g")["x"]):
+            ranked = np.sort(values.to_numpy())
+            got = sketch_quantiles(con, "sketch", pcts, where=f"g = '{g}'" if g else "TRUE").iloc[0]
+            assert got["n"] == len(ranked)
+            for name, p in pcts.items():
+                want = ranked[int(p * (len(ranked) - 1))]
+                assert abs(got[name] - want) <= RELATIVE_ERROR * abs(want) + 1e-12
+
+        # Merging the per-y sketches gives the per-g sketch built directly
+        con.execute(f"CREATE TABLE direct AS {sketch_sql('frame', 'x', ['g'])}")
+        pd.testing.assert_frame_equal(sketch_quantiles(con, "sketch", pcts, ["g"]),
+                                      sketch_quantiles(con, "direct", pcts, ["g"]))
+
+        assert not approx_mode(con)
+        set_approx_mode(con)
+        assert approx_mode(cursor(con))
+        by = describe(con, "frame", "x", [0.5], by="g")
+        assert by["50%"].tolist() == sketch_quantiles(con, "direct", pcts, ["g"])["median"].tolist()
+        con.close()
+
+    def test_hll_counts_union_across_months(self):
+        from utils import (connect, cursor, hll_sql, hll_count, rolling_months_sql, distinct_sql,
+                           set_approx_distinct, approx_distinct)
+        con = connect()
+        con.execute("""
+            CREATE TABLE claims AS
+            SELECT DATE '2022-01-01' + INTERVAL (i % 24) MONTH AS CLAIM_FROM_MONTH,
+                   (i * 7919) % 60000 AS npi, 'C' || (i % 700) AS code,
+                   CASE WHEN i % 3 > 0 THEN i % 90 END AS sparse
+            FROM range(300000) r(i)
+        """)
+        con.execute(f"CREATE TABLE hll AS {hll_sql('claims', ['npi', 'code', 'sparse'], ['CLAIM_FROM_MONTH'])}")
+
+        def exact(by, where="TRUE"):
+            return con.execute(f"""
+                SELECT {by}, COUNT(DISTINCT npi), COUNT(DISTINCT code), COUNT(DISTINCT sparse)
+                FROM claims WHERE {where} GROUP BY ALL ORDER BY ALL
+            """).fetchall()
+
+        def close(est, want):
+            return abs(est - want) <= 0.03 * want
+
+        # Months union into yearly counts; NULLs are not counted
+        yearly = hll_count(con, "hll", {"year": "YEAR(CLAIM_FROM_MONTH)", "column_name": "column_name"})
+        yearly = yearly.pivot(index="year", columns="column_name", values="n_distinct")
+        for year, npis, codes, sparse in exact("YEAR(CLAIM_FROM_MONTH)"):
+            assert close(yearly.loc[year, "npi"], npis)
+            assert close(yearly.loc[year, "code"], codes)
+            assert close(yearly.loc[year, "sparse"], sparse)
+
+        # Trailing three-month windows
+        rolling = hll_count(con, f"({rolling_months_sql('hll', 3)})", ["CLAIM_FROM_MONTH"],
+                            where="column_name = 'npi'").set_index("CLAIM_FROM_MONTH")["n_distinct"]
+        month = rolling.index[5]
+        want = con.execute("""
+            SELECT COUNT(DISTINCT npi) FROM claims
+            WHERE CLAIM_FROM_MONTH BETWEEN ?::DATE - INTERVAL 2 MONTH AND ?::DATE
+        """, [month, month]).fetchone()[0]
+        assert close(rolling[month], want)
+
+        assert distinct_sql(con, "npi") == "COUNT(DISTINCT npi)"
+        set_approx_distinct(con)
+        assert approx_distinct(cursor(con))
+        assert distinct_sql(con, "npi") == "APPROX_COUNT_DISTINCT(npi)"
+        con.close()
+
+
+class TestScheduler:
+    """Verify dependency-ordered section execution."""
+
+    @staticmethod
+    def run(num, func, con, csv, *args):
+        return func(con, csv, *args)
+
+    def steps(self, calls):
+        from utils import Step
+
+        def source(con, csv):
+            calls.append(1)
+            return con.execute("SELECT 21").fetchone()[0]
+
+        def double(con, csv, value):
+            calls.append(2)
+            return value * 2
+
+        def combine(con, csv, value, extra):
+            calls.append(3)
+            return (value, extra)
+
+        return [
+            Step(1, source, output="value"),
+            Step(2, double, ("value",), output="doubled"),
+            Step(3, combine, ("doubled", "missing"), output="combined", optional={"missing": "default"}),
+        ]
+
+    def test_runs_in_dependency_order(self):
+        from utils import connect, run_steps
+        con = connect()
+        calls = []
+        timings = run_steps(con, "claims", self.steps(calls), [1, 2, 3], self.run)
+        assert calls == [1, 2, 3]
+        assert sorted(timings) == [1, 2, 3]
+        con.close()
+
+    def test_skips_step_without_required_input(self):
+        from utils import connect, run_steps
+        con = connect()
+        calls = []
+        timings = run_steps(con, "claims", self.steps(calls), [2, 3], self.run)
+        assert calls == []   # S02 needs S01's value; S03 then lacks S02's
+        assert timings == {}
+        con.close()
+
+    def test_parallel_workers_use_cursors(self):
+        from utils import connect, run_steps, Step
+        from utils.db import scratch_relation
+        con = connect()
+        table = scratch_relation(con, "shared", "SELECT 5 AS x")
+        seen = []
+
+        def read(con_, csv):
+            seen.append(con_)
+            return con_.execute(f"SELECT x FROM {table}").fetchone()[0]
+
+        steps = [Step(n, read, output=f"r{n}") for n in range(1, 5)]
+        steps.append(Step(5, lambda c, csv, *r: seen.append(sum(r)), tuple(f"r{n}" for n in range(1, 5))))
+        timings = run_steps(con, "claims", steps, range(1, 6), self.run, jobs=2)
+        assert sorted(timings) == [1, 2, 3, 4, 5]
+        assert seen[-1] == 20
+        assert all(c is not con for c in seen[:-1])
+        con.close()
+
+    def test_critical_path(self):
+        from utils.scheduler import critical_path
+        path, seconds = critical_path(self.steps([]), {1: 1.0, 2: 5.0, 3: 0.5})
+        assert path == [1, 2, 3] and seconds == 6.5
+
+    def test_manifest_reuses_unchanged_steps(self, tmp_path):
+        from utils import connect, run_steps, RunManifest
+        out, plots = tmp_path / "output", tmp_path / "plots"
+        out.mkdir()
+        (out / "01_value.txt").write_text("21")
+        con = connect()
+        calls = []
+        steps = self.steps(calls)
+
+        def run(key, selected):
+            manifest = RunManifest(steps, key, output_dir=out, plots_dir=plots)
+
+            def checkpointed(num, func, *args):
+                value = self.run(num, func, *args)
+                manifest.checkpoint(num, value)
+                return value
+
+            run_steps(con, "claims", steps, manifest.stale(selected), checkpointed, manifest=manifest)
+            return manifest
+
+        run("data-v1", [1, 2, 3])
+        manifest = RunManifest(steps, "data-v1", output_dir=out, plots_dir=plots)
+        assert list(manifest.sections[1]["outputs"]) == ["output/01_value.txt"]
+        assert manifest.stale([1, 2, 3]) == []
+
+        (out / "01_value.txt").write_text("22")           # S01's output was edited
+        calls.clear()
+        run("data-v1", [1, 2, 3])
+        assert calls == [1]
+
+        calls.clear()                                     # S01's value is reloaded from disk
+        assert run_steps(con, "claims", steps, [2], self.run, manifest=manifest) is not None
+        assert calls == [2]
+
+        calls.clear()
+        assert run("data-v2", [1, 2, 3]).stale([1, 2, 3]) == []
+        assert calls == [1, 2, 3]                         # new data reruns everything
+        con.close()
+
+    def test_checkpoint_waits_for_upstream(self, tmp_path):
+        from utils import RunManifest
+        manifest = RunManifest(self.steps([]), "data", output_dir=tmp_path, plots_dir=tmp_path)
+        manifest.checkpoint(2, 42)       # ran without S01's value: not recorded
+        assert not manifest.current(2)
+        manifest.checkpoint(1, 21)
+        manifest.checkpoint(2, 42)
+        assert manifest.current(2)
+        reloaded = RunManifest(self.steps([]), "data", output_dir=tmp_path, plots_dir=tmp_path)
+        assert reloaded.load_result(reloaded.steps[2]) == 42
+
+    def test_manifest_records_files_the_section_wrote(self, tmp_path):
+        import os
+        import time
+        from utils import RunManifest
+        out, plots = tmp_path / "output", tmp_path / "plots"
+        for d in (out / "fraud", out / "1pct", plots / "10pct"):
+            d.mkdir(parents=True)
+        for path in (out / "01_old.csv", out / "1pct" / "01_value.txt", plots / "10pct" / "01_value.png"):
+            path.write_text("x")
+        os.utime(out / "01_old.csv", (time.time() - 3600,) * 2)   # left over from an earlier run
+        manifest = RunManifest(self.steps([]), "data", output_dir=out, plots_dir=plots)
+        started = time.time()
+        (out / "01_value.txt").write_text("21")
+        (out / "fraud" / "01_flags.csv").write_text("npi")
+        manifest.checkpoint(1, 21, started=started)
+        assert sorted(manifest.sections[1]["outputs"]) == ["output/01_value.txt", "output/fraud/01_flags.csv"]
+
+    def test_manifest_skips_sections_with_deferred_plots(self, tmp_path, monkeypatch):
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+        from utils import RunManifest, defer_plots
+        from utils.config import PLOTS_DIR
+        from utils import render
+        monkeypatch.setitem(render._state, "spec_dir", None)
+        monkeypatch.setitem(render._state, "deferred", [])
+        manifest = RunManifest(self.steps([]), "data", output_dir=tmp_path, plots_dir=tmp_path)
+        defer_plots(tmp_path / "specs")
+        fig = plt.figure()
+        assert render.render_figure(fig, PLOTS_DIR / "01_value.png") == "deferred"
+        plt.close(fig)
+        manifest.checkpoint(1, 21)
+        manifest.record([1])
+        assert not manifest.current(1)     # the PNG is not drawn: S01 runs again next time
+
+    def test_journal_tracks_interrupted_run(self, tmp_path):
+        from utils import journal, interrupted_run
+        path = tmp_path / "run_journal.jsonl"
+        assert interrupted_run(path) is None
+        journal("start", path, argv=["--sample"])
+        journal("completed", path, section=1, seconds=0.5)
+        assert interrupted_run(path) == (["--sample"], [1])      # killed mid-run
+        journal("failed", path, section=2)
+        journal("finish", path, failed=[2])
+        assert interrupted_run(path) == (["--sample"], [1])      # finished with a failure
+        journal("start", path, argv=["--sample"])
+        journal("finish", path, failed=[])
+        assert interrupted_run(path) is None
+
+
+@pytest.mark.parametrize("small_csv", [1], indirect=True)
+class TestSchema:
+    """Verify the declared schema and typed read path."""
+
+    def test_read_csv_sql_types(self, small_csv):
+        from utils import connect, read_csv_sql, CLAIMS_SCHEMA
+        con = connect()
+        types = {r[0]: r[1] for r in con.execute(f"DESCRIBE SELECT * FROM {read_csv_sql(small_csv)}").fetchall()}
+        assert types == CLAIMS_SCHEMA
+        month = con.execute(f"SELECT CLAIM_FROM_MONTH FROM {read_csv_sql(small_csv)}").fetchone()[0]
+        assert str(month) == "2018-01-01"
+        con.close()
+
+    def test_validate_schema_rejects_sniffed_csv(self, small_csv):
+        from utils import connect, validate_schema
+        con = connect()
+        with pytest.raises(ValueError, match="CLAIM_FROM_MONTH"):
+            validate_schema(con, f"'{small_csv}'")
+        con.close()
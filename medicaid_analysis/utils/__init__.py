@@ -4,19 +4,66 @@ Re-exports all helpers for convenient importing.
 """
 
 from .config import (
-    log, BASE_DIR, DATA_DIR, FULL_CSV, SAMPLE_CSV, OUTPUT_DIR, PLOTS_DIR,
+    log, BASE_DIR, DATA_DIR, FULL_CSV, SAMPLE_CSV, SAMPLE_PARQUET, OUTPUT_DIR, PLOTS_DIR, CACHE_DIR,
     FULL_ROW_COUNT, FULL_TOTAL_PAID, FULL_TOTAL_CLAIMS,
     FULL_BILLING_NPIS, FULL_SERVICING_NPIS, FULL_HCPCS_CODES,
 )
 from .formatting import usd_fmt, usd, num_fmt, pct_fmt
 from .io import savefig, save_csv, banner
-from .db import connect, query
+from .render import (
+    set_plot_theme, render_lock, figure, subplots, start_plot_workers, defer_plots, finish_plots, render_specs,
+)
+from .db import connect, cursor, query
+from .query_cache import enable_query_cache, log_query_cache_stats
+from .schema import CLAIMS_SCHEMA, MONTH_FORMAT, WEIGHT_COLUMN, read_csv_sql, validate_schema
+from .ingest import fingerprint, ingest, register_claims
+from .store import CLAIMS_TABLE, open_store, materialize, catalog_fingerprint
+from .keys import key_relations
+from .aggregates import (
+    provider_summary, monthly_summary, provider_code, cost_metrics, quantile_sketch, distinct_sketch,
+    uses, prepare, PROVIDER_SUMMARY, MONTHLY_SUMMARY, PROVIDER_CODE, PAID_SKETCH, CPC_SKETCH,
+    HCPCS_CATEGORY, DISTINCT_COLUMNS, SPECS_VERSION,
+)
+from .sketches import (
+    RELATIVE_ERROR, HLL_PRECISION, set_approx_mode, approx_mode, set_approx_distinct, approx_distinct,
+    distinct_sql, sketch_sql, sketch_quantiles_sql, sketch_quantiles, hll_sql, hll_count_sql, hll_count,
+    rolling_months_sql,
+)
+from .append import append_months
+from .distribution import describe, histogram, correlation_matrix
+from .matrix import provider_months, exact_sums, pack_active
+from .scheduler import Step, run_steps, log_schedule_report
+from .manifest import RunManifest, journal, interrupted_run
+from .estimates import (
+    Z_95, SampleDesign, read_sample_design, set_sample_design, sample_design,
+    estimate_totals, estimate_distinct, estimate_quantiles,
+    weighted_gini, bootstrap_interval, perturbed_estimate,
+)
 
 __all__ = [
-    "log", "BASE_DIR", "DATA_DIR", "FULL_CSV", "SAMPLE_CSV", "OUTPUT_DIR", "PLOTS_DIR",
+    "log", "BASE_DIR", "DATA_DIR", "FULL_CSV", "SAMPLE_CSV", "SAMPLE_PARQUET", "OUTPUT_DIR", "PLOTS_DIR", "CACHE_DIR",
     "FULL_ROW_COUNT", "FULL_TOTAL_PAID", "FULL_TOTAL_CLAIMS",
     "FULL_BILLING_NPIS", "FULL_SERVICING_NPIS", "FULL_HCPCS_CODES",
     "usd_fmt", "usd", "num_fmt", "pct_fmt",
     "savefig", "save_csv", "banner",
-    "connect", "query",
+    "set_plot_theme", "render_lock", "figure", "subplots",
+    "start_plot_workers", "defer_plots", "finish_plots", "render_specs",
+    "connect", "cursor", "query", "enable_query_cache", "log_query_cache_stats",
+    "CLAIMS_SCHEMA", "MONTH_FORMAT", "WEIGHT_COLUMN", "read_csv_sql", "validate_schema",
+    "fingerprint", "ingest", "register_claims",
+    "CLAIMS_TABLE", "open_store", "materialize", "catalog_fingerprint", "append_months",
+    "key_relations", "provider_summary", "monthly_summary", "provider_code", "cost_metrics",
+    "quantile_sketch", "distinct_sketch", "uses", "prepare",
+    "PROVIDER_SUMMARY", "MONTHLY_SUMMARY", "PROVIDER_CODE", "PAID_SKETCH", "CPC_SKETCH",
+    "HCPCS_CATEGORY", "DISTINCT_COLUMNS", "SPECS_VERSION",
+    "RELATIVE_ERROR", "HLL_PRECISION", "set_approx_mode", "approx_mode", "set_approx_distinct",
+    "approx_distinct", "distinct_sql", "sketch_sql", "sketch_quantiles_sql", "sketch_quantiles",
+    "hll_sql", "hll_count_sql", "hll_count", "rolling_months_sql",
+    "describe", "histogram", "correlation_matrix",
+    "provider_months", "exact_sums", "pack_active",
+    "Step", "run_steps", "log_schedule_report",
+    "RunManifest", "journal", "interrupted_run",
+    "Z_95", "SampleDesign", "read_sample_design", "set_sample_design", "sample_design",
+    "estimate_totals", "estimate_distinct", "estimate_quantiles",
+    "weighted_gini", "bootstrap_interval", "perturbed_estimate",
 ]
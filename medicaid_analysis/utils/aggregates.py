@@ -0,0 +1,305 @@
+"""
+Medicaid Analysis — Shared Aggregate Tables
+
+Aggregates that several sections need are computed once per dataset and kept as
+tables. Each helper returns the table name to select from, building it on first
+use. In the persistent store (``--db``) aggregates of the full ``claims`` table
+are materialized in the database and reused across runs.
+
+Each aggregate is declared in ``SPECS`` as grouping keys plus named measures, the
+union of what the sections at that grain need, and is built with one GROUP BY.
+Sections declare the aggregates they read with ``@uses(...)`` so the pipeline can
+``prepare`` all of them before any section runs.
+
+``cost_metrics`` is the row-level counterpart: a view of per-row unit costs that
+sections summarize in SQL instead of loading the rows.
+
+``SKETCHES`` declares the shared quantile sketches (see ``sketches``) that
+``--approx`` reads percentiles from, kept per CLAIM_FROM_MONTH and stored alongside
+the aggregates. ``distinct_sketch`` is the HyperLogLog counterpart behind
+``--approx-distinct``, per month and HCPCS category.
+"""
+
+import hashlib
+
+import duckdb
+
+from .db import scratch_relation
+from .keys import key_relations, relation_exists
+from .sketches import RELATIVE_ERROR, HLL_PRECISION, sketch_sql, hll_sql
+from .store import CLAIMS_TABLE, catalog_fingerprint, materialize
+
+PROVIDER_SUMMARY = "provider_summary"
+MONTHLY_SUMMARY  = "monthly_summary"
+PROVIDER_CODE    = "provider_code"
+
+CLAIMED = "TOTAL_CLAIMS > 0"
+VALID   = "TOTAL_CLAIMS > 0 AND TOTAL_UNIQUE_BENEFICIARIES > 0"
+
+# name → (grouping keys over the keyed fact, [(column, aggregate)])
+SPECS = {
+    # Per billing provider. The *_claimed variants only count rows with TOTAL_CLAIMS > 0,
+    # for sections that exclude zero-claim rows before aggregating; rows_claimed = 0
+    # marks providers that have no such rows at all. Decoded to NPIs.
+    PROVIDER_SUMMARY: (("billing_id",), [
+        ("total_paid",            "SUM(TOTAL_PAID)"),
+        ("total_claims",          "SUM(TOTAL_CLAIMS)"),
+        ("total_bene",            "SUM(TOTAL_UNIQUE_BENEFICIARIES)"),
+        ("n_codes",               "COUNT(DISTINCT hcpcs_id)"),
+        ("active_months",         "COUNT(DISTINCT CLAIM_FROM_MONTH)"),
+        ("first_month",           "MIN(CLAIM_FROM_MONTH)"),
+        ("last_month",            "MAX(CLAIM_FROM_MONTH)"),
+        ("avg_cpc",               "AVG(TOTAL_PAID / NULLIF(TOTAL_CLAIMS, 0))"),
+        ("rows_claimed",          f"COUNT(*) FILTER (WHERE {CLAIMED})"),
+        ("total_paid_claimed",    f"SUM(TOTAL_PAID) FILTER (WHERE {CLAIMED})"),
+        ("total_claims_claimed",  f"SUM(TOTAL_CLAIMS) FILTER (WHERE {CLAIMED})"),
+        ("total_bene_claimed",    f"SUM(TOTAL_UNIQUE_BENEFICIARIES) FILTER (WHERE {CLAIMED})"),
+        ("n_codes_claimed",       f"COUNT(DISTINCT hcpcs_id) FILTER (WHERE {CLAIMED})"),
+        ("active_months_claimed", f"COUNT(DISTINCT CLAIM_FROM_MONTH) FILTER (WHERE {CLAIMED})"),
+        ("n_servicing_claimed",   f"COUNT(DISTINCT servicing_id) FILTER (WHERE {CLAIMED})"),
+        ("max_paid_claimed",      f"MAX(TOTAL_PAID) FILTER (WHERE {CLAIMED})"),
+    ]),
+    # Per month. The *_valid variants only count rows with both TOTAL_CLAIMS and
+    # TOTAL_UNIQUE_BENEFICIARIES > 0 (the per-claim / per-beneficiary averages need both).
+    MONTHLY_SUMMARY: (("CLAIM_FROM_MONTH",), [
+        ("total_paid",         "SUM(TOTAL_PAID)"),
+        ("total_claims",       "SUM(TOTAL_CLAIMS)"),
+        ("total_bene",         "SUM(TOTAL_UNIQUE_BENEFICIARIES)"),
+        ("providers",          "COUNT(DISTINCT billing_id)"),
+        ("codes",              "COUNT(DISTINCT hcpcs_id)"),
+        ("total_paid_valid",   f"SUM(TOTAL_PAID) FILTER (WHERE {VALID})"),
+        ("total_claims_valid", f"SUM(TOTAL_CLAIMS) FILTER (WHERE {VALID})"),
+        ("total_bene_valid",   f"SUM(TOTAL_UNIQUE_BENEFICIARIES) FILTER (WHERE {VALID})"),
+        ("providers_valid",    f"COUNT(DISTINCT billing_id) FILTER (WHERE {VALID})"),
+        ("codes_valid",        f"COUNT(DISTINCT hcpcs_id) FILTER (WHERE {VALID})"),
+        ("avg_cpc_valid",      f"AVG(TOTAL_PAID / TOTAL_CLAIMS) FILTER (WHERE {VALID})"),
+        ("avg_cpb_valid",      f"AVG(TOTAL_PAID / TOTAL_UNIQUE_BENEFICIARIES) FILTER (WHERE {VALID})"),
+    ]),
+    # Billing provider × HCPCS cells, on surrogate keys. The cpc_* columns are moments of
+    # the per-row cost per claim over rows with TOTAL_CLAIMS > 0 (rows_claimed of them),
+    # from which per-code means / standard deviations and row-level z-score sums follow
+    # exactly. The *_valid columns count rows with TOTAL_CLAIMS and beneficiaries > 0.
+    PROVIDER_CODE: (("billing_id", "hcpcs_id"), [
+        ("total_paid",           "SUM(TOTAL_PAID)"),
+        ("total_claims",         "SUM(TOTAL_CLAIMS)"),
+        ("total_bene",           "SUM(TOTAL_UNIQUE_BENEFICIARIES)"),
+        ("active_months",        "COUNT(DISTINCT CLAIM_FROM_MONTH)"),
+        ("rows_claimed",         f"COUNT(*) FILTER (WHERE {CLAIMED})"),
+        ("total_paid_claimed",   f"SUM(TOTAL_PAID) FILTER (WHERE {CLAIMED})"),
+        ("total_claims_claimed", f"SUM(TOTAL_CLAIMS) FILTER (WHERE {CLAIMED})"),
+        ("cpc_sum",              f"SUM(TOTAL_PAID / TOTAL_CLAIMS) FILTER (WHERE {CLAIMED})"),
+        ("cpc_sumsq",            f"SUM(POW(TOTAL_PAID / TOTAL_CLAIMS, 2)) FILTER (WHERE {CLAIMED})"),
+        ("cpc_max",              f"MAX(TOTAL_PAID / TOTAL_CLAIMS) FILTER (WHERE {CLAIMED})"),
+        ("rows_valid",           f"COUNT(*) FILTER (WHERE {VALID})"),
+        ("total_paid_valid",     f"SUM(TOTAL_PAID) FILTER (WHERE {VALID})"),
+        ("total_claims_valid",   f"SUM(TOTAL_CLAIMS) FILTER (WHERE {VALID})"),
+        ("total_bene_valid",     f"SUM(TOTAL_UNIQUE_BENEFICIARIES) FILTER (WHERE {VALID})"),
+        ("active_months_valid",  f"COUNT(DISTINCT CLAIM_FROM_MONTH) FILTER (WHERE {VALID})"),
+    ]),
+}
+
+PAID_SKETCH = "paid_sketch"
+CPC_SKETCH  = "cpc_sketch"
+
+# name → (value expression, grouping columns, row filter). Every sketch is also grouped
+# by CLAIM_FROM_MONTH, so its buckets merge into any range of months.
+SKETCHES = {
+    PAID_SKETCH: ("TOTAL_PAID", (), "TRUE"),
+    CPC_SKETCH:  ("TOTAL_PAID / TOTAL_CLAIMS", ("HCPCS_CODE",), CLAIMED),
+}
+
+# HCPCS category of a code, by prefix or CPT range
+HCPCS_CATEGORY = """
+    CASE
+        WHEN HCPCS_CODE LIKE '99%' THEN 'E&M (99xxx)'
+        WHEN HCPCS_CODE LIKE 'T%'  THEN 'State Codes (T)'
+        WHEN HCPCS_CODE LIKE 'S%'  THEN 'Commercial (S)'
+        WHEN HCPCS_CODE LIKE 'J%'  THEN 'Drugs (J)'
+        WHEN HCPCS_CODE LIKE 'H%'  THEN 'Behavioral Health (H)'
+        WHEN HCPCS_CODE LIKE 'G%'  THEN 'Temporary Procedures (G)'
+        WHEN HCPCS_CODE LIKE 'A%'  THEN 'Transport/Supplies (A)'
+        WHEN HCPCS_CODE LIKE 'D%'  THEN 'Dental (D)'
+        WHEN HCPCS_CODE LIKE 'E%'  THEN 'DME (E)'
+        WHEN HCPCS_CODE LIKE 'L%'  THEN 'Orthotics/Prosthetics (L)'
+        WHEN HCPCS_CODE LIKE 'V%'  THEN 'Vision/Hearing (V)'
+        WHEN HCPCS_CODE BETWEEN '00100' AND '01999' THEN 'Anesthesia'
+        WHEN HCPCS_CODE BETWEEN '10004' AND '69990' THEN 'Surgery'
+        WHEN HCPCS_CODE BETWEEN '70010' AND '79999' THEN 'Radiology'
+        WHEN HCPCS_CODE BETWEEN '80047' AND '89398' THEN 'Pathology/Lab'
+        WHEN HCPCS_CODE BETWEEN '90281' AND '99199' THEN 'Medicine'
+        ELSE 'Other'
+    END"""
+
+DISTINCT_SKETCH = "distinct_sketch"
+DISTINCT_COLUMNS = ("BILLING_PROVIDER_NPI_NUM", "SERVICING_PROVIDER_NPI_NUM", "HCPCS_CODE")
+
+# Changes whenever a spec does, so cached results built on these tables are not reused
+SPECS_VERSION = hashlib.sha1(repr((SPECS, SKETCHES, RELATIVE_ERROR, HCPCS_CATEGORY, DISTINCT_COLUMNS,
+                                   HLL_PRECISION)).encode()).hexdigest()[:8]
+
+
+def uses(*names):
+    """Decorator declaring which shared aggregates a section reads (see ``prepare``)."""
+    unknown = set(names) - set(SPECS)
+    if unknown:
+        raise ValueError(f"unknown aggregates: {', '.join(sorted(unknown))}")
+
+    def mark(func):
+        func.aggregates = names
+        return func
+    return mark
+
+
+def _finish_sql(name: str, grouped: str, npi_dim: str) -> str:
+    """Final table SQL from a relation holding ``name``'s keys and measure columns."""
+    keys, measures = SPECS[name]
+    columns = ", ".join(f"g.{col}" for col, _ in measures)
+    order = ", ".join(f"g.{k}" for k in keys)
+    if name == PROVIDER_SUMMARY:
+        return f"""
+            SELECT d.npi AS BILLING_PROVIDER_NPI_NUM, {columns}
+            FROM {grouped} g LEFT JOIN {npi_dim} d ON g.billing_id = d.npi_id
+            ORDER BY d.npi
+        """
+    return f"SELECT {order}, {columns} FROM {grouped} g ORDER BY {order}"
+
+
+def _source_tag(con, csv: str) -> str:
+    """Short hash identifying a relation (and its view definition, if it is a view)."""
+    row = con.execute("SELECT sql FROM duckdb_views() WHERE view_name = ?", [csv]).fetchone()
+    return hashlib.sha1(f"{csv}\n{row[0] if row else ''}".encode()).hexdigest()[:8]
+
+
+def _is_built(con, csv: str, base: str) -> bool:
+    """Whether ``shared_table`` would find ``base`` already built for ``csv``."""
+    if (relation_exists(con, "_catalog") and csv == CLAIMS_TABLE
+            and catalog_fingerprint(con, base) == catalog_fingerprint(con, CLAIMS_TABLE)):
+        return True
+    return relation_exists(con, f"{base}_{_source_tag(con, csv)}")
+
+
+def shared_table(con, csv: str, base: str, sql: str) -> str:
+    """Build (once) and return the name of a table holding ``sql`` for the data behind ``csv``.
+
+    Aggregates of the stored ``claims`` table are materialized in the persistent
+    store; anything else is kept for the lifetime of the connection.
+    """
+    in_store = relation_exists(con, "_catalog")
+    if in_store and csv == CLAIMS_TABLE:
+        try:
+            materialize(con, base, sql)
+            return base
+        except duckdb.Error:
+            pass   # read-only attach: fall back to a connection-local table
+    return scratch_relation(con, f"{base}_{_source_tag(con, csv)}", sql)
+
+
+def aggregate_sql(name: str, fact: str, npi_dim: str) -> str:
+    """SQL for the shared aggregate ``name`` over the keyed fact relation ``fact``."""
+    keys, measures = SPECS[name]
+    grouped = f"""(
+        SELECT {', '.join(keys)}, {', '.join(f'{expr} AS {col}' for col, expr in measures)}
+        FROM {fact} GROUP BY {', '.join(keys)}
+    )"""
+    return _finish_sql(name, grouped, npi_dim)
+
+
+def aggregate(con, csv: str, name: str) -> str:
+    """Build (once) and return the table for the shared aggregate ``name`` on its own."""
+    fact, npi_dim, _ = key_relations(con, csv)
+    return shared_table(con, csv, name, aggregate_sql(name, fact, npi_dim))
+
+
+def prepare(con, csv: str, names) -> list:
+    """Build every aggregate in ``names`` that is not built yet; returns the names built.
+
+    Each aggregate is one multi-measure GROUP BY serving every section at its grain;
+    grains are built separately rather than fused into ``GROUPING SETS``, which is slower.
+    """
+    todo = [n for n in dict.fromkeys(names) if not _is_built(con, csv, n)]
+    for name in todo:
+        aggregate(con, csv, name)
+    return todo
+
+
+def provider_summary(con, csv: str) -> str:
+    """Per-billing-provider summary table (one row per NPI) for the data behind ``csv``.
+
+    Columns: BILLING_PROVIDER_NPI_NUM, total_paid, total_claims, total_bene, n_codes,
+    active_months, first_month, last_month, avg_cpc, and ``*_claimed`` variants
+    restricted to rows with TOTAL_CLAIMS > 0 (rows_claimed, total_paid_claimed,
+    total_claims_claimed, total_bene_claimed, n_codes_claimed, active_months_claimed,
+    n_servicing_claimed, max_paid_claimed).
+    """
+    return aggregate(con, csv, PROVIDER_SUMMARY)
+
+
+def monthly_summary(con, csv: str) -> str:
+    """Per-month summary table (one row per CLAIM_FROM_MONTH) for the data behind ``csv``.
+
+    Columns: CLAIM_FROM_MONTH, total_paid, total_claims, total_bene, providers, codes,
+    and ``*_valid`` variants restricted to rows with TOTAL_CLAIMS > 0 and
+    TOTAL_UNIQUE_BENEFICIARIES > 0 (total_paid_valid, total_claims_valid,
+    total_bene_valid, providers_valid, codes_valid, avg_cpc_valid, avg_cpb_valid).
+    """
+    return aggregate(con, csv, MONTHLY_SUMMARY)
+
+
+def provider_code(con, csv: str) -> str:
+    """Billing-provider × HCPCS table (one row per ``billing_id``, ``hcpcs_id``) for ``csv``.
+
+    Keyed on surrogate ids (decode through the dimensions from ``key_relations``).
+    Columns: total_paid, total_claims, total_bene, active_months; over rows with
+    TOTAL_CLAIMS > 0: rows_claimed, total_paid_claimed, total_claims_claimed and the
+    cost-per-claim moments cpc_sum, cpc_sumsq, cpc_max; over rows that also have
+    beneficiaries: rows_valid, total_paid_valid, total_claims_valid, total_bene_valid,
+    active_months_valid.
+    """
+    return aggregate(con, csv, PROVIDER_CODE)
+
+
+def cost_metrics(con, csv: str) -> str:
+    """View of the rows of ``csv`` with claims and beneficiaries, with their unit costs.
+
+    Columns: BILLING_PROVIDER_NPI_NUM, HCPCS_CODE, TOTAL_PAID, TOTAL_CLAIMS,
+    TOTAL_UNIQUE_BENEFICIARIES, cost_per_claim, cost_per_beneficiary. Being a view,
+    it is evaluated by each query that reads it rather than held in memory.
+    """
+    return scratch_relation(con, f"cost_metrics_{_source_tag(con, csv)}", f"""
+        SELECT BILLING_PROVIDER_NPI_NUM, HCPCS_CODE, TOTAL_PAID, TOTAL_CLAIMS,
+               TOTAL_UNIQUE_BENEFICIARIES,
+               TOTAL_PAID / NULLIF(TOTAL_CLAIMS, 0)               AS cost_per_claim,
+               TOTAL_PAID / NULLIF(TOTAL_UNIQUE_BENEFICIARIES, 0) AS cost_per_beneficiary
+        FROM {csv}
+        WHERE {VALID}
+    """, view=True)
+
+
+def quantile_sketch(con, csv: str, name: str) -> str:
+    """Build (once) and return the table for the shared quantile sketch ``name`` (see ``SKETCHES``).
+
+    Columns: the sketch's grouping columns, CLAIM_FROM_MONTH, sign, bucket, n; read
+    percentiles with ``sketch_quantiles``, which merges the months.
+    """
+    return shared_table(con, csv, name, quantile_sketch_sql(csv, name))
+
+
+def quantile_sketch_sql(csv: str, name: str) -> str:
+    """SQL for the shared quantile sketch ``name`` over the claims relation ``csv``."""
+    expr, by, where = SKETCHES[name]
+    return sketch_sql(csv, expr, (*by, "CLAIM_FROM_MONTH"), where)
+
+
+def distinct_sketch(con, csv: str) -> str:
+    """Build (once) and return the HyperLogLog sketch table of ``DISTINCT_COLUMNS`` for ``csv``.
+
+    One sketch per CLAIM_FROM_MONTH, HCPCS category and column (column_name); read
+    distinct counts over any months / categories with ``hll_count``.
+    """
+    return shared_table(con, csv, DISTINCT_SKETCH, distinct_sketch_sql(csv))
+
+
+def distinct_sketch_sql(csv: str) -> str:
+    """SQL for the shared HyperLogLog sketch table over the claims relation ``csv``."""
+    by = {"CLAIM_FROM_MONTH": "CLAIM_FROM_MONTH", "category": HCPCS_CATEGORY}
+    return hll_sql(csv, DISTINCT_COLUMNS, by)
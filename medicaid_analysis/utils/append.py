@@ -0,0 +1,184 @@
+"""
+Medicaid Analysis — Appending New Months to the Store
+
+CMS publishes the dataset a month at a time. ``append_months`` adds the months of
+a new file to the persistent store (``--db``) and brings every stored table up to
+date from the new rows alone, instead of reloading and re-aggregating the full
+dataset:
+
+* ``claims`` and ``claims_keyed`` gain the new rows. Months already in the store
+  are skipped, so re-appending a file is a no-op.
+* NPIs and codes seen for the first time join the dimensions with ids after the
+  largest existing one, so stored ids, and every table keyed on them, stay valid.
+* Tables grouped by month — ``monthly_summary`` and every sketch — gain the new
+  months' rows.
+* Aggregates whose measures are all mergeable (sums, counts, MIN / MAX, and
+  distinct months, which add up because the appended months are new) are merged
+  group by group with the new months' aggregate: ``provider_code``, i.e. the
+  per-code peer moments.
+* Any other aggregate (``provider_summary``, for its distinct code / servicing
+  counts and average cost per claim) is recomputed for the groups the new rows
+  fall in — the billing providers active in the new months — from those groups'
+  rows in the keyed fact; the other groups keep their stored rows. Other derived
+  tables are dropped and rebuilt on first use.
+
+The raw ``claims`` rows already in the store are never re-read, and stored rows
+are only rewritten where new rows change them; the one read of older data is the
+keyed fact rows of the providers ``provider_summary`` recomputes. Each appended
+file is recorded in ``_appends`` and chained into the store's fingerprint, so
+sections, the query cache and the run manifest see new data.
+"""
+
+import time
+from datetime import datetime
+from pathlib import Path
+
+from .config import log
+from .aggregates import (
+    SPECS, SKETCHES, PROVIDER_SUMMARY, DISTINCT_SKETCH, aggregate_sql, quantile_sketch_sql, distinct_sketch_sql,
+)
+from .ingest import fingerprint
+from .keys import NPI_DIM, HCPCS_DIM, npi_dim_sql, hcpcs_dim_sql, encode_sql
+from .schema import read_csv_sql, validate_schema
+from .store import (
+    CLAIMS_TABLE, KEYED_TABLE, BASE_TABLES, catalog_fingerprint, chain_fingerprint, record_append,
+)
+
+_NEW = "_append_rows"        # the appended rows, in the declared schema
+_NEW_KEYED = "_append_keyed"  # ... with surrogate keys
+
+# dimension → (id column, value column, SQL building it)
+_DIMS = {
+    NPI_DIM:   ("npi_id", "npi", npi_dim_sql),
+    HCPCS_DIM: ("hcpcs_id", "HCPCS_CODE", hcpcs_dim_sql),
+}
+
+
+def _merge_sql(column: str, expr: str):
+    """SQL combining a measure of the stored (``a``) and new (``b``) rows of a group, or None."""
+    if expr.startswith(("SUM(", "COUNT(*)", "COUNT(DISTINCT CLAIM_FROM_MONTH)")):
+        return f"COALESCE(a.{column} + b.{column}, a.{column}, b.{column})"
+    if expr.startswith("MIN("):
+        return f"LEAST(a.{column}, b.{column})"
+    if expr.startswith("MAX("):
+        return f"GREATEST(a.{column}, b.{column})"
+    return None
+
+
+def _extend(con, dim: str) -> int:
+    """Add the new rows' unseen values to ``dim``, numbered after its largest id; returns how many."""
+    id_col, value, build = _DIMS[dim]
+    return con.execute(f"""
+        INSERT INTO {dim}
+        SELECT CAST((SELECT COALESCE(MAX({id_col}), 0) FROM {dim}) + ROW_NUMBER() OVER (ORDER BY {value})
+                    AS INTEGER) AS {id_col}, {value}
+        FROM ({build(_NEW)}) n ANTI JOIN {dim} USING ({value})
+    """).fetchone()[0]
+
+
+def _update_aggregate(con, name: str) -> str:
+    """Bring the stored aggregate ``name`` up to date with the new rows; returns how."""
+    keys, measures = SPECS[name]
+    new = aggregate_sql(name, _NEW_KEYED, NPI_DIM)
+    if "CLAIM_FROM_MONTH" in keys:
+        con.execute(f"""
+            CREATE OR REPLACE TABLE {name} AS
+            SELECT * FROM (SELECT * FROM {name} UNION ALL BY NAME {new}) ORDER BY {', '.join(keys)}
+        """)
+        return "appended"
+    merged = [(col, _merge_sql(col, expr)) for col, expr in measures]
+    on = ["BILLING_PROVIDER_NPI_NUM"] if name == PROVIDER_SUMMARY else list(keys)   # as finished
+    if any(sql is None for _, sql in merged):
+        group = ", ".join(keys)
+        rows = f"(SELECT * FROM {KEYED_TABLE} SEMI JOIN (SELECT DISTINCT {group} FROM {_NEW_KEYED}) USING ({group}))"
+        con.execute(f"CREATE OR REPLACE TEMP TABLE _append_groups AS {aggregate_sql(name, rows, NPI_DIM)}")
+        con.execute(f"""
+            CREATE OR REPLACE TABLE {name} AS
+            SELECT * FROM (
+                SELECT * FROM {name} ANTI JOIN _append_groups USING ({', '.join(on)})
+                UNION ALL BY NAME SELECT * FROM _append_groups
+            ) ORDER BY {', '.join(on)}
+        """)
+        return "recomputed"
+    types = dict(con.execute(f"SELECT column_name, column_type FROM (DESCRIBE {name})").fetchall())
+    columns = ", ".join(f"CAST({sql} AS {types[col]}) AS {col}" for col, sql in merged)
+    con.execute(f"""
+        CREATE OR REPLACE TABLE {name} AS
+        SELECT {', '.join(on)}, {columns}
+        FROM {name} a FULL JOIN ({new}) b USING ({', '.join(on)})
+        ORDER BY {', '.join(on)}
+    """)
+    return "merged"
+
+
+def append_months(con, source) -> list:
+    """Append the months of the claims file ``source`` that the store lacks; returns them.
+
+    ``source`` is a CSV (read with the declared schema) or Parquet file; rows
+    without a CLAIM_FROM_MONTH are not appended. The store
+    (``open_store``, writable) and every stored aggregate and sketch are updated in
+    one transaction (see the module docstring); nothing changes if it fails.
+    """
+    source = Path(source)
+    t0 = time.time()
+    reader = f"read_parquet('{source}')" if source.suffix == ".parquet" else read_csv_sql(source)
+    con.execute(f"CREATE OR REPLACE TEMP TABLE {_NEW} AS SELECT * FROM {reader} WHERE CLAIM_FROM_MONTH IS NOT NULL")
+    validate_schema(con, _NEW)
+    months = [r[0] for r in con.execute(
+        f"SELECT DISTINCT CLAIM_FROM_MONTH FROM {_NEW} ORDER BY 1").fetchall()]
+    # Month filters skip the stored row groups of other months
+    present = [r[0] for r in con.execute(f"""
+        SELECT DISTINCT CLAIM_FROM_MONTH FROM {CLAIMS_TABLE}
+        WHERE CLAIM_FROM_MONTH IN (SELECT CLAIM_FROM_MONTH FROM {_NEW})
+        ORDER BY 1
+    """).fetchall()]
+    if present:
+        log.info("  Skipping months already stored: %s", ", ".join(f"{m:%Y-%m}" for m in present))
+        con.execute(f"DELETE FROM {_NEW} WHERE list_contains(?, CLAIM_FROM_MONTH)", [present])
+    months = [m for m in months if m not in present]
+    if not months:
+        log.info("Nothing to append from %s", source.name)
+        return []
+
+    fp = chain_fingerprint(catalog_fingerprint(con, CLAIMS_TABLE), fingerprint(source))
+    con.execute("BEGIN TRANSACTION")
+    try:
+        con.execute(f"INSERT INTO {CLAIMS_TABLE} BY NAME SELECT * FROM {_NEW} ORDER BY CLAIM_FROM_MONTH")
+        for dim in _DIMS:
+            added = _extend(con, dim)
+            if added:
+                log.info("  %s: %s new values", dim, f"{added:,}")
+        con.execute(f"CREATE OR REPLACE TEMP TABLE {_NEW_KEYED} AS {encode_sql(_NEW)}")
+        con.execute(f"INSERT INTO {KEYED_TABLE} SELECT * FROM {_NEW_KEYED} ORDER BY CLAIM_FROM_MONTH")
+
+        for (name,) in con.execute("SELECT name FROM _catalog ORDER BY name").fetchall():
+            if name in BASE_TABLES:
+                continue
+            if name in SPECS:
+                how = _update_aggregate(con, name)
+            elif name in SKETCHES or name == DISTINCT_SKETCH:
+                sql = distinct_sketch_sql(_NEW) if name == DISTINCT_SKETCH else quantile_sketch_sql(_NEW, name)
+                con.execute(f"INSERT INTO {name} BY NAME {sql}")
+                how = "appended"
+            else:
+                con.execute(f"DROP TABLE IF EXISTS {name}")
+                con.execute("DELETE FROM _catalog WHERE name = ?", [name])
+                how = "dropped"
+            log.info("  %s %s", name, how)
+
+        for (name,) in con.execute("SELECT name FROM _catalog").fetchall():
+            rows = con.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+            con.execute("UPDATE _catalog SET fingerprint = ?, built_at = ?, rows = ? WHERE name = ?",
+                        [fp, datetime.now(), rows, name])
+        record_append(con, source, months, con.execute(f"SELECT COUNT(*) FROM {_NEW}").fetchone()[0])
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    finally:
+        con.execute(f"DROP TABLE IF EXISTS {_NEW_KEYED}")
+        con.execute("DROP TABLE IF EXISTS _append_groups")
+    con.execute(f"DROP TABLE IF EXISTS {_NEW}")
+    log.info("Appended %s from %s in %.1fs", ", ".join(f"{m:%Y-%m}" for m in months),
+             source.name, time.time() - t0)
+    return months
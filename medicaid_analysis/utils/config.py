@@ -11,8 +11,14 @@ BASE_DIR   = Path(__file__).resolve().parent.parent
 DATA_DIR   = BASE_DIR.parent / "data"
 FULL_CSV   = DATA_DIR / "medicaid-provider-spending.csv"
 SAMPLE_CSV = DATA_DIR / "sample.csv"
+SAMPLE_PARQUET = DATA_DIR / "sample.parquet"   # written by create_sample.py; preferred by --sample
 OUTPUT_DIR = Path(os.environ["MEDICAID_OUTPUT_DIR"]) if "MEDICAID_OUTPUT_DIR" in os.environ else BASE_DIR / "output"
 PLOTS_DIR  = Path(os.environ["MEDICAID_PLOTS_DIR"]) if "MEDICAID_PLOTS_DIR" in os.environ else BASE_DIR / "plots"
+CACHE_DIR  = Path(os.environ["MEDICAID_CACHE_DIR"]) if "MEDICAID_CACHE_DIR" in os.environ else DATA_DIR / "cache"
+
+# ── DuckDB resource budget (DuckDB's defaults when unset) ──────────────────
+MEMORY_LIMIT = os.environ.get("MEDICAID_MEMORY_LIMIT")   # e.g. "8GB"
+THREADS      = int(os.environ["MEDICAID_THREADS"]) if "MEDICAID_THREADS" in os.environ else None
 
 # ── Logging ────────────────────────────────────────────────────────────────
 logging.basicConfig(
@@ -2,15 +2,77 @@
 Medicaid Analysis — DuckDB Database Helpers
 """
 
+import threading
+
 import duckdb
 import pandas as pd
 
+from .config import MEMORY_LIMIT, THREADS
+from .estimates import share_sample_design
+from .query_cache import cached_query, share_query_cache
+from .sketches import share_approx_mode
+
+SCRATCH = "_scratch"   # in-memory database for derived tables, visible to every cursor
+_scratch_lock = threading.RLock()
+
 
 def connect() -> duckdb.DuckDBPyConnection:
-    """Create an in-memory DuckDB connection."""
-    return duckdb.connect(database=":memory:")
+    """Create an in-memory DuckDB connection within the configured resource budget."""
+    return limit(duckdb.connect(database=":memory:"))
+
+
+def limit(con) -> duckdb.DuckDBPyConnection:
+    """Apply ``MEDICAID_MEMORY_LIMIT`` / ``MEDICAID_THREADS`` (if set) to ``con``'s database."""
+    if MEMORY_LIMIT:
+        con.execute(f"SET memory_limit = '{MEMORY_LIMIT}'")
+    if THREADS:
+        con.execute(f"SET threads = {THREADS}")
+    return con
+
+
+def cursor(con) -> duckdb.DuckDBPyConnection:
+    """A new cursor on ``con``'s database, for running queries from another thread.
+
+    Cursors see the same tables and views but not connection-local state, so the
+    query result cache setting, the sample design and approximate mode are carried over.
+    """
+    cur = con.cursor()
+    share_query_cache(con, cur)
+    share_sample_design(con, cur)
+    share_approx_mode(con, cur)
+    return cur
 
 
 def query(con, sql: str) -> pd.DataFrame:
-    """Execute SQL against a DuckDB connection and return a pandas DataFrame."""
-    return con.execute(sql).fetchdf()
+    """Execute SQL against a DuckDB connection and return a pandas DataFrame.
+
+    Results come through Arrow, so strings are Arrow-backed rather than Python
+    objects; column types match ``fetchdf()``.
+
+    If a result cache is enabled on ``con`` (``enable_query_cache``), identical SQL
+    on the same data is answered from disk.
+    """
+    return cached_query(con, sql)
+
+
+def scratch_relation(con, name: str, sql: str, view: bool = False) -> str:
+    """Create (once) a table or view holding ``sql`` for the connection's lifetime; returns its name.
+
+    Relations live in an in-memory database attached as ``_scratch``, so all cursors
+    of the connection share them. Read-only connections cannot attach one and get a
+    connection-local TEMP relation instead.
+    """
+    kind = "VIEW" if view else "TABLE"
+    with _scratch_lock:
+        attached = con.execute("SELECT 1 FROM duckdb_databases() WHERE database_name = ?",
+                               [SCRATCH]).fetchone()
+        if not attached:
+            try:
+                con.execute(f"ATTACH ':memory:' AS {SCRATCH}")
+                attached = True
+            except duckdb.Error:
+                pass
+        qualified = f"{SCRATCH}.{name}" if attached else name
+        temp = "" if attached else "TEMP "
+        con.execute(f"CREATE {temp}{kind} IF NOT EXISTS {qualified} AS {sql}")
+    return qualified
@@ -0,0 +1,89 @@
+"""
+Medicaid Analysis — Distribution Summaries in DuckDB
+
+Row-level distributions (percentiles, histograms, correlation matrices) computed
+inside DuckDB, so sections can summarize hundreds of millions of rows without
+pulling them into pandas. Results are laid out like their pandas counterparts
+(``describe()``, ``np.histogram``, ``DataFrame.corr()``). In approximate mode
+(``--approx``) percentiles come from quantile sketches.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .db import query
+from .sketches import approx_mode, sketch_sql, sketch_quantiles
+
+
+def _label(p: float) -> str:
+    """pandas' row label for percentile ``p`` (e.g. ``5%``)."""
+    return f"{p * 100:g}%"
+
+
+def describe(con, relation: str, column: str, percentiles, by: str = None,
+             where: str = "TRUE") -> pd.DataFrame:
+    """``Series.describe(percentiles)`` of ``column``, one row per ``by`` group (or a single row).
+
+    Columns: ``by`` (if given), count, mean, std, min, the percentile labels and max.
+    Percentiles interpolate linearly between rows, as pandas does, or in approximate
+    mode come from a sketch of ``column``.
+    """
+    group = f"{by}, " if by else ""
+    labels = [_label(p) for p in percentiles]
+    approx = approx_mode(con)
+    df = query(con, f"""
+        SELECT {group}COUNT({column}) AS count, AVG({column}) AS mean,
+               STDDEV_SAMP({column}) AS std, MIN({column}) AS min,
+               {"" if approx else f"QUANTILE_CONT({column}, {list(map(float, percentiles))}) AS _q,"}
+               MAX({column}) AS max
+        FROM {relation} WHERE {where}
+        {f"GROUP BY {by} ORDER BY {by}" if by else ""}
+    """)
+    if approx:
+        keys = [by] if by else []
+        q = sketch_quantiles(con, f"({sketch_sql(relation, column, keys, where)})",
+                             dict(zip(labels, percentiles)), keys)
+        q = (df[keys].merge(q, how="left", on=by) if by else q)[labels].astype(float)
+    else:
+        q = pd.DataFrame(df.pop("_q").tolist(), index=df.index, columns=labels, dtype=float)
+    stats = df[["count", "mean", "std", "min"]].astype(float).join(q).join(df["max"].astype(float))
+    return pd.concat([df[[by]], stats], axis=1) if by else stats
+
+
+def histogram(con, relation: str, expr: str, bins: int, where: str = "TRUE"):
+    """``np.histogram(values, bins)`` of the SQL expression ``expr``: (counts, edges)."""
+    lo, hi = con.execute(f"SELECT MIN({expr}), MAX({expr}) FROM {relation} WHERE {where}").fetchone()
+    if lo is None:
+        return np.zeros(bins), np.linspace(0.0, 1.0, bins + 1)
+    lo, hi = float(lo), float(hi)
+    if lo == hi:
+        lo, hi = lo - 0.5, hi + 0.5
+    counts = query(con, f"""
+        SELECT LEAST(FLOOR(({expr} - {lo!r}) * {bins / (hi - lo)!r}), {bins - 1})::INTEGER AS bin,
+               COUNT(*) AS n
+        FROM {relation} WHERE {where} AND {expr} IS NOT NULL GROUP BY bin
+    """)
+    hist = np.zeros(bins)
+    hist[counts["bin"].to_numpy()] = counts["n"].to_numpy()
+    return hist, np.linspace(lo, hi, bins + 1)
+
+
+def correlation_matrix(con, relation: str, columns, method: str = "pearson") -> pd.DataFrame:
+    """``DataFrame.corr(method)`` of ``columns`` over rows where all of them are present.
+
+    ``spearman`` correlates average ranks (ties share the mean of their positions).
+    """
+    present = " AND ".join(f"{c} IS NOT NULL" for c in columns)
+    source = f"(SELECT {', '.join(columns)} FROM {relation} WHERE {present})"
+    if method == "spearman":
+        ranks = ", ".join(f"RANK() OVER (ORDER BY {c}) + (COUNT(*) OVER (PARTITION BY {c}) - 1) / 2 AS {c}"
+                          for c in columns)
+        source = f"(SELECT {ranks} FROM {source})"
+    elif method != "pearson":
+        raise ValueError(f"unknown correlation method: {method}")
+    pairs = [(a, b) for i, a in enumerate(columns) for b in columns[i + 1:]]
+    row = query(con, f"SELECT {', '.join(f'CORR({a}, {b})' for a, b in pairs)} FROM {source}").iloc[0]
+    corr = pd.DataFrame(np.eye(len(columns)), index=columns, columns=columns)
+    for (a, b), value in zip(pairs, row):
+        corr.loc[a, b] = corr.loc[b, a] = value
+    return corr
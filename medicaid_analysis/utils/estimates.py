@@ -0,0 +1,232 @@
+"""
+Medicaid Analysis — Population Estimates from Samples
+
+A run on a sample written by ``create_sample.py`` can scale its figures back to
+the full dataset. The sampling design comes from the key/value metadata the
+sampler stores in its Parquet files (``sample_pct`` / ``sample_by``), or from
+``--sample-pct`` for older samples without it; stratified samples carry each row's
+``SAMPLE_WEIGHT``, the others weigh every row ``100 / pct``.
+
+Totals are Horvitz–Thompson estimates Σ w·y. Their variance Σ w(w−1)·y² treats the
+sampling units (rows, or whole billing providers for a ``provider`` sample) as
+independently drawn, which slightly overstates it for stratified samples. Distinct
+counts of the sampling unit are totals too; other distinct counts use the GEE
+estimator with its lower and upper bounds as the interval. Percentiles get
+Woodruff intervals and Gini coefficients bootstrap intervals.
+"""
+
+import json
+from typing import NamedTuple
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+from .query_cache import cached_query
+from .schema import WEIGHT_COLUMN
+
+Z_95 = 1.959963984540054
+BOOTSTRAP_REPS = 200
+PROVIDER_UNIT = "BILLING_PROVIDER_NPI_NUM"
+
+_VARIABLE = "medicaid_sample_design"   # DuckDB session variable holding the design
+
+
+class SampleDesign(NamedTuple):
+    """How the analysed file was sampled from the full dataset."""
+    pct: float                 # percentage of rows (or providers) kept
+    by: str = "row"            # "row", "provider" or "stratified"
+
+    @property
+    def unit(self):
+        """Column identifying the sampling unit, or None when rows were sampled."""
+        return PROVIDER_UNIT if self.by == "provider" else None
+
+    @property
+    def weight(self) -> str:
+        """SQL expression for the number of full-dataset rows a sampled row stands for."""
+        return WEIGHT_COLUMN if self.by == "stratified" else repr(100.0 / self.pct)
+
+    def describe(self) -> str:
+        """E.g. ``1% by provider``."""
+        return f"{self.pct:g}% by {self.by}"
+
+
+def read_sample_design(path, pct: float = None):
+    """The ``SampleDesign`` of the file at ``path``, or None if it is not a sample.
+
+    ``pct`` declares a percentage for files without sampler metadata (e.g. CSV samples).
+    """
+    meta = {}
+    if str(path).endswith(".parquet"):
+        rows = duckdb.execute("SELECT key, value FROM parquet_kv_metadata(?)", [str(path)]).fetchall()
+        meta = {bytes(k).decode(): bytes(v).decode() for k, v in rows}
+    if pct is not None:
+        return SampleDesign(float(pct), meta.get("sample_by", "row"))
+    if "sample_pct" in meta:
+        return SampleDesign(float(meta["sample_pct"]), meta.get("sample_by", "row"))
+    return None
+
+
+def set_sample_design(con, design):
+    """Have sections on ``con`` report population estimates for ``design``."""
+    literal = json.dumps(design._asdict()).replace("'", "''")
+    con.execute(f"SET VARIABLE {_VARIABLE} = '{literal}'")
+
+
+def sample_design(con):
+    """The ``SampleDesign`` set on ``con``, or None for a full-dataset run."""
+    value = con.execute(f"SELECT getvariable('{_VARIABLE}')").fetchone()[0]
+    return SampleDesign(**json.loads(value)) if value else None
+
+
+def share_sample_design(src, dst):
+    """Set ``src``'s sample design (if any) on the cursor ``dst``."""
+    design = sample_design(src)
+    if design is not None:
+        set_sample_design(dst, design)
+
+
+def _grouping(by: dict):
+    by = by or {"_all": "TRUE"}
+    return by, ", ".join(f"{expr} AS {name}" for name, expr in by.items()), ", ".join(by)
+
+
+def _finish(df: pd.DataFrame, by: dict) -> pd.DataFrame:
+    return df.drop(columns="_all") if "_all" in by else df
+
+
+def estimate_totals(con, csv: str, design: SampleDesign, measures: dict, by: dict = None) -> pd.DataFrame:
+    """Horvitz–Thompson totals of ``measures`` ({name: SQL expression}) with 95% intervals.
+
+    ``by`` ({name: SQL expression}) estimates them per group. Every measure gets
+    ``<name>``, ``<name>_se``, ``<name>_low`` and ``<name>_high`` columns.
+    """
+    by, keys, names = _grouping(by)
+    if design.unit:
+        values = ", ".join(f"SUM({expr}) AS {name}" for name, expr in measures.items())
+        units = (f"SELECT {keys}, {design.unit}, MAX({design.weight}) AS _w, {values} "
+                 f"FROM {csv} GROUP BY ALL")
+    else:
+        values = ", ".join(f"{expr} AS {name}" for name, expr in measures.items())
+        units = f"SELECT {keys}, {design.weight} AS _w, {values} FROM {csv}"
+    sums = ", ".join(f"SUM(_w * {m}) AS {m}, SQRT(SUM(_w * (_w - 1) * {m} * {m})) AS {m}_se"
+                     for m in measures)
+    df = cached_query(con, f"""
+        WITH units AS ({units})
+        SELECT {names}, {sums} FROM units GROUP BY {names} ORDER BY {names}
+    """)
+    for m in measures:
+        df[f"{m}_low"] = df[m] - Z_95 * df[f"{m}_se"]
+        df[f"{m}_high"] = df[m] + Z_95 * df[f"{m}_se"]
+    return _finish(df, by)
+
+
+def estimate_distinct(con, csv: str, design: SampleDesign, column: str, by: dict = None) -> pd.DataFrame:
+    """Estimated distinct values of ``column`` (``observed``, ``estimate``, ``low``, ``high``, ``method``).
+
+    The sampling unit's count is a Horvitz–Thompson total. Any other column uses
+    GEE: values seen once stand for √(1/q) values each, where q is the sampled
+    share of rows, bounded by the observed count and f₁/q + the rest.
+    """
+    by, keys, names = _grouping(by)
+    if column == design.unit:
+        df = cached_query(con, f"""
+            WITH units AS (
+                SELECT {keys}, {column}, MAX({design.weight}) AS _w FROM {csv} GROUP BY ALL
+            )
+            SELECT {names}, COUNT(*) AS observed, SUM(_w) AS estimate,
+                   SQRT(SUM(_w * (_w - 1))) AS se
+            FROM units GROUP BY {names} ORDER BY {names}
+        """)
+        df["low"] = np.maximum(df["estimate"] - Z_95 * df["se"], df["observed"])
+        df["high"] = df["estimate"] + Z_95 * df["se"]
+        df["method"] = "Horvitz-Thompson"
+        return _finish(df.drop(columns="se"), by)
+    df = cached_query(con, f"""
+        WITH counts AS (
+            SELECT {keys}, {column}, COUNT(*) AS n, SUM({design.weight}) AS w
+            FROM {csv} WHERE {column} IS NOT NULL GROUP BY ALL
+        )
+        SELECT {names}, COUNT(*) AS observed, COUNT(*) FILTER (WHERE n = 1) AS f1,
+               SUM(n) / SUM(w) AS q
+        FROM counts GROUP BY {names} ORDER BY {names}
+    """)
+    repeated = df["observed"] - df["f1"]
+    df["estimate"] = np.sqrt(1 / df["q"]) * df["f1"] + repeated
+    df["low"] = df["observed"].astype(float)
+    df["high"] = df["f1"] / df["q"] + repeated
+    df["method"] = "GEE"
+    return _finish(df.drop(columns=["f1", "q"]), by)
+
+
+def weighted_quantile(values: np.ndarray, weights: np.ndarray, p: float, presorted=False) -> float:
+    """Smallest value whose weighted cumulative share reaches ``p``."""
+    if not presorted:
+        order = np.argsort(values, kind="stable")
+        values, weights = values[order], weights[order]
+    cum = np.cumsum(weights)
+    return float(values[min(np.searchsorted(cum, p * cum[-1]), len(values) - 1)])
+
+
+def estimate_quantiles(con, csv: str, design: SampleDesign, column: str, ps) -> pd.DataFrame:
+    """Weighted percentiles of ``column`` with Woodruff 95% intervals (``p``, ``estimate``, ``low``, ``high``).
+
+    The interval maps p ± 1.96·se(F̂) back through the estimated distribution, with
+    se(F̂) the design standard error of the share of rows below the estimate.
+    """
+    unit = design.unit or "NULL"
+    df = cached_query(con, f"""
+        SELECT {column} AS v, {design.weight} AS w, {unit} AS u
+        FROM {csv} WHERE {column} IS NOT NULL
+    """)
+    order = np.argsort(df["v"].to_numpy(), kind="stable")
+    v, w = df["v"].to_numpy(dtype=float)[order], df["w"].to_numpy(dtype=float)[order]
+    units = pd.factorize(df["u"].to_numpy()[order])[0] if design.unit else np.arange(len(v))
+    unit_w = np.zeros(units.max() + 1 if len(units) else 0)
+    unit_w[units] = w
+    total = w.sum()
+    rows = []
+    for p in ps:
+        q = weighted_quantile(v, w, p, presorted=True)
+        resid = np.bincount(units, weights=(v <= q) - p, minlength=len(unit_w))
+        se = np.sqrt(np.sum(unit_w * (unit_w - 1) * resid ** 2)) / total
+        rows.append({"p": p, "estimate": q,
+                     "low": weighted_quantile(v, w, max(p - Z_95 * se, 0.0), presorted=True),
+                     "high": weighted_quantile(v, w, min(p + Z_95 * se, 1.0), presorted=True)})
+    return pd.DataFrame(rows)
+
+
+def weighted_gini(values: np.ndarray, weights: np.ndarray = None) -> float:
+    """Gini coefficient of ``values``, each standing for ``weights`` units (1 by default)."""
+    values = np.asarray(values, dtype=float)
+    weights = np.ones_like(values) if weights is None else np.asarray(weights, dtype=float)
+    order = np.argsort(values, kind="stable")
+    v, w = values[order], weights[order]
+    share = np.concatenate([[0.0], np.cumsum(w) / w.sum()])
+    lorenz = np.concatenate([[0.0], np.cumsum(v * w) / np.sum(v * w)])
+    return float(1 - np.sum(np.diff(share) * (lorenz[1:] + lorenz[:-1])))
+
+
+def bootstrap_interval(stat, values: np.ndarray, weights: np.ndarray,
+                       reps: int = BOOTSTRAP_REPS, seed: int = 0) -> tuple:
+    """95% percentile interval of ``stat(values, weights)`` over sampling units drawn with replacement."""
+    rng = np.random.default_rng(seed)
+    n = len(values)
+    draws = [stat(values[idx], weights[idx]) for idx in (rng.integers(0, n, n) for _ in range(reps))]
+    return tuple(np.percentile(draws, [2.5, 97.5]))
+
+
+def perturbed_estimate(stat, totals: np.ndarray, se: np.ndarray,
+                       reps: int = BOOTSTRAP_REPS, seed: int = 0) -> tuple:
+    """``(estimate, low, high)`` of ``stat(totals)`` with the totals redrawn from their sampling errors.
+
+    Noise in estimated totals shifts statistics like the Gini coefficient one way, so
+    the plug-in value is corrected by the shift seen across redraws and the interval
+    is reflected around it (basic bootstrap).
+    """
+    rng = np.random.default_rng(seed)
+    point = stat(totals)
+    draws = np.array([stat(rng.normal(totals, se)) for _ in range(reps)])
+    low, high = np.percentile(draws, [2.5, 97.5])
+    return 2 * point - draws.mean(), 2 * point - high, 2 * point - low
@@ -0,0 +1,221 @@
+"""
+Medicaid Analysis — Columnar Ingest (CSV → Parquet cache)
+
+The cache is a Hive-partitioned Parquet dataset (``year=YYYY/month=M/``) so that
+month-windowed runs only read the partitions they need. Fact rows also carry the
+integer surrogate keys from ``utils.keys``, with the dimensions stored alongside
+as ``npi_dim.parquet`` and ``hcpcs_dim.parquet``.
+"""
+
+import hashlib
+import re
+import shutil
+import time
+from pathlib import Path
+
+from .config import log, CACHE_DIR
+from .db import connect
+from .keys import (
+    NPI_DIM, HCPCS_DIM, KEY_COLUMNS, MEASURES, npi_dim_sql, hcpcs_dim_sql, encode_sql, relation_exists,
+)
+from .schema import CLAIMS_SCHEMA, read_csv_sql, month_literal, schema_errors, validate_schema
+
+SAMPLE_BLOCKS = 16         # blocks hashed across the file for the fingerprint
+BLOCK_SIZE    = 1 << 20    # 1 MiB per sampled block
+
+
+def fingerprint(path) -> str:
+    """Cheap file fingerprint from size, mtime and a hash of sampled content blocks."""
+    path = Path(path)
+    st = path.stat()
+    h = hashlib.sha256(f"{st.st_size}:{st.st_mtime_ns}".encode())
+    with open(path, "rb") as f:
+        for i in range(SAMPLE_BLOCKS):
+            f.seek(st.st_size * i // SAMPLE_BLOCKS)
+            h.update(f.read(BLOCK_SIZE))
+    return h.hexdigest()[:16]
+
+
+def cache_path(csv, cache_dir=None) -> Path:
+    """Location of the partitioned Parquet copy of a CSV, keyed by the CSV's fingerprint."""
+    csv = Path(csv)
+    return Path(cache_dir or CACHE_DIR) / f"{_cache_stem(csv)}-{fingerprint(csv)}"
+
+
+def _cache_stem(csv: Path) -> str:
+    # sample.csv and sample.parquet get separate caches
+    return csv.stem if csv.suffix == ".csv" else csv.name.replace(".", "_")
+
+
+def fact_relation(path: Path, hive: bool = True) -> str:
+    """read_parquet call over the fact partitions of an ingested dataset."""
+    return f"read_parquet('{path}/year=*/month=*/*.parquet', hive_partitioning = {str(hive).lower()})"
+
+
+def _is_current(con, target: Path) -> bool:
+    """Whether a cached dataset is complete and was written with the declared schema."""
+    return ((target / f"{HCPCS_DIM}.parquet").exists()
+            and not schema_errors(con, fact_relation(target, hive=False)))
+
+
+def ingest(csv, cache_dir=None, con=None, dims=None) -> Path:
+    """Convert a CSV into a month-partitioned Parquet dataset once and return its directory.
+
+    The CSV is parsed with the declared schema (``utils.schema``). Later calls with an
+    unchanged CSV reuse the cached dataset; copies built from an older version of the
+    same CSV, or with an older schema, are rebuilt.
+
+    Parquet files (e.g. samples) are returned as-is unless ``dims`` names an ingested
+    dataset, such as the full dataset a sample was drawn from: its dimension tables
+    are then reused instead of rebuilt, so both datasets share surrogate keys. Once
+    such a copy exists, calls without ``dims`` return it as well.
+    """
+    csv = Path(csv)
+    if csv.is_dir():
+        return csv
+    target = cache_path(csv, cache_dir)
+    parquet = csv.suffix == ".parquet"
+    if parquet and dims is None and not target.exists():
+        return csv
+    own = con is None
+    con = con or connect()
+    try:
+        if target.exists() and _is_current(con, target):
+            log.info("Columnar cache hit: %s", target.name)
+            return target
+        if parquet and dims is None:
+            return csv
+
+        target.parent.mkdir(parents=True, exist_ok=True)
+        stale_name = re.compile(rf"{re.escape(_cache_stem(csv))}-[0-9a-f]{{16}}(\.parquet)?(\.partial|\.staged\.parquet)?")
+        for stale in target.parent.iterdir():
+            if stale_name.fullmatch(stale.name):
+                log.info("Removing stale cache: %s", stale.name)
+                shutil.rmtree(stale) if stale.is_dir() else stale.unlink()
+
+        log.info("Ingesting %s → %s%s", csv.name, target.name,
+                 f" with the dimensions of {Path(dims).name}" if dims else "")
+        t0 = time.time()
+        tmp = target.with_name(target.name + ".partial")
+        staged = target.with_name(target.name + ".staged.parquet")
+        try:
+            if parquet:
+                src = f"read_parquet('{csv}')"
+            else:
+                # Parse the CSV once; the dimensions and the keyed fact are built from the staged copy.
+                con.execute(f"COPY (SELECT * FROM {read_csv_sql(csv)}) TO '{staged}' (FORMAT PARQUET)")
+                src = f"read_parquet('{staged}')"
+            for dim, build in ((NPI_DIM, npi_dim_sql), (HCPCS_DIM, hcpcs_dim_sql)):
+                dim_sql = f"SELECT * FROM read_parquet('{Path(dims) / dim}.parquet')" if dims else build(src)
+                con.execute(f"CREATE OR REPLACE TEMP TABLE _{dim} AS {dim_sql}")
+            fact = encode_sql(src, columns="c.*", npi_dim=f"_{NPI_DIM}", hcpcs_dim=f"_{HCPCS_DIM}")
+            if dims:
+                unmatched = con.execute(f"""
+                    SELECT COUNT(*) FROM ({fact})
+                    WHERE (billing_id IS NULL AND BILLING_PROVIDER_NPI_NUM IS NOT NULL)
+                       OR (servicing_id IS NULL AND SERVICING_PROVIDER_NPI_NUM IS NOT NULL)
+                       OR (hcpcs_id IS NULL AND HCPCS_CODE IS NOT NULL)
+                """).fetchone()[0]
+                if unmatched:
+                    raise ValueError(f"{csv.name} has {unmatched:,} rows with NPIs or codes "
+                                     f"missing from the dimensions of {Path(dims).name}")
+            con.execute(f"""
+                COPY (
+                    SELECT *, YEAR(CLAIM_FROM_MONTH) AS year, MONTH(CLAIM_FROM_MONTH) AS month
+                    FROM ({fact})
+                ) TO '{tmp}' (FORMAT PARQUET, PARTITION_BY (year, month),
+                              COMPRESSION ZSTD, ROW_GROUP_SIZE 1000000)
+            """)
+            for dim in (NPI_DIM, HCPCS_DIM):
+                con.execute(f"COPY _{dim} TO '{tmp / dim}.parquet' (FORMAT PARQUET, COMPRESSION ZSTD)")
+                con.execute(f"DROP TABLE _{dim}")
+        finally:
+            staged.unlink(missing_ok=True)
+    finally:
+        if own:
+            con.close()
+    tmp.rename(target)
+    size = sum(f.stat().st_size for f in target.rglob("*.parquet"))
+    log.info("  ✓ %.0f MB → %.0f MB in %.1fs",
+             csv.stat().st_size / (1024 * 1024), size / (1024 * 1024), time.time() - t0)
+    return target
+
+
+def _month_bounds(from_month=None, to_month=None):
+    """SQL predicates on the partition columns and on CLAIM_FROM_MONTH for a month window."""
+    part, raw = [], []
+    if from_month:
+        y, m = int(from_month[:4]), int(from_month[5:7])
+        part.append(f"(year > {y} OR (year = {y} AND month >= {m}))")
+        raw.append(f"CLAIM_FROM_MONTH >= {month_literal(from_month)}")
+    if to_month:
+        y, m = int(to_month[:4]), int(to_month[5:7])
+        part.append(f"(year < {y} OR (year = {y} AND month <= {m}))")
+        raw.append(f"CLAIM_FROM_MONTH <= {month_literal(to_month)}")
+    return part, raw
+
+
+def register_claims(con, source, from_month=None, to_month=None, name="claims", where=None) -> str:
+    """Expose a dataset as a view with the original columns, optionally limited to a month window.
+
+    ``source`` may be a CSV or Parquet file, a partitioned dataset directory from
+    ``ingest`` (the window then prunes whole partitions), the name of an existing
+    table or view, or an in-memory pandas DataFrame / Arrow table (copied into a
+    ``<name>_data`` table with the declared column types). Months are ``YYYY-MM`` strings, both bounds inclusive;
+    ``where`` is a further SQL predicate on the original columns. CSVs are read with
+    the declared schema and the view is validated against it. Returns the view name,
+    which is what sections query.
+
+    When the source carries surrogate keys, a matching ``<name>_keyed`` fact view
+    (and the ``npi_dim`` / ``hcpcs_dim`` dimensions) is registered as well, unless
+    ``where`` filters on columns the keyed fact does not have.
+    """
+    part, raw = _month_bounds(from_month, to_month)
+    keyed = None
+    if not isinstance(source, (str, Path)):
+        relation = f"{name}_data"
+        con.register("_register_claims_data", source)
+        try:
+            # pandas has no DATE type, so declared columns are cast to their schema types
+            present = {row[0] for row in con.execute("DESCRIBE _register_claims_data").fetchall()}
+            casts = ", ".join(f"CAST({col} AS {dtype}) AS {col}"
+                              for col, dtype in CLAIMS_SCHEMA.items() if col in present)
+            replace = f" REPLACE ({casts})" if casts else ""
+            con.execute(f"CREATE OR REPLACE TABLE {relation} AS SELECT *{replace} FROM _register_claims_data")
+        finally:
+            con.unregister("_register_claims_data")
+        source = relation
+    source = str(source)
+    path = Path(source)
+    if path.is_dir():
+        relation = fact_relation(path)
+        predicates = part
+        columns = f"* EXCLUDE (year, month, {', '.join(KEY_COLUMNS)})"
+        keyed = relation
+        for dim in (NPI_DIM, HCPCS_DIM):
+            con.execute(f"CREATE OR REPLACE VIEW {dim} AS SELECT * FROM read_parquet('{path / dim}.parquet')")
+    else:
+        if path.suffix == ".csv":
+            relation = read_csv_sql(path)
+        elif path.suffix == ".parquet":
+            relation = f"read_parquet('{path}')"
+        else:
+            relation = source
+        predicates = raw
+        columns = "*"
+        if relation_exists(con, f"{source}_keyed"):
+            keyed = f"{source}_keyed"
+    if where:
+        predicates = [*predicates, f"({where})"]
+        keyed = None   # rebuilt from the filtered view by key_relations when needed
+    filters = "WHERE " + " AND ".join(predicates) if predicates else ""
+    con.execute(f"CREATE OR REPLACE VIEW {name} AS SELECT {columns} FROM {relation} {filters}")
+    validate_schema(con, name)
+    if keyed is None:
+        con.execute(f"DROP VIEW IF EXISTS {name}_keyed")
+    elif keyed != f"{name}_keyed":
+        con.execute(f"""
+            CREATE OR REPLACE VIEW {name}_keyed AS
+            SELECT {", ".join(KEY_COLUMNS + MEASURES)} FROM {keyed} {filters}
+        """)
+    return name
@@ -5,16 +5,21 @@ Medicaid Analysis — I/O Helpers (save figures, CSVs, logging banners)
 import pandas as pd
 import matplotlib.pyplot as plt
 from .config import log, PLOTS_DIR, OUTPUT_DIR
+from .render import render_figure
 
 
-def savefig(fig, name: str, subdir: str = None):
-    """Save a matplotlib figure to the plots directory (or a subdirectory)."""
+def savefig(fig, name: str, subdir: str = None, tight_layout: bool = False):
+    """Save a matplotlib figure to the plots directory (or a subdirectory).
+
+    ``tight_layout=True`` applies ``fig.tight_layout()`` first. With plot workers
+    running (``start_plot_workers``) the PNG is written in the background.
+    """
     target = PLOTS_DIR / subdir if subdir else PLOTS_DIR
     target.mkdir(parents=True, exist_ok=True)
     path = target / name
-    fig.savefig(path, dpi=150, bbox_inches="tight", facecolor="white")
+    how = render_figure(fig, path, tight_layout)
     plt.close(fig)
-    log.info("  → %s", path.name)
+    log.info("  → %s%s", path.name, "" if how == "drawn" else f" ({how})")
 
 
 def save_csv(df: pd.DataFrame, name: str, subdir: str = None):
@@ -0,0 +1,80 @@
+"""
+Medicaid Analysis — Integer Surrogate Keys
+
+NPIs and HCPCS codes are dictionary-encoded into dense INTEGER ids so the large
+provider / procedure GROUP BYs and joins hash 4-byte keys instead of strings.
+A fresh build numbers the values in sort order, but values appended later
+(``utils.append``) are numbered after the largest id, so ids carry no order:
+compare or sort by the decoded NPIs / codes.
+"""
+
+import hashlib
+
+from .db import scratch_relation
+
+NPI_DIM   = "npi_dim"      # npi_id ↔ npi (billing and servicing NPIs share one id space)
+HCPCS_DIM = "hcpcs_dim"    # hcpcs_id ↔ HCPCS_CODE
+KEY_COLUMNS = ["billing_id", "servicing_id", "hcpcs_id"]
+MEASURES = ["CLAIM_FROM_MONTH", "TOTAL_UNIQUE_BENEFICIARIES", "TOTAL_CLAIMS", "TOTAL_PAID"]
+
+
+def npi_dim_sql(src: str) -> str:
+    """SELECT building the NPI dimension from a claims relation."""
+    return f"""
+        SELECT CAST(ROW_NUMBER() OVER (ORDER BY npi) AS INTEGER) AS npi_id, npi
+        FROM (
+            SELECT BILLING_PROVIDER_NPI_NUM AS npi FROM {src}
+            UNION
+            SELECT SERVICING_PROVIDER_NPI_NUM FROM {src}
+        ) WHERE npi IS NOT NULL
+    """
+
+
+def hcpcs_dim_sql(src: str) -> str:
+    """SELECT building the HCPCS dimension from a claims relation."""
+    return f"""
+        SELECT CAST(ROW_NUMBER() OVER (ORDER BY HCPCS_CODE) AS INTEGER) AS hcpcs_id, HCPCS_CODE
+        FROM (SELECT DISTINCT HCPCS_CODE FROM {src}) WHERE HCPCS_CODE IS NOT NULL
+    """
+
+
+def encode_sql(src: str, columns: str = ", ".join(f"c.{m}" for m in MEASURES),
+               npi_dim: str = NPI_DIM, hcpcs_dim: str = HCPCS_DIM) -> str:
+    """SELECT attaching the three surrogate keys to ``columns`` of a claims relation."""
+    return f"""
+        SELECT b.npi_id AS billing_id, s.npi_id AS servicing_id, h.hcpcs_id, {columns}
+        FROM {src} c
+        LEFT JOIN {npi_dim} b   ON c.BILLING_PROVIDER_NPI_NUM = b.npi
+        LEFT JOIN {npi_dim} s   ON c.SERVICING_PROVIDER_NPI_NUM = s.npi
+        LEFT JOIN {hcpcs_dim} h ON c.HCPCS_CODE = h.HCPCS_CODE
+    """
+
+
+def relation_exists(con, name: str) -> bool:
+    """Whether a table or view called ``name`` is visible on the connection."""
+    return con.execute("""
+        SELECT 1 FROM duckdb_tables() WHERE table_name = ?
+        UNION ALL SELECT 1 FROM duckdb_views() WHERE view_name = ?
+    """, [name, name]).fetchone() is not None
+
+
+def key_relations(con, csv: str) -> tuple:
+    """Return ``(fact, npi_dim, hcpcs_dim)`` relation names for the data behind ``csv``.
+
+    The fact relation has ``billing_id``, ``servicing_id``, ``hcpcs_id`` and the
+    month / measure columns. Relations registered by ``register_claims`` or the
+    persistent store come with a pre-built ``<name>_keyed`` fact; for anything
+    else (e.g. a raw CSV path) the dimensions are built once per connection
+    (shared by its cursors).
+    """
+    if relation_exists(con, f"{csv}_keyed"):
+        return f"{csv}_keyed", NPI_DIM, HCPCS_DIM
+    # A re-registered view (e.g. another --where filter) gets its own dimensions
+    row = con.execute("SELECT sql FROM duckdb_views() WHERE view_name = ?", [str(csv)]).fetchone()
+    tag = hashlib.sha1(f"{csv}\n{row[0] if row else ''}".encode()).hexdigest()[:8]
+    src = f"'{csv}'"
+    npi = scratch_relation(con, f"npi_dim_{tag}", npi_dim_sql(src))
+    hcpcs = scratch_relation(con, f"hcpcs_dim_{tag}", hcpcs_dim_sql(src))
+    fact = scratch_relation(con, f"claims_keyed_{tag}",
+                            encode_sql(src, npi_dim=npi, hcpcs_dim=hcpcs), view=True)
+    return fact, npi, hcpcs
@@ -0,0 +1,271 @@
+"""
+Medicaid Analysis — Run Manifest (incremental re-execution)
+
+``OUTPUT_DIR/run_manifest.json`` records, per section, a key derived from the
+section's source module (plus the shared ``utils`` code and library versions), the
+dataset and run parameters and the keys of the sections it consumes, along with
+hashes of the files it wrote. A later run skips a section whose key and files
+still match; results it passes to other sections are pickled under
+``OUTPUT_DIR/.results`` and reloaded for the sections that do run.
+
+Output files are attributed to a section by their ``NN`` filename prefix: the
+files directly under either directory or its ``fraud/`` subdirectory that the
+section wrote during its run. Files in other subdirectories (such as the per-scale
+trees of ``run_multi_scale``) and leftovers of earlier runs are not recorded. A
+section with plots deferred as specs (``--defer-plots``) is not recorded either,
+so the next run draws them.
+
+Sections are checkpointed into the manifest as they complete, and
+``OUTPUT_DIR/run_journal.jsonl`` logs the run's arguments and each section's
+status, so an interrupted or failed run can be resumed where it stopped.
+"""
+
+import functools
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import re
+import threading
+from datetime import datetime
+from importlib import metadata
+from pathlib import Path
+
+from .config import log, OUTPUT_DIR, PLOTS_DIR
+from .render import pending_plots, deferred_plots
+
+MANIFEST_NAME = "run_manifest.json"
+RESULTS_DIR = ".results"
+JOURNAL_PATH = OUTPUT_DIR / "run_journal.jsonl"
+OUTPUT_SUBDIRS = ["fraud"]
+LIBRARIES = ["duckdb", "numpy", "pandas", "scipy", "scikit-learn", "matplotlib", "seaborn"]
+
+_journal_lock = threading.Lock()
+
+
+def _digest(*parts) -> str:
+    return hashlib.sha256("\n".join(map(str, parts)).encode()).hexdigest()[:16]
+
+
+def file_hash(path) -> str:
+    """SHA-256 of a file's contents."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+@functools.lru_cache(maxsize=1)
+def _shared_code() -> str:
+    """Hash of the ``utils`` package sources and the versions of the analysis libraries."""
+    sources = [p.read_bytes().decode() for p in sorted(Path(__file__).parent.glob("*.py"))]
+    versions = []
+    for lib in LIBRARIES:
+        try:
+            versions.append(f"{lib}=={metadata.version(lib)}")
+        except metadata.PackageNotFoundError:
+            versions.append(f"{lib} missing")
+    return _digest(*sources, *versions)
+
+
+def code_hash(func) -> str:
+    """Hash of the module defining ``func`` together with the shared code it runs on."""
+    return _digest(_shared_code(), Path(inspect.getsourcefile(func)).read_text())
+
+
+def journal(event: str, path=None, **fields):
+    """Append a status event to the run journal; ``start`` begins a new journal."""
+    path = Path(path or JOURNAL_PATH)
+    line = json.dumps({"event": event, "time": datetime.now().isoformat(timespec="seconds"), **fields})
+    with _journal_lock:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w" if event == "start" else "a") as f:
+            f.write(line + "\n")
+
+
+def interrupted_run(path=None):
+    """``(argv, done)`` of the journaled run if it stopped early or had failures, else None.
+
+    ``done`` lists the sections it completed.
+    """
+    try:
+        events = [json.loads(line) for line in Path(path or JOURNAL_PATH).read_text().splitlines()]
+    except (OSError, ValueError):
+        return None
+    if not events or events[0]["event"] != "start":
+        return None
+    if events[-1]["event"] == "finish" and not events[-1]["failed"]:
+        return None
+    return events[0]["argv"], [e["section"] for e in events if e["event"] == "completed"]
+
+
+class RunManifest:
+    """What produced the files in ``OUTPUT_DIR`` / ``PLOTS_DIR``, section by section."""
+
+    def __init__(self, steps, dataset_key: str, params: dict = None,
+                 output_dir=None, plots_dir=None):
+        self.roots = {"output": Path(output_dir or OUTPUT_DIR), "plots": Path(plots_dir or PLOTS_DIR)}
+        self.path = self.roots["output"] / MANIFEST_NAME
+        self.results_dir = self.roots["output"] / RESULTS_DIR
+        self.steps = {s.num: s for s in steps}
+        self.data = {"dataset": dataset_key, "params": params or {}}
+        try:
+            recorded = json.loads(self.path.read_text())["sections"]
+            self.sections = {int(num): entry for num, entry in recorded.items()}
+        except (OSError, ValueError, KeyError):
+            self.sections = {}
+        self.code = {num: code_hash(s.func) for num, s in self.steps.items()}
+        self.keys = self._keys()
+        self.started = {}
+        self._lock = threading.Lock()
+
+    def _keys(self) -> dict:
+        """Each section's key; it changes whenever anything the section's outputs depend on does."""
+        producer = {s.output: s.num for s in self.steps.values() if s.output}
+        params = json.dumps(self.data, sort_keys=True)
+        keys, self.upstream = {}, {}
+        for num in sorted(self.steps):
+            self.upstream[num] = [producer[i] for i in self.steps[num].inputs if i in producer]
+            keys[num] = _digest(self.code[num], params, *(keys[u] for u in self.upstream[num]))
+        return keys
+
+    @staticmethod
+    def _prefix(num: int):
+        return re.compile(rf"{num:02d}(?!\d)")
+
+    def outputs(self, num: int, since: float = None) -> dict:
+        """Files attributed to section ``num``, as ``{"<root>/<relative path>": path}``.
+
+        With ``since`` (a ``time.time()``), only files modified from then on.
+        """
+        prefix = self._prefix(num)
+        found = {}
+        for label, root in self.roots.items():
+            for folder in [root, *(root / sub for sub in OUTPUT_SUBDIRS)]:
+                if not folder.is_dir():
+                    continue
+                for path in folder.iterdir():
+                    if not (prefix.match(path.name) and path.is_file()):
+                        continue
+                    # 1s of slack for filesystems with coarse timestamps
+                    if since is not None and path.stat().st_mtime < since - 1:
+                        continue
+                    found[f"{label}/{path.relative_to(root).as_posix()}"] = path
+        return found
+
+    def deferred(self, num: int) -> bool:
+        """Whether any of section ``num``'s plots were only written as specs this run."""
+        prefix = self._prefix(num)
+        return any(prefix.match(Path(p).name) for p in deferred_plots())
+
+    def _result_path(self, step) -> Path:
+        return self.results_dir / f"{step.output}.pkl"
+
+    def current(self, num: int) -> bool:
+        """Whether the recorded run of section ``num`` matches its key now."""
+        entry = self.sections.get(num)
+        return entry is not None and entry["key"] == self.keys[num]
+
+    def reusable(self, num: int) -> bool:
+        """Whether section ``num`` can be skipped: same key, recorded files intact."""
+        if not self.current(num):
+            return False
+        step = self.steps[num]
+        if step.output and not self._result_path(step).exists():
+            return False
+        for name, digest in self.sections[num]["outputs"].items():
+            label, rel = name.split("/", 1)
+            path = self.roots[label] / rel
+            if not path.exists() or file_hash(path) != digest:
+                return False
+        return True
+
+    def stale(self, selected) -> list:
+        """The ``selected`` sections that have to run; the others are logged as reused."""
+        run = []
+        for num in selected:
+            if self.reusable(num):
+                log.info("  ↺ Section %d unchanged — reusing its outputs", num)
+            else:
+                run.append(num)
+        return run
+
+    def save_result(self, step, value):
+        """Pickle the result ``step`` publishes for reuse by later runs."""
+        self.results_dir.mkdir(parents=True, exist_ok=True)
+        path = self._result_path(step)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.partial")
+        with open(tmp, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def load_result(self, step):
+        """The result ``step`` published on its recorded run, or None if that run is stale."""
+        path = self._result_path(step)
+        if not self.current(step.num) or not path.exists():
+            return None
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def record(self, nums):
+        """Record the sections in ``nums`` as just completed, hashing the files they wrote.
+
+        A section is only recorded once every section it consumes is: one that ran
+        without an input (its producer failed or never ran) runs again next time, as
+        does one whose plots were deferred.
+        """
+        for num in sorted(nums):
+            if not all(self.current(u) for u in self.upstream[num]) or self.deferred(num):
+                self.sections.pop(num, None)
+                continue
+            outputs = self.outputs(num, self.started.get(num))
+            self.sections[num] = {
+                "key": self.keys[num],
+                "section": self.steps[num].func.__name__,
+                "code": self.code[num],
+                **self.data,
+                "outputs": {name: file_hash(path) for name, path in sorted(outputs.items())},
+                "result": self.steps[num].output,
+                "completed": datetime.now().isoformat(timespec="seconds"),
+            }
+
+    def checkpoint(self, num: int, value=None, started: float = None):
+        """Save section ``num``'s result and record it as completed, right away.
+
+        ``started`` is when the section began (``time.time()``); only files written
+        since then are recorded as its outputs. A section with plots still queued to
+        the plot workers is left for the ``record`` at the end of the run, as its PNGs
+        are not final yet.
+        """
+        step = self.steps[num]
+        if started is not None:
+            self.started[num] = started
+        if step.output and value is not None:
+            self.save_result(step, value)
+        prefix = self._prefix(num)
+        if any(prefix.match(Path(p).name) for p in pending_plots()):
+            return
+        with self._lock:
+            self.record([num])
+            self._save()
+
+    def forget(self, nums):
+        """Drop the records of sections in ``nums`` (e.g. ones that failed)."""
+        with self._lock:
+            for num in nums:
+                self.sections.pop(num, None)
+            self._save()
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".partial")
+        tmp.write_text(json.dumps({"sections": {str(n): e for n, e in sorted(self.sections.items())}},
+                                  indent=1))
+        os.replace(tmp, self.path)
+
+    def write(self):
+        """Save the manifest atomically."""
+        self._save()
+        log.info("Run manifest: %d sections recorded in %s", len(self.sections), self.path.name)
@@ -0,0 +1,154 @@
+"""
+Medicaid Analysis — Dense Provider × Month Matrices
+
+Per-provider time-series sections work on a ``providers × months`` float32 matrix
+(rows in NPI order, columns in month order, NaN where a provider billed nothing
+that month) instead of a long provider-month frame grouped in pandas. Matrices of
+ingested or stored datasets are saved as ``.npy`` files under ``CACHE_DIR`` and
+memory-mapped on later runs.
+
+float32 keeps the matrices small and is ample for thresholds and rankings, but a
+cell holds only about seven significant digits, so dollar amounts a section
+reports are read back exactly with ``exact_sums``.
+"""
+
+import hashlib
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from .config import log, CACHE_DIR
+from .keys import key_relations, relation_exists
+from .store import CLAIMS_TABLE, catalog_fingerprint
+
+MATRIX_DIR = CACHE_DIR / "matrices"
+_build_lock = threading.Lock()   # sections running in parallel share the cached files
+
+
+def _view_sql(con, name: str) -> str:
+    row = con.execute("SELECT sql FROM duckdb_views() WHERE view_name = ?", [name]).fetchone()
+    return row[0] if row else ""
+
+
+def _cache_tag(con, csv: str):
+    """Stable id for the data behind ``csv``, or None if it cannot be fingerprinted.
+
+    Only datasets that went through ``ingest`` (the keyed view names the fingerprinted
+    cache directory) or the persistent store (the catalog holds the fingerprint) get
+    one; a CSV read directly (``--no-cache``) is never cached.
+    """
+    parts = [csv, _view_sql(con, csv)]
+    if relation_exists(con, "_catalog"):
+        parts.append(catalog_fingerprint(con, CLAIMS_TABLE) or "")
+    elif relation_exists(con, f"{csv}_keyed"):
+        parts.append(_view_sql(con, f"{csv}_keyed"))
+    else:
+        return None
+    return hashlib.sha1("\n".join(map(str, parts)).encode()).hexdigest()[:16]
+
+
+def _build(con, csv: str, columns: list) -> tuple:
+    """Aggregate ``columns`` to provider × month in one pass and scatter into dense arrays."""
+    fact, npi_dim, _ = key_relations(con, csv)
+    sums = ", ".join(f"SUM({c}) AS {c}" for c in columns)
+    cells = con.execute(f"""
+        WITH g AS (
+            SELECT billing_id, CLAIM_FROM_MONTH, {sums}
+            FROM {fact} WHERE billing_id IS NOT NULL
+            GROUP BY billing_id, CLAIM_FROM_MONTH
+        )
+        SELECT d.npi, g.* EXCLUDE (billing_id)
+        FROM g JOIN {npi_dim} d ON g.billing_id = d.npi_id
+    """).fetchnumpy()
+    npis, rows = np.unique(cells["npi"], return_inverse=True)
+    months, cols = np.unique(cells["CLAIM_FROM_MONTH"], return_inverse=True)
+    matrices = {}
+    for c in columns:
+        values = np.full((len(npis), len(months)), np.nan, dtype=np.float32)
+        values[rows, cols] = np.asarray(cells[c], dtype=np.float64)
+        matrices[c] = values
+    return npis, months.astype("datetime64[us]"), matrices
+
+
+def _save(path, array):
+    """Write ``array`` to ``path`` atomically."""
+    tmp = path.with_name(path.name + ".partial.npy")
+    np.save(tmp, array)
+    os.replace(tmp, path)
+
+
+def provider_months(con, csv: str, columns=("TOTAL_PAID",)) -> tuple:
+    """Dense per-provider monthly sums of ``columns`` for the data behind ``csv``.
+
+    Returns ``(npis, months, matrices)``: the billing NPIs (sorted), the months
+    present in the data (sorted, as a DatetimeIndex) and a dict mapping each column
+    to a float32 array of shape ``(len(npis), len(months))`` with NaN where the
+    provider has no rows in that month.
+    """
+    columns = list(columns)
+    tag = _cache_tag(con, csv)
+    if tag is None:
+        npis, months, matrices = _build(con, csv, columns)
+        return npis, pd.DatetimeIndex(months), matrices
+
+    paths = {c: MATRIX_DIR / f"{tag}-{c}.npy" for c in ["npi", "month"] + columns}
+    with _build_lock:
+        missing = [c for c in columns if not paths[c].exists()]
+        if missing or not paths["npi"].exists() or not paths["month"].exists():
+            MATRIX_DIR.mkdir(parents=True, exist_ok=True)
+            npis, months, built = _build(con, csv, missing or columns)
+            _save(paths["npi"], npis)
+            _save(paths["month"], months)
+            for c, values in built.items():
+                _save(paths[c], values)
+            log.info("  Built %d × %d provider-month matrix (%s)",
+                     len(npis), len(months), ", ".join(built))
+    npis = np.load(paths["npi"])
+    months = pd.DatetimeIndex(np.load(paths["month"]))
+    matrices = {c: np.load(paths[c], mmap_mode="r") for c in columns}
+    return npis, months, matrices
+
+
+def exact_sums(con, csv: str, cells: pd.DataFrame, sums: dict) -> pd.DataFrame:
+    """Double-precision sums from DuckDB for the provider (or provider × month) ``cells``.
+
+    ``cells`` has a BILLING_PROVIDER_NPI_NUM column and optionally CLAIM_FROM_MONTH;
+    ``sums`` maps output columns to aggregates over the keyed fact's rows in each
+    cell (e.g. ``{"paid": "SUM(TOTAL_PAID)"}``). Returns ``cells`` with those columns
+    added (replacing any of the same name), in the same row order.
+    """
+    fact, npi_dim, _ = key_relations(con, csv)
+    by_month = "CLAIM_FROM_MONTH" in cells
+    keys = cells[["BILLING_PROVIDER_NPI_NUM"] + (["CLAIM_FROM_MONTH"] if by_month else [])].drop_duplicates()
+    params = [keys["BILLING_PROVIDER_NPI_NUM"].astype("int64").tolist()]
+    if by_month:
+        params.append([t.date() for t in pd.to_datetime(keys["CLAIM_FROM_MONTH"])])
+    aggregates = ", ".join(f"{expr} AS {name}" for name, expr in sums.items())
+    result = con.execute(f"""
+        WITH k AS (
+            SELECT UNNEST(?::BIGINT[]) AS _npi{", UNNEST(?::DATE[]) AS _month" if by_month else ""}
+        )
+        SELECT k._npi AS BILLING_PROVIDER_NPI_NUM,
+               {"k._month::TIMESTAMP AS CLAIM_FROM_MONTH," if by_month else ""} {aggregates}
+        FROM k JOIN {npi_dim} d ON d.npi = k._npi
+        JOIN {fact} f ON f.billing_id = d.npi_id{" AND f.CLAIM_FROM_MONTH = k._month" if by_month else ""}
+        GROUP BY ALL
+    """, params).df()
+    on = list(keys.columns)
+    if by_month:
+        result["CLAIM_FROM_MONTH"] = result["CLAIM_FROM_MONTH"].astype(cells["CLAIM_FROM_MONTH"].dtype)
+    return cells.drop(columns=[c for c in sums if c in cells]).merge(result, on=on, how="left")
+
+
+def pack_active(values) -> tuple:
+    """Shift each row's non-NaN cells to the left, keeping their order.
+
+    Returns ``(packed, order, counts)``: ``packed[i, j]`` is provider i's j-th active
+    month value (NaN past ``counts[i]``), and ``order[i, j]`` its column in ``values``.
+    """
+    absent = np.isnan(values)
+    order = np.argsort(absent, axis=1, kind="stable")
+    packed = np.take_along_axis(np.asarray(values), order, axis=1)
+    return packed, order, (~absent).sum(axis=1)
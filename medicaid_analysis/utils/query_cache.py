@@ -0,0 +1,192 @@
+"""
+Medicaid Analysis — Query Result Cache
+
+When enabled on a connection, ``query()`` results are kept as Parquet files under
+``CACHE_DIR/queries``, keyed by the whitespace-normalized SQL, a key identifying
+the dataset the connection analyses and the DuckDB version. Identical queries on
+unchanged data are read back instead of re-run. The directory is held under a
+byte budget by evicting the least recently used results.
+
+Results are fetched through DuckDB's Arrow interface when pyarrow is installed:
+large low-cardinality string columns (codes, categories) come back as
+categoricals, and cached results are written and read as Arrow tables without a
+pandas round trip. Without pyarrow, ``fetchdf()`` is used and results are not cached.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+from pathlib import Path
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pc = pq = None
+
+from .config import log, CACHE_DIR
+
+QUERY_CACHE_DIR   = CACHE_DIR / "queries"
+QUERY_CACHE_BYTES = int(os.environ.get("MEDICAID_QUERY_CACHE_MB", "2048")) * 2**20
+
+# String columns of at least this many rows with at most this share of distinct values
+# (HCPCS codes, categories, tiers) come back as categoricals
+CATEGORY_MIN_ROWS  = 10_000
+CATEGORY_MAX_SHARE = 0.1
+
+_VARIABLE = "medicaid_query_cache"   # DuckDB session variable holding the settings
+# Results of these are not reproducible, so they are never cached
+_NONDETERMINISTIC = re.compile(r"USING\s+SAMPLE|\brandom\s*\(|\buuid\s*\(|\bnow\s*\(", re.IGNORECASE)
+
+stats = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0}
+
+
+def enable_query_cache(con, dataset_key: str, cache_dir=None, max_bytes: int = None):
+    """Cache ``query()`` results on ``con`` for the dataset identified by ``dataset_key``.
+
+    ``dataset_key`` must change whenever the data behind the connection's relations
+    does (e.g. the source fingerprint plus the month window).
+    """
+    settings = {
+        "key": f"{dataset_key}:{duckdb.__version__}",
+        "dir": str(cache_dir or QUERY_CACHE_DIR),
+        "max_bytes": max_bytes or QUERY_CACHE_BYTES,
+    }
+    Path(settings["dir"]).mkdir(parents=True, exist_ok=True)
+    literal = json.dumps(settings).replace("'", "''")
+    con.execute(f"SET VARIABLE {_VARIABLE} = '{literal}'")
+
+
+def share_query_cache(src, dst):
+    """Enable ``src``'s result cache settings (if any) on the cursor ``dst``."""
+    value = src.execute(f"SELECT getvariable('{_VARIABLE}')").fetchone()[0]
+    if value:
+        literal = value.replace("'", "''")
+        dst.execute(f"SET VARIABLE {_VARIABLE} = '{literal}'")
+
+
+def _settings(con):
+    value = con.execute(f"SELECT getvariable('{_VARIABLE}')").fetchone()[0]
+    return json.loads(value) if value else None
+
+
+def _evict(directory: Path, max_bytes: int):
+    """Delete least recently used results until the directory fits in ``max_bytes``."""
+    entries = []
+    for path in directory.glob("*.parquet"):
+        try:
+            st = path.stat()
+        except OSError:
+            continue   # evicted meanwhile by another process sharing the directory
+        entries.append((st.st_mtime, st.st_size, path))
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+        stats["evicted"] += 1
+
+
+def _fetch_arrow(con, sql: str):
+    """Result of ``sql`` as a ``pyarrow.Table``."""
+    result = con.execute(sql)
+    # DuckDB 1.5 renamed fetch_arrow_table() (and deprecated the old name)
+    return result.to_arrow_table() if hasattr(result, "to_arrow_table") else result.fetch_arrow_table()
+
+
+def to_pandas(table) -> pd.DataFrame:
+    """``table`` as a DataFrame with the dtypes DuckDB's ``fetchdf()`` would give.
+
+    DECIMAL / HUGEINT become float64 and DATE datetime64; integer and boolean
+    columns with NULLs become pandas nullable columns. Large low-cardinality string
+    columns become categoricals (categories sorted, so sorting is unchanged), which
+    store each distinct string once.
+    """
+    nullable = {
+        pa.int8(): pd.Int8Dtype(), pa.int16(): pd.Int16Dtype(), pa.int32(): pd.Int32Dtype(),
+        pa.int64(): pd.Int64Dtype(), pa.uint8(): pd.UInt8Dtype(), pa.uint16(): pd.UInt16Dtype(),
+        pa.uint32(): pd.UInt32Dtype(), pa.uint64(): pd.UInt64Dtype(), pa.bool_(): pd.BooleanDtype(),
+    }
+    columns = []
+    for field, column in zip(table.schema, table.columns):
+        if pa.types.is_decimal(field.type):
+            column = column.cast(pa.float64())
+        elif pa.types.is_date(field.type):
+            column = column.cast(pa.timestamp("us"))
+        columns.append(column)
+    table = pa.Table.from_arrays(columns, names=table.column_names)
+    df = table.to_pandas()
+    for i, column in enumerate(columns):
+        if column.null_count and column.type in nullable:
+            df.isetitem(i, column.to_pandas(types_mapper=nullable.get))
+        elif (pa.types.is_string(column.type) and len(column) >= CATEGORY_MIN_ROWS
+              # mostly distinct first rows rule out identifier columns without encoding them
+              and pc.count_distinct(column.slice(0, CATEGORY_MIN_ROWS)).as_py() <= CATEGORY_MIN_ROWS // 2):
+            encoded = column.combine_chunks().dictionary_encode()
+            if len(encoded.dictionary) <= CATEGORY_MAX_SHARE * len(column):
+                order = pc.array_sort_indices(encoded.dictionary).to_numpy()
+                rank = np.empty(len(order) + 1, dtype=np.int32)
+                rank[order], rank[-1] = np.arange(len(order)), -1   # -1: NULL
+                indices = encoded.indices.to_numpy(zero_copy_only=False)   # float with NaN for NULLs
+                codes = rank[np.nan_to_num(indices, nan=len(order)).astype(np.intp)]
+                categories = encoded.dictionary.take(order).to_pandas()
+                df.isetitem(i, pd.Categorical.from_codes(codes, categories=categories))
+    return df
+
+
+def fetch(con, sql: str) -> pd.DataFrame:
+    """Run ``sql`` on ``con`` and return the result, through Arrow when pyarrow is installed."""
+    if pa is None:
+        return con.execute(sql).fetchdf()
+    return to_pandas(_fetch_arrow(con, sql))
+
+
+def cached_query(con, sql: str) -> pd.DataFrame:
+    """``query()`` through the connection's result cache (plain execution if none is enabled)."""
+    settings = _settings(con)
+    if settings is None or pa is None or _NONDETERMINISTIC.search(sql):
+        return fetch(con, sql)
+
+    normalized = " ".join(sql.split())
+    key = hashlib.sha256(f"{settings['key']}\n{normalized}".encode()).hexdigest()
+    directory = Path(settings["dir"])
+    path = directory / f"{key}.parquet"
+    if path.exists():
+        try:
+            table = pq.read_table(path)
+            os.utime(path)   # mark as recently used
+            stats["hits"] += 1
+            return to_pandas(table)
+        except Exception as e:
+            log.warning("  Discarding unreadable cached result %s: %s", path.name, e)
+            path.unlink(missing_ok=True)
+
+    table = _fetch_arrow(con, sql)
+    stats["misses"] += 1
+    tmp = path.with_name(f"{path.stem}.{os.getpid()}-{threading.get_ident()}.partial")
+    try:
+        pq.write_table(table, tmp)
+        os.replace(tmp, path)
+        stats["stored"] += 1
+    except Exception as e:   # e.g. types Parquet cannot represent
+        log.debug("  Not caching result (%s)", e)
+        tmp.unlink(missing_ok=True)
+    else:
+        _evict(directory, settings["max_bytes"])
+    return to_pandas(table)
+
+
+def log_query_cache_stats():
+    """Log hit / miss counts for this process."""
+    if stats["hits"] or stats["misses"]:
+        log.info("Query cache: %d hits, %d misses, %d stored, %d evicted",
+                 stats["hits"], stats["misses"], stats["stored"], stats["evicted"])
@@ -0,0 +1,203 @@
+"""
+Medicaid Analysis — Plot Rendering
+
+Sections build matplotlib figures; drawing them to PNG (layout, text, rasterizing)
+is the slow part and holds the GIL. ``savefig`` hands each finished figure to
+``render_figure``, which by default draws it inline. After ``start_plot_workers``
+the figure is pickled — its data, artists and styling form a self-contained plot
+spec — and drawn by a pool of worker processes while the sections carry on. After
+``defer_plots`` the specs are only written to ``PLOTS_DIR/specs`` so a later
+``render_specs`` call can draw them in one batch.
+"""
+
+import os
+import pickle
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import get_context
+from pathlib import Path
+
+import matplotlib
+import matplotlib.pyplot as plt
+import seaborn as sns
+from matplotlib.figure import Figure
+
+from .config import log, PLOTS_DIR
+
+DPI = 150
+SPEC_DIR = PLOTS_DIR / "specs"
+SPEC_SUFFIX = ".fig.pkl"
+
+# Held while matplotlib lays out or draws text: its font and mathtext caches are not
+# thread-safe, so sections running in parallel must not render at the same time.
+render_lock = threading.RLock()
+
+_state = {"pool": None, "spec_dir": None, "pending": [], "deferred": [], "theme": False}
+_state_lock = threading.Lock()
+
+
+def set_plot_theme():
+    """Apply the pipeline's plot style; call once, before any section builds a figure."""
+    sns.set_theme(style="whitegrid", font_scale=1.05)
+    _state["theme"] = True
+
+
+def figure(**kwargs) -> Figure:
+    """A new figure that pyplot does not track.
+
+    pyplot's registry of open figures is global and not thread-safe, and GUI
+    backends expect figures to be created on the main thread. Sections running
+    on worker threads (``--jobs``) therefore build their figures here.
+    """
+    return Figure(**kwargs)
+
+
+def subplots(nrows: int = 1, ncols: int = 1, **kwargs) -> tuple:
+    """``plt.subplots`` on a ``figure`` that pyplot does not track; returns ``(fig, axes)``."""
+    fig_kw = {k: kwargs.pop(k) for k in ("figsize", "dpi", "facecolor", "layout") if k in kwargs}
+    fig = figure(**fig_kw)
+    return fig, fig.subplots(nrows, ncols, **kwargs)
+
+
+def _style() -> dict:
+    """Global styling that drawing reads besides the figure itself, for a worker to reapply.
+
+    That is the theme (which also remaps color codes like ``"r"``) and any rcParams
+    differing from matplotlib's defaults.
+    """
+    defaults = matplotlib.rcParamsDefault
+    rc = {k: v for k, v in matplotlib.rcParams.items() if k in defaults and defaults[k] != v}
+    return {"theme": _state["theme"], "rc": rc}
+
+
+def _draw(fig, path, tight_layout: bool):
+    if tight_layout:
+        fig.tight_layout()
+    fig.savefig(path, dpi=DPI, bbox_inches="tight", facecolor="white")
+
+
+def _render_spec(payload: bytes, path: str, tight_layout: bool, style: dict):
+    """Worker entry point: draw a pickled figure to ``path`` with the parent's ``style``."""
+    matplotlib.use("Agg")
+    if style["theme"]:
+        set_plot_theme()
+    with matplotlib.rc_context(style["rc"]):
+        fig = pickle.loads(payload)
+        try:
+            _draw(fig, path, tight_layout)
+        finally:
+            plt.close(fig)
+
+
+def _pool(workers: int) -> ProcessPoolExecutor:
+    # Spawned, not forked: the parent runs DuckDB and section threads
+    return ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+
+
+def start_plot_workers(workers: int):
+    """Draw figures saved from now on in ``workers`` background processes."""
+    with _state_lock:
+        if _state["pool"] is None:
+            _state["pool"] = _pool(workers)
+
+
+def defer_plots(spec_dir=None):
+    """Write figures saved from now on as specs under ``spec_dir`` instead of drawing them."""
+    _state["spec_dir"], _state["deferred"] = Path(spec_dir or SPEC_DIR), []
+
+
+def _write_spec(payload: bytes, path: Path, tight_layout: bool, style: dict, spec_dir: Path):
+    spec = spec_dir / path.relative_to(PLOTS_DIR).with_suffix(path.suffix + SPEC_SUFFIX)
+    spec.parent.mkdir(parents=True, exist_ok=True)
+    tmp = spec.with_name(spec.name + ".partial")
+    with open(tmp, "wb") as f:
+        pickle.dump({"path": str(path.relative_to(PLOTS_DIR)), "tight_layout": tight_layout,
+                     "style": style, "matplotlib": matplotlib.__version__, "figure": payload}, f)
+    os.replace(tmp, spec)
+
+
+def render_figure(fig, path: Path, tight_layout: bool = False) -> str:
+    """Draw, queue or defer ``fig`` for ``path``; returns how (``drawn`` / ``queued`` / ``deferred``).
+
+    Figures that cannot be pickled are drawn inline.
+    """
+    pool, spec_dir = _state["pool"], _state["spec_dir"]
+    if pool is not None or spec_dir is not None:
+        try:
+            payload = pickle.dumps(fig)
+        except Exception as e:
+            log.warning("  Drawing %s inline: figure cannot be pickled (%s)", path.name, e)
+        else:
+            if spec_dir is not None:
+                _write_spec(payload, path, tight_layout, _style(), spec_dir)
+                with _state_lock:
+                    _state["deferred"].append(path)
+                return "deferred"
+            future = pool.submit(_render_spec, payload, str(path), tight_layout, _style())
+            with _state_lock:
+                _state["pending"].append((path, future))
+            return "queued"
+    with render_lock:
+        _draw(fig, path, tight_layout)
+    return "drawn"
+
+
+def deferred_plots() -> list:
+    """Paths of figures written as specs since ``defer_plots``, not drawn yet."""
+    with _state_lock:
+        return list(_state["deferred"])
+
+
+def pending_plots() -> list:
+    """Paths of figures queued to the plot workers that are not drawn yet."""
+    with _state_lock:
+        return [path for path, future in _state["pending"] if not future.done()]
+
+
+def _collect(pending: list) -> int:
+    """Wait for queued figures; logs and returns the number that failed."""
+    wait([future for _, future in pending])
+    failed = 0
+    for path, future in pending:
+        if future.exception() is not None:
+            failed += 1
+            log.error("  ✗ Plot %s FAILED: %s", path.name, future.exception())
+    return failed
+
+
+def finish_plots():
+    """Wait for figures queued to the plot workers and shut the workers down."""
+    with _state_lock:
+        pool, pending = _state["pool"], _state["pending"]
+        _state["pool"], _state["pending"] = None, []
+    if pool is None:
+        return
+    failed = _collect(pending)
+    pool.shutdown()
+    log.info("Rendered %d plots in worker processes (%d failed)", len(pending) - failed, failed)
+
+
+def render_specs(spec_dir=None, workers: int = 1) -> int:
+    """Draw every spec under ``spec_dir`` to its PNG, removing specs that rendered; returns the count."""
+    spec_dir = Path(spec_dir or SPEC_DIR)
+    specs = sorted(spec_dir.rglob(f"*{SPEC_SUFFIX}")) if spec_dir.exists() else []
+    if not specs:
+        return 0
+    with _pool(workers) as pool:
+        pending = []
+        for spec in specs:
+            with open(spec, "rb") as f:
+                meta = pickle.load(f)
+            if meta["matplotlib"] != matplotlib.__version__:
+                log.warning("  %s was saved with matplotlib %s (running %s)",
+                            spec.name, meta["matplotlib"], matplotlib.__version__)
+            path = PLOTS_DIR / meta["path"]
+            path.parent.mkdir(parents=True, exist_ok=True)
+            pending.append((path, pool.submit(_render_spec, meta["figure"], str(path),
+                                              meta["tight_layout"], meta["style"])))
+        failed = _collect(pending)
+    for spec, (path, future) in zip(specs, pending):
+        if future.exception() is None:
+            spec.unlink()
+            log.info("  → %s", path.name)
+    return len(specs) - failed
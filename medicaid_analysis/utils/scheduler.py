@@ -0,0 +1,204 @@
+"""
+Medicaid Analysis — Dependency-Aware Section Scheduler
+
+Sections are declared as ``Step``s naming the results they consume and publish
+(e.g. S22 publishes ``yoy_totals``, S32 consumes it). ``run_steps`` runs every
+selected step once its inputs are available: in section order on the main
+connection with ``jobs=1``, or on a thread pool with one DuckDB cursor per worker
+otherwise, starting the steps with the longest remaining chain first. Section
+timings are kept under ``CACHE_DIR`` to estimate those chains on the next run.
+With a ``RunManifest``, results of sections that are not run are reloaded from
+the previous run when still current.
+"""
+
+import fcntl
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, NamedTuple
+
+from .config import log, CACHE_DIR
+from .db import cursor
+
+TIMINGS_PATH = CACHE_DIR / "section_times.json"
+
+
+class Step(NamedTuple):
+    """One pipeline section, called as ``func(con, csv, *inputs)``."""
+    num: int
+    func: Callable
+    inputs: tuple = ()       # result names passed after (con, csv), in order
+    output: str = None       # name the return value is published under
+    optional: dict = None    # inputs that may be missing → value passed instead
+
+
+def load_timings(key: str) -> dict:
+    """Section durations (seconds by section number) recorded for ``key``."""
+    try:
+        recorded = json.loads(TIMINGS_PATH.read_text()).get(key, {})
+    except (OSError, ValueError):
+        return {}
+    return {int(num): seconds for num, seconds in recorded.items()}
+
+
+def save_timings(key: str, timings: dict):
+    """Merge ``timings`` into the durations recorded for ``key``.
+
+    Runs on other datasets may save at the same time (``run_multi_scale.py``), so the
+    read-modify-write holds an exclusive lock on a sibling ``.lock`` file.
+    """
+    TIMINGS_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with open(TIMINGS_PATH.with_name(TIMINGS_PATH.name + ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            everything = json.loads(TIMINGS_PATH.read_text())
+        except (OSError, ValueError):
+            everything = {}
+        recorded = everything.setdefault(key, {})
+        recorded.update({str(num): round(seconds, 2) for num, seconds in timings.items()})
+        tmp = TIMINGS_PATH.with_name(f"{TIMINGS_PATH.name}.{os.getpid()}.partial")
+        tmp.write_text(json.dumps(everything, indent=1, sort_keys=True))
+        os.replace(tmp, TIMINGS_PATH)
+
+
+def _graph(steps: list) -> tuple:
+    """``(deps, dependents)`` between ``steps`` through their declared inputs / outputs."""
+    producer = {s.output: s.num for s in steps if s.output}
+    deps = {s.num: {producer[i] for i in s.inputs if i in producer} for s in steps}
+    dependents = {s.num: [] for s in steps}
+    for num, upstream in deps.items():
+        for d in upstream:
+            dependents[d].append(num)
+    return deps, dependents
+
+
+def _longest_paths(order: list, edges: dict, cost: dict) -> dict:
+    """Longest cost of a chain starting at each step; ``order`` lists dependents first."""
+    longest = {}
+    for num in order:
+        longest[num] = cost.get(num, 1.0) + max((longest[d] for d in edges[num]), default=0.0)
+    return longest
+
+
+def critical_path(steps: list, timings: dict) -> tuple:
+    """``(nums, seconds)`` of the slowest dependency chain through the executed ``steps``."""
+    steps = [s for s in steps if s.num in timings]
+    deps, _ = _graph(steps)
+    finish, via = {}, {}
+    for s in sorted(steps, key=lambda s: s.num):
+        before = max(deps[s.num], key=lambda d: finish[d], default=None)
+        finish[s.num] = timings[s.num] + (finish[before] if before is not None else 0.0)
+        via[s.num] = before
+    if not finish:
+        return [], 0.0
+    num = max(finish, key=finish.get)
+    total, path = finish[num], []
+    while num is not None:
+        path.append(num)
+        num = via[num]
+    return path[::-1], total
+
+
+def run_steps(con, csv: str, steps: list, selected, run: Callable, jobs: int = 1,
+              timings_key: str = None, manifest=None) -> dict:
+    """Run the ``selected`` section numbers of ``steps``; returns their durations in seconds.
+
+    ``run(num, func, con, csv, *inputs)`` executes one section and returns its result
+    (None on failure). A step whose required input comes from a section that was not
+    selected, or that failed, is skipped with a warning. Producers must precede their
+    consumers in ``steps``. Durations are recorded under ``timings_key`` (e.g. the
+    dataset name) to order the next run's parallel schedule. With a ``manifest``, an
+    input whose producer is not run is loaded from it if its recorded run is current.
+    """
+    producer = {s.output: s.num for s in steps if s.output}
+    every = {s.num: s for s in steps}
+    steps = [s for s in steps if s.num in selected]
+    deps, dependents = _graph(steps)
+    estimates = load_timings(timings_key) if timings_key else {}
+    priority = _longest_paths([s.num for s in reversed(steps)], dependents, estimates)
+    by_num = {s.num: s for s in steps}
+    waiting = {num: len(d) for num, d in deps.items()}
+    ready = [num for num, n in waiting.items() if n == 0]
+    results, timings = {}, {}
+    # Cursors are opened here: the parent connection must not be used from worker threads
+    cursors = [cursor(con) for _ in range(jobs)] if jobs > 1 else []
+    free, local = queue.SimpleQueue(), threading.local()
+    load_lock = threading.Lock()
+    for cur in cursors:
+        free.put(cur)
+
+    def load(name):
+        # A result from a section not run this time, as of its last recorded run
+        with load_lock:
+            if name not in results and manifest is not None and name in producer:
+                results[name] = manifest.load_result(every[producer[name]])
+        return results.get(name)
+
+    def execute(step, con):
+        for name in step.inputs:
+            if name not in results:
+                load(name)
+        optional = step.optional or {}
+        missing = [i for i in step.inputs if results.get(i) is None and i not in optional]
+        if missing:
+            source = producer.get(missing[0])
+            log.warning("  Skipping S%02d: requires S%02d %s (run S%02d first)",
+                        step.num, source, missing[0], source)
+            return None, None
+        args = [results[i] if results.get(i) is not None else optional[i] for i in step.inputs]
+        t0 = time.time()
+        value = run(step.num, step.func, con, csv, *args)
+        return value, time.time() - t0
+
+    def execute_on_worker(step):
+        if not hasattr(local, "cursor"):
+            local.cursor = free.get_nowait()
+        return execute(step, local.cursor)
+
+    def finish(num, value, seconds):
+        if by_num[num].output:
+            results[by_num[num].output] = value
+        if seconds is not None:
+            timings[num] = seconds
+        for d in dependents[num]:
+            waiting[d] -= 1
+            if waiting[d] == 0:
+                ready.append(d)
+
+    if jobs <= 1:
+        while ready:
+            ready.sort()
+            num = ready.pop(0)
+            finish(num, *execute(by_num[num], con))
+    else:
+        with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="section") as pool:
+            running = {}
+            while ready or running:
+                ready.sort(key=lambda n: (-priority[n], n))
+                while ready and len(running) < jobs:
+                    num = ready.pop(0)
+                    running[pool.submit(execute_on_worker, by_num[num])] = num
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(running.pop(future), *future.result())
+        for cur in cursors:
+            cur.close()
+
+    if timings_key:
+        save_timings(timings_key, timings)
+    return timings
+
+
+def log_schedule_report(steps: list, timings: dict, wall: float, jobs: int):
+    """Log the critical path of the run and how busy the workers were."""
+    if not timings:
+        return
+    path, length = critical_path(steps, timings)
+    busy = sum(timings.values())
+    log.info("Critical path: %s = %.1fs of %.1fs wall",
+             " → ".join(f"S{num:02d} ({timings[num]:.1f}s)" for num in path), length, wall)
+    log.info("Section time: %.1fs on %d job(s) (%.0f%% worker utilization)",
+             busy, jobs, 100 * busy / max(wall * jobs, 1e-9))
@@ -0,0 +1,53 @@
+"""
+Medicaid Analysis — Declared Dataset Schema
+
+Every reader of the source CSV goes through ``read_csv_sql`` so the file is parsed
+with fixed types instead of being sniffed, and ``CLAIM_FROM_MONTH`` arrives as a
+DATE (first day of the service month) rather than a ``YYYY-MM`` string.
+"""
+
+CLAIMS_SCHEMA = {
+    "BILLING_PROVIDER_NPI_NUM":   "BIGINT",
+    "SERVICING_PROVIDER_NPI_NUM": "BIGINT",
+    "HCPCS_CODE":                 "VARCHAR",
+    "CLAIM_FROM_MONTH":           "DATE",
+    "TOTAL_UNIQUE_BENEFICIARIES": "INTEGER",
+    "TOTAL_CLAIMS":               "INTEGER",
+    "TOTAL_PAID":                 "DOUBLE",
+}
+MONTH_FORMAT = "%Y-%m"     # CLAIM_FROM_MONTH as written in the source CSV
+WEIGHT_COLUMN = "SAMPLE_WEIGHT"   # rows represented by a row of a stratified sample (1 / inclusion probability)
+
+
+def read_csv_sql(path) -> str:
+    """``read_csv`` call that parses a claims CSV with the declared schema (no sniffing)."""
+    columns = ", ".join(f"'{name}': '{dtype}'" for name, dtype in CLAIMS_SCHEMA.items())
+    return (f"read_csv('{path}', header = true, auto_detect = false, "
+            f"dateformat = '{MONTH_FORMAT}', columns = {{{columns}}})")
+
+
+def month_literal(month: str) -> str:
+    """SQL DATE literal for a ``YYYY-MM`` month."""
+    return f"DATE '{month}-01'"
+
+
+def schema_errors(con, relation: str) -> list:
+    """Differences between a relation's columns and the declared schema (empty if it conforms).
+
+    Extra columns (partition columns, surrogate keys) are ignored.
+    """
+    actual = {row[0]: row[1] for row in con.execute(f"DESCRIBE SELECT * FROM {relation}").fetchall()}
+    errors = []
+    for name, dtype in CLAIMS_SCHEMA.items():
+        if name not in actual:
+            errors.append(f"missing column {name}")
+        elif actual[name] != dtype:
+            errors.append(f"{name} is {actual[name]}, expected {dtype}")
+    return errors
+
+
+def validate_schema(con, relation: str):
+    """Raise ValueError if ``relation`` does not match the declared schema."""
+    errors = schema_errors(con, relation)
+    if errors:
+        raise ValueError(f"{relation} does not match the declared schema: {'; '.join(errors)}")
@@ -0,0 +1,201 @@
+"""
+Medicaid Analysis — Mergeable Quantile Sketches
+
+With ``--approx`` percentiles are read from quantile sketches instead of sorting
+every value. A sketch is a table of counts over logarithmic value buckets (the
+DDSketch layout): with γ = (1 + α) / (1 − α), bucket ``i`` holds the values whose
+magnitude lies in (γ^(i−1), γ^i], negative values are bucketed by magnitude and
+zeros are counted apart. A percentile is reported as the midpoint 2γ^i / (γ + 1)
+of the bucket holding its rank, which is within relative error α
+(``RELATIVE_ERROR``, 1%) of the data value at rank ⌊p·(n − 1)⌋ — the lower of the
+two values ``PERCENTILE_CONT`` interpolates between — whatever the distribution.
+A sketch has at most a few thousand buckets per group, however many rows it
+summarizes.
+
+Sketches are plain ``(group…, sign, bucket, n)`` tables, so they can be stored
+and merged: adding the counts of matching buckets gives the sketch of the
+combined rows. The shared sketches in ``aggregates.SKETCHES`` are kept per
+CLAIM_FROM_MONTH as well as per group, and merge into any range of months.
+
+With ``--approx-distinct`` distinct counts come from HyperLogLog sketches in the
+same spirit: ``(group…, column_name, reg, rho)`` tables holding, for each of the
+2^p registers a value's hash selects, the longest run of leading zeros (plus one)
+seen in the rest of the hash. Registers merge by taking their maximum, so the
+monthly sketches union into yearly or rolling-window counts; an estimate has a
+relative standard error of about 1.04 / √2^p (0.8% at ``HLL_PRECISION`` 14).
+Registers are built from DuckDB's ``hash()``, so sketches are only merged with
+others built by the same DuckDB version.
+"""
+
+import math
+
+from .query_cache import cached_query
+
+RELATIVE_ERROR = 0.01
+GAMMA = (1 + RELATIVE_ERROR) / (1 - RELATIVE_ERROR)
+HLL_PRECISION = 14
+
+_VARIABLE = "medicaid_approx"   # DuckDB session variable set by --approx
+_DISTINCT_VARIABLE = "medicaid_approx_distinct"   # ... and by --approx-distinct
+
+
+def set_approx_mode(con, enabled: bool = True):
+    """Have sections on ``con`` compute percentiles from sketches (``enabled``) or exactly."""
+    con.execute(f"SET VARIABLE {_VARIABLE} = {bool(enabled)}")
+
+
+def approx_mode(con) -> bool:
+    """Whether percentiles on ``con`` come from sketches."""
+    return bool(con.execute(f"SELECT getvariable('{_VARIABLE}')").fetchone()[0])
+
+
+def set_approx_distinct(con, enabled: bool = True):
+    """Have sections on ``con`` estimate distinct counts from HyperLogLog sketches (``enabled``)."""
+    con.execute(f"SET VARIABLE {_DISTINCT_VARIABLE} = {bool(enabled)}")
+
+
+def approx_distinct(con) -> bool:
+    """Whether distinct counts on ``con`` are estimated."""
+    return bool(con.execute(f"SELECT getvariable('{_DISTINCT_VARIABLE}')").fetchone()[0])
+
+
+def share_approx_mode(src, dst):
+    """Set ``src``'s approximate modes (those on) on the cursor ``dst``."""
+    if approx_mode(src):
+        set_approx_mode(dst)
+    if approx_distinct(src):
+        set_approx_distinct(dst)
+
+
+def distinct_sql(con, expr: str) -> str:
+    """SQL aggregate counting the distinct values of ``expr``: exact, or DuckDB's HyperLogLog
+    ``APPROX_COUNT_DISTINCT`` with ``--approx-distinct``.
+
+    For counts per fine-grained group (provider, code) that no stored sketch holds.
+    """
+    return f"APPROX_COUNT_DISTINCT({expr})" if approx_distinct(con) else f"COUNT(DISTINCT {expr})"
+
+
+def sketch_sql(relation: str, expr: str, by=(), where: str = "TRUE") -> str:
+    """SQL for the sketch of ``expr`` over ``relation``, one per ``by`` group.
+
+    Columns: the ``by`` columns, sign (−1, 0 or 1), bucket and n (rows in the
+    bucket). NULL values are left out.
+    """
+    keys = "".join(f"{k}, " for k in by)
+    return f"""
+        SELECT {keys}SIGN(_v)::TINYINT AS sign,
+               CASE WHEN _v = 0 THEN 0 ELSE CEIL(LN(ABS(_v)) / {math.log(GAMMA)!r})::INTEGER END AS bucket,
+               COUNT(*) AS n
+        FROM (SELECT {keys}{expr} AS _v FROM {relation} WHERE {where})
+        WHERE _v IS NOT NULL
+        GROUP BY ALL
+    """
+
+
+def sketch_quantiles_sql(sketch: str, quantiles: dict, by=(), where: str = "TRUE") -> str:
+    """SQL for percentiles ({name: p}) of the sketch table ``sketch``, one row per ``by`` group.
+
+    Buckets are merged over every other grouping column of the sketch (e.g. all
+    months, or those ``where`` selects). Columns: the ``by`` columns, n (values
+    sketched) and one per quantile name.
+    """
+    keys = "".join(f"{k}, " for k in by)
+    partition = f"PARTITION BY {', '.join(by)} " if by else ""
+    value = f"CASE WHEN sign = 0 THEN 0.0 ELSE sign * 2 * POW({GAMMA!r}, bucket) / {GAMMA + 1!r} END"
+    columns = ", ".join(f'ARG_MIN({value}, cum) FILTER (WHERE cum > {float(p)!r} * (total - 1)) AS "{name}"'
+                        for name, p in quantiles.items())
+    grouping = f"GROUP BY {', '.join(by)} ORDER BY {', '.join(by)}" if by else ""
+    return f"""
+        SELECT {keys}ANY_VALUE(total)::BIGINT AS n, {columns}
+        FROM (
+            SELECT *, SUM(n) OVER ({partition}ORDER BY sign, sign * bucket
+                                   ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW) AS cum,
+                      SUM(n) OVER ({partition.strip()}) AS total
+            FROM (SELECT {keys}sign, bucket, SUM(n) AS n FROM {sketch} WHERE {where} GROUP BY ALL)
+        )
+        {grouping}
+    """
+
+
+def sketch_quantiles(con, sketch: str, quantiles: dict, by=(), where: str = "TRUE"):
+    """DataFrame of ``sketch_quantiles_sql``: percentiles ({name: p}) per ``by`` group."""
+    return cached_query(con, sketch_quantiles_sql(sketch, quantiles, by, where))
+
+
+def _grouping(by) -> tuple:
+    """(select list, names) for ``by``: column names, or {name: SQL expression}."""
+    by = by if isinstance(by, dict) else {k: k for k in by}
+    return "".join(f"{expr} AS {name}, " for name, expr in by.items()), "".join(f"{k}, " for k in by)
+
+
+def hll_sql(relation: str, columns, by=(), where: str = "TRUE") -> str:
+    """SQL for HyperLogLog sketches of each of ``columns`` over ``relation``, per ``by`` group.
+
+    ``by`` is a list of columns or {name: SQL expression}. Columns: the ``by``
+    names, column_name, reg and rho; NULLs are not counted.
+    """
+    select, keys = _grouping(by)
+    rest = 64 - HLL_PRECISION
+    names = ", ".join(f"'{c}'" for c in columns)
+    hashes = ", ".join(f"CASE WHEN {c} IS NOT NULL THEN hash({c}) END" for c in columns)
+    # Position of the highest set bit; LOG2 can round up just below a power of two
+    top = "FLOOR(LOG2(_w))::INTEGER"
+    return f"""
+        SELECT {keys}column_name, reg,
+               MAX(CASE WHEN _w = 0 THEN {rest + 1}
+                        ELSE {rest} - {top} + (_w < (1::UBIGINT << {top}))::INTEGER END)::TINYINT AS rho
+        FROM (
+            SELECT {keys}column_name, (_h >> {rest})::SMALLINT AS reg, _h & {(1 << rest) - 1}::UBIGINT AS _w
+            FROM (SELECT {select}UNNEST([{names}]) AS column_name, UNNEST([{hashes}]) AS _h
+                  FROM {relation} WHERE {where})
+            WHERE _h IS NOT NULL
+        )
+        GROUP BY ALL
+    """
+
+
+def hll_count_sql(sketch: str, by=(), where: str = "TRUE") -> str:
+    """SQL for distinct-count estimates from the HyperLogLog sketch table ``sketch``, per ``by`` group.
+
+    Registers are merged (maximum ``rho``) over every other grouping column of the
+    sketch. ``by`` is a list of columns or {name: SQL expression} over the sketch's
+    columns (e.g. ``{"year": "YEAR(CLAIM_FROM_MONTH)"}``); include ``column_name``
+    to count each sketched column. Columns: the ``by`` names and n_distinct.
+    """
+    select, keys = _grouping(by)
+    m = 1 << HLL_PRECISION
+    alpha = 0.7213 / (1 + 1.079 / m)
+    names = keys.rstrip(", ")
+    # Raw estimate, with linear counting while registers are still empty
+    return f"""
+        SELECT {keys}ROUND(CASE WHEN _raw <= {2.5 * m} AND _zeros > 0 THEN {m} * LN({m} / _zeros)
+                                ELSE _raw END)::BIGINT AS n_distinct
+        FROM (
+            SELECT {keys}{alpha * m * m!r} / (SUM(POW(2.0, -rho)) + {m} - COUNT(*)) AS _raw,
+                   {m} - COUNT(*) AS _zeros
+            FROM (SELECT {select}reg, MAX(rho) AS rho FROM {sketch} WHERE {where} GROUP BY ALL)
+            {f"GROUP BY {names}" if names else ""}
+        )
+        {f"ORDER BY {names}" if names else ""}
+    """
+
+
+def hll_count(con, sketch: str, by=(), where: str = "TRUE"):
+    """DataFrame of ``hll_count_sql``: estimated distinct counts per ``by`` group."""
+    return cached_query(con, hll_count_sql(sketch, by, where))
+
+
+def rolling_months_sql(sketch: str, months: int) -> str:
+    """SQL for ``sketch`` (any sketch with CLAIM_FROM_MONTH) with each month's rows repeated
+    into the ``months``-month windows ending at it, relabelled with the window's last month.
+
+    Reading it per CLAIM_FROM_MONTH merges trailing windows, e.g. 12-month rolling
+    distinct counts from monthly HyperLogLog sketches.
+    """
+    return f"""
+        SELECT s.* REPLACE (w.CLAIM_FROM_MONTH AS CLAIM_FROM_MONTH)
+        FROM {sketch} s JOIN (SELECT DISTINCT CLAIM_FROM_MONTH FROM {sketch}) w
+          ON s.CLAIM_FROM_MONTH > w.CLAIM_FROM_MONTH - INTERVAL {int(months)} MONTH
+         AND s.CLAIM_FROM_MONTH <= w.CLAIM_FROM_MONTH
+    """
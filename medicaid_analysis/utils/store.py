@@ -0,0 +1,186 @@
+"""
+Medicaid Analysis — Persistent DuckDB Store
+
+One on-disk database per dataset holding a ``claims`` base table plus a catalog
+of derived tables and the source fingerprint each was built from. Months appended
+later (``utils.append``) are recorded in ``_appends`` and folded into that
+fingerprint, so the store stays current for its CSV plus the appended files.
+"""
+
+import hashlib
+import time
+from datetime import datetime
+from pathlib import Path
+
+import duckdb
+
+from .config import log, CACHE_DIR
+from .db import limit
+from .ingest import fingerprint, ingest, fact_relation
+from .keys import NPI_DIM, HCPCS_DIM, KEY_COLUMNS, npi_dim_sql, hcpcs_dim_sql, encode_sql
+from .schema import read_csv_sql, schema_errors
+
+CLAIMS_TABLE = "claims"
+KEYED_TABLE  = f"{CLAIMS_TABLE}_keyed"
+BASE_TABLES  = [CLAIMS_TABLE, NPI_DIM, HCPCS_DIM, KEYED_TABLE]
+LOCK_TIMEOUT = 600         # seconds to wait for another process holding the write lock
+
+_CATALOG_DDL = """
+    CREATE TABLE IF NOT EXISTS _catalog (
+        name        VARCHAR PRIMARY KEY,
+        fingerprint VARCHAR,
+        built_at    TIMESTAMP,
+        rows        BIGINT
+    )
+"""
+
+_APPENDS_DDL = """
+    CREATE TABLE IF NOT EXISTS _appends (
+        seq         INTEGER,
+        source      VARCHAR,
+        fingerprint VARCHAR,
+        months      DATE[],
+        rows        BIGINT,
+        appended_at TIMESTAMP
+    )
+"""
+
+
+def store_path(csv, store_dir=None) -> Path:
+    """Location of the DuckDB database for a dataset."""
+    return Path(store_dir or CACHE_DIR) / f"{Path(csv).stem}.duckdb"
+
+
+def catalog_fingerprint(con, name: str):
+    """Fingerprint a catalogued table was built from, or None if it is missing."""
+    try:
+        row = con.execute("SELECT fingerprint FROM _catalog WHERE name = ?", [name]).fetchone()
+    except duckdb.CatalogException:
+        return None
+    return row[0] if row else None
+
+
+def chain_fingerprint(fp: str, appended: str) -> str:
+    """Fingerprint of data ``fp`` after appending a file with fingerprint ``appended``."""
+    return hashlib.sha256(f"{fp}+{appended}".encode()).hexdigest()[:16]
+
+
+def appended_fingerprint(con, fp: str) -> str:
+    """``fp`` (the CSV's fingerprint) chained with the files appended to the store since."""
+    try:
+        rows = con.execute("SELECT fingerprint FROM _appends ORDER BY seq").fetchall()
+    except duckdb.CatalogException:
+        return fp
+    for (appended,) in rows:
+        fp = chain_fingerprint(fp, appended)
+    return fp
+
+
+def record_append(con, source, months, rows: int):
+    """Note in ``_appends`` that ``rows`` rows of ``months`` were appended from the file ``source``."""
+    con.execute(_APPENDS_DDL)
+    con.execute("INSERT INTO _appends SELECT COALESCE(MAX(seq), 0) + 1, ?, ?, ?, ?, ? FROM _appends",
+                [str(source), fingerprint(source), list(months), rows, datetime.now()])
+
+
+def materialize(con, name: str, sql: str, fp: str = None) -> bool:
+    """Build ``name`` from ``sql`` unless the catalog says it is already current.
+
+    ``fp`` defaults to the fingerprint of the claims table, so derived tables are
+    rebuilt whenever the underlying data changes. Returns True if a build happened.
+    """
+    fp = fp or catalog_fingerprint(con, CLAIMS_TABLE)
+    if fp is not None and catalog_fingerprint(con, name) == fp:
+        return False
+    t0 = time.time()
+    con.execute(f"CREATE OR REPLACE TABLE {name} AS {sql}")
+    rows = con.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+    con.execute("INSERT OR REPLACE INTO _catalog VALUES (?, ?, ?, ?)",
+                [name, fp, datetime.now(), rows])
+    log.info("  Materialized %s (%s rows) in %.1fs", name, f"{rows:,}", time.time() - t0)
+    return True
+
+
+def _connect_writer(path: Path) -> duckdb.DuckDBPyConnection:
+    """Open the database read-write, waiting while another process holds it."""
+    deadline = time.time() + LOCK_TIMEOUT
+    while True:
+        try:
+            return limit(duckdb.connect(str(path)))
+        except duckdb.IOException:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.5)
+
+
+def _is_current(con, fp: str) -> bool:
+    """Whether every base table was built from the CSV with fingerprint ``fp`` and the declared schema."""
+    return (all(catalog_fingerprint(con, name) == fp for name in BASE_TABLES)
+            and not schema_errors(con, CLAIMS_TABLE))
+
+
+def _load_claims(con, csv: Path, fp: str, use_cache: bool, cache_dir: Path):
+    """(Re)load the claims base table and its keyed fact and dimensions."""
+    con.execute(_CATALOG_DDL)
+    current = appended_fingerprint(con, fp)
+    if _is_current(con, current):
+        return
+    outdated = catalog_fingerprint(con, CLAIMS_TABLE) is not None and bool(schema_errors(con, CLAIMS_TABLE))
+    if catalog_fingerprint(con, CLAIMS_TABLE) == current and not outdated:
+        fp = current   # only derived base tables are missing; keep the appended months
+    elif current != fp:
+        log.warning("Source changed: months appended to the old data are dropped")
+        con.execute("DROP TABLE _appends")
+    stale = [r[0] for r in con.execute(
+        "SELECT name FROM _catalog WHERE fingerprint <> ? OR ?", [fp, outdated]).fetchall()]
+    for name in stale:
+        con.execute(f"DROP TABLE IF EXISTS {name}")
+        con.execute("DELETE FROM _catalog WHERE name = ?", [name])
+    if catalog_fingerprint(con, CLAIMS_TABLE) != fp:
+        src = ingest(csv, cache_dir=cache_dir, con=con) if use_cache else csv
+        if src.is_dir():
+            # Partitions are read one directory at a time, so the table's row groups
+            # stay clustered by month and month filters skip most of them.
+            relation = f"(SELECT * EXCLUDE ({', '.join(KEY_COLUMNS)}) FROM {fact_relation(src, hive=False)})"
+        elif src.suffix == ".parquet":
+            relation = f"read_parquet('{src}')"
+        else:
+            relation = read_csv_sql(src)
+        log.info("Loading %s into %s", src.name, CLAIMS_TABLE)
+        materialize(con, CLAIMS_TABLE, f"SELECT * FROM {relation}", fp)
+    materialize(con, NPI_DIM, npi_dim_sql(CLAIMS_TABLE), fp)
+    materialize(con, HCPCS_DIM, hcpcs_dim_sql(CLAIMS_TABLE), fp)
+    materialize(con, KEYED_TABLE, encode_sql(CLAIMS_TABLE), fp)
+
+
+def open_store(csv, path=None, read_only=False, use_cache=True) -> duckdb.DuckDBPyConnection:
+    """Open the persistent database for a dataset, loading ``claims`` if needed.
+
+    The base table is loaded once per CSV fingerprint; a changed CSV reloads it and
+    drops derived tables built from the old data (and any months appended to it). With ``read_only=True`` the
+    database is opened in shared read-only mode, so several processes can query it
+    at once; it is only opened for writing (briefly) when it has to be rebuilt.
+    """
+    csv = Path(csv)
+    path = Path(path) if path else store_path(csv)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fp = fingerprint(csv)
+
+    if read_only and path.exists():
+        con = limit(duckdb.connect(str(path), read_only=True))
+        if _is_current(con, appended_fingerprint(con, fp)):
+            log.info("Attached %s (read-only)", path.name)
+            return con
+        con.close()
+
+    con = _connect_writer(path)
+    try:
+        _load_claims(con, csv, fp, use_cache, path.parent)
+    except Exception:
+        con.close()
+        raise
+    if not read_only:
+        log.info("Opened %s", path.name)
+        return con
+    con.close()
+    return open_store(csv, path, read_only=True, use_cache=use_cache)
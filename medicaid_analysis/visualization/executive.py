@@ -2,12 +2,15 @@
 
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 import matplotlib.ticker as mticker
-from utils import log, banner, query, savefig, usd, usd_fmt, num_fmt, OUTPUT_DIR
+from utils import (
+    log, banner, query, monthly_summary, uses, MONTHLY_SUMMARY, savefig, figure, usd,
+    usd_fmt, num_fmt, OUTPUT_DIR,
+)
 
 
+@uses(MONTHLY_SUMMARY)
 def s32_executive_summary(con, csv: str, eda: dict, yoy_totals: pd.DataFrame):
     """Executive summary dashboard — key KPIs and sparklines."""
     banner(32, "Executive Summary Dashboard")
@@ -27,12 +30,11 @@ def s32_executive_summary(con, csv: str, eda: dict, yoy_totals: pd.DataFrame):
     }
 
     monthly = query(con, f"""
-        SELECT CLAIM_FROM_MONTH, SUM(TOTAL_PAID) AS total_paid, SUM(TOTAL_CLAIMS) AS total_claims
-        FROM '{csv}' GROUP BY CLAIM_FROM_MONTH ORDER BY CLAIM_FROM_MONTH
+        SELECT CLAIM_FROM_MONTH, total_paid, total_claims
+        FROM {monthly_summary(con, csv)} ORDER BY CLAIM_FROM_MONTH
     """)
-    monthly["CLAIM_FROM_MONTH"] = pd.to_datetime(monthly["CLAIM_FROM_MONTH"])
 
-    fig = plt.figure(figsize=(20, 16))
+    fig = figure(figsize=(20, 16))
     fig.suptitle("Medicaid Provider Spending — Executive Summary",
                  fontsize=20, fontweight="bold", y=0.98, color="#1a1a2e")
     gs = fig.add_gridspec(3, 3, hspace=0.35, wspace=0.3, top=0.92, bottom=0.05)
@@ -64,13 +66,13 @@ def s32_executive_summary(con, csv: str, eda: dict, yoy_totals: pd.DataFrame):
     ax.set_title("YoY Growth %", fontsize=13, fontweight="bold"); ax.set_ylabel("% Change")
 
     ax = fig.add_subplot(gs[2, 0])
-    paid_vals = query(con, f"SELECT TOTAL_PAID FROM '{csv}' WHERE TOTAL_PAID > 0 USING SAMPLE 50000")
+    paid_vals = query(con, f"SELECT TOTAL_PAID FROM {csv} WHERE TOTAL_PAID > 0 USING SAMPLE 50000")
     ax.hist(np.log10(paid_vals["TOTAL_PAID"]), bins=60, color="#9334e6", edgecolor="white", alpha=0.85)
     ax.set_title("Spending Distribution (log₁₀)", fontsize=13, fontweight="bold"); ax.set_xlabel("log₁₀(Paid)"); ax.set_ylabel("Frequency")
 
     ax = fig.add_subplot(gs[2, 1])
     top5_procs = query(con, f"""
-        SELECT HCPCS_CODE, SUM(TOTAL_PAID) AS total_paid FROM '{csv}'
+        SELECT HCPCS_CODE, SUM(TOTAL_PAID) AS total_paid FROM {csv}
         GROUP BY HCPCS_CODE ORDER BY total_paid DESC LIMIT 5
     """)
     ax.barh(top5_procs["HCPCS_CODE"].iloc[::-1], top5_procs["total_paid"].iloc[::-1], color="#1a73e8", edgecolor="white")
@@ -78,7 +80,7 @@ def s32_executive_summary(con, csv: str, eda: dict, yoy_totals: pd.DataFrame):
 
     ax = fig.add_subplot(gs[2, 2])
     prov_spend = query(con, f"""
-        SELECT SUM(TOTAL_PAID) AS total_paid FROM '{csv}'
+        SELECT SUM(TOTAL_PAID) AS total_paid FROM {csv}
         GROUP BY BILLING_PROVIDER_NPI_NUM ORDER BY total_paid
     """)["total_paid"].values
     cum_pct = np.cumsum(prov_spend) / prov_spend.sum()
@@ -1,23 +1,26 @@
 """Visualization — Outlier Profiles (Section 28)."""
 
 import pandas as pd
-import matplotlib.pyplot as plt
-from utils import log, banner, query, savefig, usd, OUTPUT_DIR
+from utils import (
+    log, banner, query, provider_summary, uses, PROVIDER_SUMMARY, savefig, subplots, usd,
+    OUTPUT_DIR,
+)
 
 
-def s28_outlier_profiles(con, csv: str, cost_df: pd.DataFrame):
+@uses(PROVIDER_SUMMARY)
+def s28_outlier_profiles(con, csv: str):
     """Multi-dimensional outlier profiling — extreme records across multiple axes."""
     banner(28, "Outlier Deep-Dive Profiling")
 
     provider_stats = query(con, f"""
         SELECT BILLING_PROVIDER_NPI_NUM,
-               SUM(TOTAL_PAID) AS total_paid, SUM(TOTAL_CLAIMS) AS total_claims,
-               SUM(TOTAL_UNIQUE_BENEFICIARIES) AS total_bene,
-               COUNT(DISTINCT HCPCS_CODE) AS num_codes,
-               COUNT(DISTINCT CLAIM_FROM_MONTH) AS active_months,
-               AVG(TOTAL_PAID / NULLIF(TOTAL_CLAIMS, 0)) AS avg_cost_per_claim,
-               MAX(TOTAL_PAID) AS max_single_record
-        FROM '{csv}' WHERE TOTAL_CLAIMS > 0 GROUP BY BILLING_PROVIDER_NPI_NUM
+               total_paid_claimed AS total_paid, total_claims_claimed AS total_claims,
+               total_bene_claimed AS total_bene,
+               n_codes_claimed AS num_codes,
+               active_months_claimed AS active_months,
+               avg_cpc AS avg_cost_per_claim,
+               max_paid_claimed AS max_single_record
+        FROM {provider_summary(con, csv)} WHERE rows_claimed > 0
     """)
 
     outlier_flags = pd.DataFrame()
@@ -32,7 +35,7 @@ def s28_outlier_profiles(con, csv: str, cost_df: pd.DataFrame):
     log.info("  Multi-dimensional outliers (≥2 axes): %d", len(multi_outliers))
     log.info("  Max outlier dimensions: %d", multi_outliers["outlier_count"].max() if len(multi_outliers) > 0 else 0)
 
-    fig, axes = plt.subplots(1, 3, figsize=(20, 7))
+    fig, axes = subplots(1, 3, figsize=(20, 7))
     ax = axes[0]
     dim_counts = outlier_flags["outlier_count"].value_counts().sort_index()
     ax.bar(dim_counts.index.astype(str), dim_counts.values, color="#ea4335", edgecolor="white")
@@ -61,5 +64,5 @@ def s28_outlier_profiles(con, csv: str, cost_df: pd.DataFrame):
         ax.set_title("Multi-Dim Outliers: Cost/Claim vs Paid", fontsize=13, fontweight="bold")
         ax.set_xlabel("Avg Cost per Claim (USD)"); ax.set_ylabel("Total Paid"); usd(ax)
     fig.suptitle("Multi-Dimensional Outlier Profiling", fontsize=15, fontweight="bold", y=1.02)
-    fig.tight_layout(); savefig(fig, "28_outlier_profiles.png")
+    savefig(fig, "28_outlier_profiles.png", tight_layout=True)
     return multi_outliers